@@ -0,0 +1,123 @@
+"""
+Per-request overhead of the chat agent: a fresh agent and model client per
+request against a pooled agent on the shared HTTP client.
+
+OpenAI is served by a local fake that answers immediately, so the timings are
+the agent's own overhead plus connection setup. Run from the backend directory:
+
+    python -m benchmarks.bench_agent_pool
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OPENAI_PORT = 5057
+REQUESTS = int(os.getenv('BENCH_REQUESTS', '200'))
+PROMPT = "Context about the user's AWS resources and costs:\n- EC2: 12\n\nUser question: how many instances?"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client that reuses its connection is seen doing so
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle plus delayed
+    # ACKs stall every response on a reused connection by ~40 ms
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with FakeOpenAIHandler.lock:
+            FakeOpenAIHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'fake',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'There are 12 instances.'},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def configure_environment():
+    os.environ.update({
+        'OPENAI_API_KEY': 'testing',
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{OPENAI_PORT}/v1',
+        'DATABASE_URL': os.getenv('BENCH_DATABASE_URL', 'sqlite://'),
+    })
+
+
+def measure(label, run):
+    before = FakeOpenAIHandler.connections
+    run()  # warm-up, so both sides start with imports and first-use setup done
+    samples = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    connections = FakeOpenAIHandler.connections - before
+    print(f"{label:<32} mean {statistics.mean(samples) * 1000:6.2f} ms   "
+          f"p50 {statistics.median(samples) * 1000:6.2f} ms   "
+          f"new connections {connections:4d}")
+    return statistics.mean(samples)
+
+
+def main():
+    configure_environment()
+    server = ThreadingHTTPServer(('127.0.0.1', OPENAI_PORT), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from agno.agent import Agent
+    from agno.models.openai import OpenAIChat
+
+    from routers.agent import _build_chat_agent
+    from services.agent_pool import AgentPool
+    from services.agent_tools import registry
+
+    description = _build_chat_agent().description
+
+    def per_request():
+        # What every chat request used to do
+        agent = Agent(
+            model=OpenAIChat(id="gpt-4o-mini", api_key=os.getenv("OPENAI_API_KEY")),
+            description=description,
+            markdown=True,
+            tools=registry.tools,
+            show_tool_calls=False,
+        )
+        agent.run(PROMPT)
+
+    pool = AgentPool("bench", _build_chat_agent, size=1)
+
+    def pooled():
+        with pool.agent() as agent:
+            agent.run(PROMPT)
+
+    print(f"{REQUESTS} sequential chat requests against a zero-latency fake model API")
+    fresh = measure("fresh agent and client", per_request)
+    reused = measure("pooled agent, shared client", pooled)
+    print(f"overhead removed per request: {(fresh - reused) * 1000:.2f} ms ({fresh / reused:.1f}x)")
+    print(f"pool: {pool.stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
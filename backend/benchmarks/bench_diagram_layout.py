@@ -0,0 +1,57 @@
+"""
+Time the local diagram layout on synthetic inventories.
+
+Run from the backend directory:
+    python -m benchmarks.bench_diagram_layout
+"""
+import time
+
+from services.diagram_layout import DEFAULT_LINKS, build_graph, layout
+
+SIZES = [100, 1_000, 5_000, 20_000]
+APPLICATIONS = 50
+
+
+def synthetic_inventory(size, applications=APPLICATIONS):
+    """Instances, functions, queues, databases and buckets spread over tagged applications."""
+    kinds = [
+        ('arn:aws:ec2:us-east-1:123456789012:instance/i-{:017x}', 5),
+        ('arn:aws:lambda:us-east-1:123456789012:function:fn-{}', 2),
+        ('arn:aws:sqs:us-east-1:123456789012:queue-{}', 1),
+        ('arn:aws:rds:us-east-1:123456789012:db:db-{}', 1),
+        ('arn:aws:s3:::bucket-{}', 1),
+    ]
+    weights = sum(weight for _, weight in kinds)
+    resources = []
+    for i in range(size):
+        slot = i % weights
+        for arn, weight in kinds:
+            if slot < weight:
+                break
+            slot -= weight
+        tags = [{'Key': 'app', 'Value': f"app-{i // weights % applications}"}] if i % 4 else []
+        resources.append((arn.format(i), None, tags))
+    return resources
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'resources':>10} {'apps':>5} {'granularity':>12} {'nodes':>7} {'edges':>7} {'graph ms':>9} "
+          f"{'layout ms':>10}")
+    # One application holding everything puts thousands of nodes of each type in a single group
+    for size, applications in [(size, APPLICATIONS) for size in SIZES] + [(size, 1) for size in SIZES[-2:]]:
+        resources = synthetic_inventory(size, applications)
+        for granularity in ('service', 'resource'):
+            (nodes, edges), graph_time = timed(build_graph, resources, granularity, DEFAULT_LINKS)
+            _, layout_time = timed(layout, nodes, edges)
+            print(f"{size:>10} {applications:>5} {granularity:>12} {len(nodes):>7} {len(edges):>7} "
+                  f"{graph_time * 1000:>9.1f} {layout_time * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare the legacy list-scan merge in get_resources_by_tag with InventoryIndex.
+
+Run from the backend directory:
+    python -m benchmarks.bench_inventory_index
+"""
+import time
+
+from services.inventory_index import InventoryIndex
+
+SIZES = [1_000, 10_000, 100_000]
+# The quadratic merge takes minutes at 100k, so it is only timed up to this size
+LEGACY_LIMIT = 10_000
+
+
+def synthetic_inventory(size):
+    """Half of the instances come from the tagging API, all of them again from describe_instances."""
+    tagged, described = [], []
+    for i in range(size):
+        instance_id = f"i-{i:017x}"
+        item = {
+            'arn': f"arn:aws:ec2:us-east-1:123456789012:instance/{instance_id}",
+            'tags': [{'Key': 'env', 'Value': 'prod' if i % 3 else 'dev'}],
+            'name': instance_id,
+        }
+        if i % 2:
+            tagged.append(dict(item))
+        described.append(item)
+    return tagged, described
+
+
+def legacy_merge(tagged, described):
+    resources = list(tagged)
+    for item in described:
+        if not any(r['arn'].endswith(item['name']) for r in resources):
+            resources.append(item)
+    return resources
+
+
+def indexed_merge(tagged, described):
+    index = InventoryIndex()
+    for item in tagged:
+        index.add('ec2', item)
+    for item in described:
+        index.add('ec2', item)
+    return index.by_type('ec2')
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    print(f"{'resources':>10} {'legacy (s)':>12} {'indexed (s)':>12} {'lookup (us)':>12}")
+    for size in SIZES:
+        tagged, described = synthetic_inventory(size)
+
+        legacy = '-'
+        if size <= LEGACY_LIMIT:
+            elapsed, merged = timed(legacy_merge, tagged, described)
+            assert len(merged) == size
+            legacy = f"{elapsed:.3f}"
+
+        elapsed, merged = timed(indexed_merge, tagged, described)
+        assert len(merged) == size
+
+        index = InventoryIndex.from_resources({'ec2': merged})
+        probes = [item['arn'] for item in described[::max(1, size // 1000)]]
+        start = time.perf_counter()
+        for arn in probes:
+            assert arn in index
+        lookup_us = (time.perf_counter() - start) / len(probes) * 1e6
+
+        print(f"{size:>10} {legacy:>12} {elapsed:>12.3f} {lookup_us:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
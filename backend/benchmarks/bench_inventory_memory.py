@@ -0,0 +1,83 @@
+"""
+Compare peak memory of the materialized inventory refresh with the streamed one.
+
+Each run happens in a fresh subprocess against a temporary SQLite database, so
+ru_maxrss is that run's own high-water mark:
+
+- materialized: build the whole ``resources_by_type`` dict, then ``write_snapshot``
+- streamed: feed pages straight into ``write_snapshot_stream``
+
+Run from the backend directory:
+    python -m benchmarks.bench_inventory_memory
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = [10_000, 200_000]
+PAGE_SIZE = 100
+
+
+def synthetic_pages(size):
+    """Pages the way iter_resources yields them: tagging pages, then describe pages for half the instances."""
+    def item(i, described):
+        instance_id = f"i-{i:017x}"
+        data = {
+            'arn': f"arn:aws:ec2:us-east-1:123456789012:instance/{instance_id}",
+            'tags': [{'Key': 'env', 'Value': 'prod' if i % 3 else 'dev'}, {'Key': 'team', 'Value': f"team-{i % 40}"}],
+            'name': instance_id,
+        }
+        if described:
+            data.update(state='running', instance_type='m5.large', launch_time='2024-01-01T00:00:00+00:00')
+        return data
+
+    for start in range(0, size, PAGE_SIZE):
+        yield [('ec2', item(i, False)) for i in range(start, min(start + PAGE_SIZE, size))]
+    for start in range(0, size // 2, PAGE_SIZE):
+        yield [('ec2', item(i, True)) for i in range(start, min(start + PAGE_SIZE, size // 2))]
+
+
+def run_once(mode, size):
+    from database import SessionLocal
+    from services.inventory_index import InventoryIndex
+    from services.inventory_store import write_snapshot, write_snapshot_stream
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    if mode == 'materialized':
+        index = InventoryIndex()
+        for page in synthetic_pages(size):
+            for resource_type, item in page:
+                index.add(resource_type, item)
+        stats = write_snapshot(db, index.to_dict())
+    else:
+        stats = write_snapshot_stream(db, (resource for page in synthetic_pages(size) for resource in page))
+    elapsed = time.perf_counter() - started
+    db.close()
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    print(f"{mode:>12} {size:>8} {peak_mb:>10.1f} MB {elapsed:>8.1f}s  {stats}")
+
+
+def main():
+    print(f"{'mode':>12} {'size':>8} {'peak RSS':>13} {'time':>9}")
+    for size in SIZES:
+        for mode in ('materialized', 'streamed'):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'inventory.db')}")
+                subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_inventory_memory', mode, str(size)],
+                    env=env, check=True
+                )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        run_once(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,140 @@
+"""
+Load test: latency of cheap endpoints while expensive ones are in flight.
+
+AWS is served by a moto server and OpenAI by a local fake that sleeps before
+answering, so the expensive calls are slow but free. Requires the dev-only
+packages ``moto[server]`` and ``uvicorn``. Run from the backend directory:
+
+    python -m benchmarks.load_test_async
+"""
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOTO_PORT = 5055
+OPENAI_PORT = 5056
+APP_PORT = 8055
+OPENAI_DELAY = float(os.getenv('FAKE_OPENAI_DELAY', '3'))
+EXPENSIVE_CALLS = 4
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(OPENAI_DELAY)
+        body = json.dumps({
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'fake',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'ok'},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def configure_environment():
+    os.environ.update({
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_REGION': 'us-east-1',
+        'AWS_ENDPOINT_URL': f'http://127.0.0.1:{MOTO_PORT}',
+        'OPENAI_API_KEY': 'testing',
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{OPENAI_PORT}/v1',
+        'DATABASE_URL': os.getenv('LOADTEST_DATABASE_URL', 'sqlite:///./loadtest.db'),
+    })
+
+
+def request(method, path, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(f'http://127.0.0.1:{APP_PORT}{path}', data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    configure_environment()
+
+    from moto.server import ThreadedMotoServer
+    import uvicorn
+
+    # moto's server logs every request it answers
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    moto_server = ThreadedMotoServer(port=MOTO_PORT)
+    moto_server.start()
+    openai_server = ThreadingHTTPServer(('127.0.0.1', OPENAI_PORT), FakeOpenAIHandler)
+    threading.Thread(target=openai_server.serve_forever, daemon=True).start()
+
+    from main import app
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=APP_PORT, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    expensive_payload = {'errors': [{
+        'checkName': 'Low Utilization Amazon EC2 Instances',
+        'category': 'cost_optimizing',
+        'resources': {'resourcesFlagged': 1},
+        'details': [],
+        'timestamp': 'now',
+    }]}
+
+    try:
+        with ThreadPoolExecutor(max_workers=EXPENSIVE_CALLS + 4) as pool:
+            started = time.perf_counter()
+            expensive = [
+                pool.submit(request, 'POST', '/api/analysis/analyze-with-chatgpt', expensive_payload)
+                for _ in range(EXPENSIVE_CALLS)
+            ]
+            time.sleep(0.2)
+
+            # Only sample while the expensive calls are still in flight
+            cheap = {'/': [], '/api/resources/ec2': [], '/api/tags/summary': [], '/api/diagrams/list/loadtest': []}
+            while not all(f.done() for f in expensive):
+                for path, samples in cheap.items():
+                    samples.append(request('GET', path))
+
+            expensive_latencies = [f.result() for f in expensive]
+            expensive_wall = time.perf_counter() - started
+
+        print(f"fake OpenAI delay: {OPENAI_DELAY:.1f}s, {EXPENSIVE_CALLS} concurrent analysis requests")
+        print(f"expensive: wall {expensive_wall:.2f}s "
+              f"(serialized would be ~{OPENAI_DELAY * EXPENSIVE_CALLS:.1f}s), "
+              f"max {max(expensive_latencies):.2f}s")
+        for path, samples in cheap.items():
+            print(f"{path:<28} n={len(samples):<4} p50={statistics.median(samples) * 1000:7.1f}ms "
+                  f"p99={percentile(samples, 99) * 1000:7.1f}ms")
+    finally:
+        server.should_exit = True
+        openai_server.shutdown()
+        moto_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, JSON, DateTime, Integer
+from sqlalchemy import create_engine, Column, String, JSON, DateTime, Integer, Float, Boolean, Index, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -9,7 +9,9 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Sessions are handed to worker threads (services/executor.py); SQLite needs to be told that's fine
+connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -22,8 +24,62 @@ class AWSResource(Base):
     resource_type = Column(String, index=True)
     tags = Column(JSON)
     data = Column(JSON)
+    content_hash = Column(String)
+    # Parsed from the ARN on write; S3 ARNs carry neither region nor account
+    service = Column(String)
+    region = Column(String)
+    account = Column(String)
     last_updated = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination within a resource type
+        Index("ix_aws_resources_type_id", "resource_type", "id"),
+    )
+
+# Normalized copy of AWSResource.tags, kept in sync by services/inventory_store.py,
+# so tag queries hit an index instead of scanning every resource's JSON
+class ResourceTag(Base):
+    __tablename__ = "resource_tags"
+
+    resource_id = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+    __table_args__ = (
+        Index("ix_resource_tags_key_value", "key", "value", "resource_id"),
+    )
+
+# Resource counts per dimension ("resource_type", "service", "region", "account"),
+# rebuilt whenever the inventory changes so callers never count AWSResource rows
+class InventorySummary(Base):
+    __tablename__ = "inventory_summary"
+
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    tagged = Column(Integer, default=0)
+
+# VPCs of one region grouped with their subnets, instances, ENIs, route tables,
+# gateways and security groups, plus the relationships between them
+# (see services/vpc_topology.py)
+class VpcTopology(Base):
+    __tablename__ = "vpc_topology"
+
+    region = Column(String, primary_key=True)
+    data = Column(JSON)
+    vpc_count = Column(Integer, default=0)
+    collected_at = Column(DateTime, default=datetime.utcnow)
+
+# Version and refresh time of a stored dataset (e.g. the inventory). The version only
+# moves when the content actually changed, so caches can key on it.
+class DatasetSnapshot(Base):
+    __tablename__ = "dataset_snapshots"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    stats = Column(JSON)
+
 # Add AWS Advisor model
 class AWSAdvisor(Base):
     __tablename__ = "aws_advisor"
@@ -40,10 +96,43 @@ class ArchitectureDiagram(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     user_id = Column(String, index=True)  # For future user authentication
+    # Base snapshot at base_version; later versions are JSON-Patch deltas in
+    # diagram_versions (services/diagram_store.py)
     diagram_data = Column(JSON)
+    base_version = Column(Integer, default=0)
+    version = Column(Integer, default=0)
+    # Set on every write so listings never load diagram_data
+    node_count = Column(Integer)
+    edge_count = Column(Integer)
+    size_bytes = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination of a user's diagrams, most recently updated first
+        Index("ix_architecture_diagrams_user_updated", "user_id", "updated_at", "id"),
+    )
+
+# One row per diagram version: the JSON-Patch from the previous version, and for
+# former bases kept for history, the full snapshot at that version
+class DiagramVersion(Base):
+    __tablename__ = "diagram_versions"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    diagram_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    patch = Column(JSON)
+    snapshot = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_diagram_versions_diagram_version", "diagram_id", "version", unique=True),
+    )
+
+# Trusted Advisor history (services/advisor_history.py): one row per check per change.
+# ``result`` is the check summary without its flagged resources; ``added`` holds the
+# flagged resources that appeared and ``removed`` the resourceIds that went away
+# since the previous row, unless ``baseline`` is set and ``added`` is the full list.
 class TrustedAdvisorCheck(Base):
     __tablename__ = "trusted_advisor_checks"
     
@@ -52,6 +141,79 @@ class TrustedAdvisorCheck(Base):
     category = Column(String, index=True)
     result = Column(JSON)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    check_id = Column(String)
+    status = Column(String)
+    flagged_count = Column(Integer, default=0)
+    estimated_savings = Column(Float)
+    baseline = Column(Boolean, default=False)
+    added = Column(JSON)
+    removed = Column(JSON)
+    # Last crawl that found the check in this state
+    last_seen = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_trusted_advisor_checks_check_time", "check_id", "timestamp"),
+    )
+
+# Current flagged resources of each Trusted Advisor check, kept in sync with the
+# history above so large checks can be paged and filtered instead of sent inline
+class FlaggedResource(Base):
+    __tablename__ = "flagged_resources"
+
+    check_id = Column(String, primary_key=True)
+    resource_id = Column(String, primary_key=True)
+    region = Column(String)
+    status = Column(String)
+    is_suppressed = Column(Boolean, default=False)
+    # "metadata" is reserved on declarative models
+    resource_metadata = Column("metadata", JSON)
+    content_hash = Column(String)
+    first_seen = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_flagged_resources_check_status", "check_id", "status", "resource_id"),
+        Index("ix_flagged_resources_check_region", "check_id", "region", "resource_id"),
+    )
+
+# Daily cost warehouse (moved from models/cost_model.py). Cost Explorer only groups
+# by two dimensions per query, so each row belongs to a "view" naming the pair it
+# was fetched with; the other dimension columns are NULL.
+class CostEntry(Base):
+    __tablename__ = "cost_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    view = Column(String, nullable=False)
+    service = Column(String)
+    cost = Column(Float)
+    unit = Column(String)
+    date = Column(DateTime)
+    region = Column(String)
+    account = Column(String)
+    usage_type = Column(String)
+    estimated = Column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_cost_entries_view_date", "view", "date"),
+    )
+
+class CostIngestState(Base):
+    __tablename__ = "cost_ingest_state"
+
+    view = Column(String, primary_key=True)
+    last_run = Column(DateTime)
+    # Contiguous range of days [covered_from, covered_to) the warehouse holds for the view
+    covered_from = Column(DateTime)
+    covered_to = Column(DateTime)
+
+# Persistent tier of the cost query cache (services/cost_cache.py)
+class CostQueryCacheEntry(Base):
+    __tablename__ = "cost_query_cache"
+
+    key = Column(String, primary_key=True)
+    request = Column(JSON)
+    response = Column(JSON)
+    expires_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 def get_db():
     db = SessionLocal()
@@ -60,5 +222,27 @@ def get_db():
     finally:
         db.close()
 
+def add_missing_columns():
+    """
+    Minimal forward migration: add columns and indexes that models gained after
+    their table was first created. create_all() only creates missing tables.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        if missing:
+            with engine.begin() as connection:
+                for column in missing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=engine)
+
 # Create tables
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+Base.metadata.create_all(bind=engine)
+add_missing_columns()
\ No newline at end of file
@@ -1,162 +1,144 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
-from services.aws_service import AWSService
+from services.aws_service import get_aws_service
+from services.snapshot_cache import SnapshotCache
+from services import advisor_history
 from database import get_db, AWSAdvisor
 from datetime import datetime, timedelta
 import json
 
 router = APIRouter()
-aws_service = AWSService()
+aws_service = get_aws_service()
 
-# Define cache expiration time (e.g., 1 day)
-CACHE_EXPIRATION = timedelta(days=1)
+def _filter_checks(advisor_data):
+    # Filter to keep only resources with warning or error status
+    filtered_data = {}
+    if isinstance(advisor_data, dict):
+        for category, checks in advisor_data.items():
+            if isinstance(checks, list):
+                filtered_checks = []
+                for check in checks:
+                    # Ensure we're dealing with a dictionary
+                    if not isinstance(check, dict):
+                        continue
+
+                    # Explicitly check for warning or error status
+                    status = check.get('status')
+                    if status and status.lower() in ['warning', 'error']:
+                        filtered_checks.append(check)
+
+                # Only add the category if it has any filtered checks
+                if filtered_checks:
+                    filtered_data[category] = filtered_checks
+
+    # Debug the filtered data
+    print(f"Total categories after filtering: {len(filtered_data)}")
+    for category, checks in filtered_data.items():
+        print(f"Category {category}: {len(checks)} checks")
+
+    return filtered_data
+
+# /details and /recommendations serve the same crawl, so they share one snapshot row
+SNAPSHOT_CHECK_TYPE = "details"
+
+def _read_snapshot(db: Session):
+    db_advisor = db.query(AWSAdvisor).filter(
+        AWSAdvisor.check_type == SNAPSHOT_CHECK_TYPE
+    ).first()
+    if db_advisor is None:
+        return None
+    return db_advisor.data, db_advisor.last_updated
+
+def _previous_details(db: Session, db_advisor):
+    # Every recorded check; the snapshot's copies of warning/error checks keep their preview
+    stored = {
+        check['id']: check for checks in (db_advisor.data if db_advisor else {}).values()
+        for check in checks if isinstance(check, dict) and 'id' in check
+    }
+    return {
+        category: [stored.get(check['id'], check) for check in checks]
+        for category, checks in advisor_history.previous_details(db).items()
+    }
+
+def _refresh_snapshot(db: Session):
+    db_advisor = db.query(AWSAdvisor).filter(
+        AWSAdvisor.check_type == SNAPSHOT_CHECK_TYPE
+    ).first()
+
+    # Fetch fresh data from AWS for every status, reusing unchanged checks; the crawl is
+    # recorded in full so checks that went back to ok leave the history's warnings
+    advisor_data = aws_service.get_trusted_advisor_details(
+        previous=_previous_details(db, db_advisor)
+    )
+
+    # Flagged resources go to their own table (served by /api/checks/{id}/flagged);
+    # the snapshot keeps a count and a short preview per check
+    advisor_history.record_crawl(db, [check for checks in advisor_data.values() for check in checks])
+    filtered_data = _filter_checks(advisor_data)
+    filtered_data = {
+        category: [advisor_history.compact(check) for check in checks]
+        for category, checks in filtered_data.items()
+    }
+
+    # Store the filtered data in the database
+    if db_advisor:
+        # Update existing record
+        db_advisor.data = filtered_data
+        db_advisor.last_updated = datetime.utcnow()
+    else:
+        # Create new record
+        db_advisor = AWSAdvisor(
+            id="advisor_details",
+            check_type=SNAPSHOT_CHECK_TYPE,
+            data=filtered_data,
+            last_updated=datetime.utcnow()
+        )
+        db.add(db_advisor)
+
+    # Drop the duplicate copy older versions stored for /recommendations
+    db.query(AWSAdvisor).filter(
+        AWSAdvisor.check_type != SNAPSHOT_CHECK_TYPE
+    ).delete(synchronize_session=False)
+
+    db.commit()
+    return filtered_data
+
+# Serve the stored snapshot right away and refresh it in the background once it is
+# older than the soft TTL (1 day); only a missing or very old snapshot is crawled inline
+advisor_cache = SnapshotCache(
+    "advisor",
+    read=_read_snapshot,
+    refresh=_refresh_snapshot,
+    soft_ttl=timedelta(days=1),
+    hard_ttl=timedelta(days=7)
+)
 
 @router.get("/details")
 async def get_advisor_details(db: Session = Depends(get_db)):
     try:
-        # Check if we have recent data in the database
-        db_advisor = db.query(AWSAdvisor).filter(
-            AWSAdvisor.check_type == "details"
-        ).first()
-        
-        # If we have recent data (less than CACHE_EXPIRATION old), return it
-        if db_advisor and (datetime.utcnow() - db_advisor.last_updated) < CACHE_EXPIRATION:
-            return {
-                "status": "success",
-                "data": db_advisor.data,
-                "source": "database"
-            }
-        
-        # Otherwise, fetch fresh data from AWS
-        advisor_data = aws_service.get_trusted_advisor_details()
-        
-        # Filter to keep only resources with warning or error status
-        filtered_data = {}
-        if isinstance(advisor_data, dict):
-            for category, checks in advisor_data.items():
-                if isinstance(checks, list):
-                    filtered_checks = []
-                    for check in checks:
-                        # Ensure we're dealing with a dictionary
-                        if not isinstance(check, dict):
-                            continue
-                            
-                        # Debug the check status
-                        print(f"Check status: {check.get('status')}")
-                        
-                        # Explicitly check for warning or error status
-                        status = check.get('status')
-                        if status and status.lower() in ['warning', 'error']:
-                            filtered_checks.append(check)
-                            print(f"Added check with status: {status}")
-                    
-                    # Only add the category if it has any filtered checks
-                    if filtered_checks:
-                        filtered_data[category] = filtered_checks
-                        print(f"Added category {category} with {len(filtered_checks)} checks")
-        
-        # Debug the filtered data
-        print(f"Total categories after filtering: {len(filtered_data)}")
-        for category, checks in filtered_data.items():
-            print(f"Category {category}: {len(checks)} checks")
-        
-        # Store the filtered data in the database
-        if db_advisor:
-            # Update existing record
-            db_advisor.data = filtered_data
-            db_advisor.last_updated = datetime.utcnow()
-        else:
-            # Create new record
-            db_advisor = AWSAdvisor(
-                id="advisor_details",
-                check_type="details",
-                data=filtered_data,
-                last_updated=datetime.utcnow()
-            )
-            db.add(db_advisor)
-        
-        db.commit()
-        
+        data, source, stale = await advisor_cache.get(db)
         return {
             "status": "success",
-            "data": filtered_data,
-            "source": "aws"
+            "data": data,
+            "source": source,
+            "stale": stale
         }
     except Exception as e:
+        db.rollback()
         print(f"Error in get_advisor_details: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/recommendations")
 async def get_recommendations(db: Session = Depends(get_db)):
     try:
-        # Check if we have recent data in the database
-        db_advisor = db.query(AWSAdvisor).filter(
-            AWSAdvisor.check_type == "recommendations"
-        ).first()
-        
-        # If we have recent data (less than CACHE_EXPIRATION old), return it
-        if db_advisor and (datetime.utcnow() - db_advisor.last_updated) < CACHE_EXPIRATION:
-            return {
-                "status": "success",
-                "data": db_advisor.data,
-                "source": "database"
-            }
-        
-        # Otherwise, fetch fresh data from AWS
-        recommendations = aws_service.get_trusted_advisor_details()
-        
-        # Filter to keep only resources with warning or error status
-        filtered_recommendations = {}
-        if isinstance(recommendations, dict):
-            for category, checks in recommendations.items():
-                if isinstance(checks, list):
-                    filtered_checks = []
-                    for check in checks:
-                        # Ensure we're dealing with a dictionary
-                        if not isinstance(check, dict):
-                            continue
-                            
-                        # Debug the check status
-                        print(f"Check status: {check.get('status')}")
-                        
-                        # Explicitly check for warning or error status
-                        status = check.get('status')
-                        if status and status.lower() in ['warning', 'error']:
-                            filtered_checks.append(check)
-                            print(f"Added check with status: {status}")
-                    
-                    # Only add the category if it has any filtered checks
-                    if filtered_checks:
-                        filtered_recommendations[category] = filtered_checks
-                        print(f"Added category {category} with {len(filtered_checks)} checks")
-        
-        # Debug the filtered data
-        print(f"Total categories after filtering: {len(filtered_recommendations)}")
-        for category, checks in filtered_recommendations.items():
-            print(f"Category {category}: {len(checks)} checks")
-        
-        # Store the filtered data in the database
-        if db_advisor:
-            # Update existing record
-            db_advisor.data = filtered_recommendations
-            db_advisor.last_updated = datetime.utcnow()
-        else:
-            # Create new record
-            db_advisor = AWSAdvisor(
-                id="advisor_recommendations",
-                check_type="recommendations",
-                data=filtered_recommendations,
-                last_updated=datetime.utcnow()
-            )
-            db.add(db_advisor)
-        
-        db.commit()
-        
+        data, source, stale = await advisor_cache.get(db)
         return {
             "status": "success",
-            "data": filtered_recommendations,
-            "source": "aws"
+            "data": data,
+            "source": source,
+            "stale": stale
         }
     except Exception as e:
+        db.rollback()
         print(f"Error in get_recommendations: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -5,6 +5,7 @@ from datetime import datetime
 import os
 from openai import OpenAI
 import logging
+from services.executor import run_blocking
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -39,7 +40,8 @@ async def analyze_with_chatgpt(request: ErrorAnalysisRequest):
             prompt += "---\n"
         prompt += "\nPlease provide:\n1. Summary of issues\n2. Priority recommendations\n3. Best practices to prevent these issues"
 
-        response = client.chat.completions.create(
+        response = await run_blocking(
+            'openai', client.chat.completions.create,
             model="gpt-4-turbo-preview",
             messages=[
                 {"role": "system", "content": "You are an AWS infrastructure expert analyzing Trusted Advisor check results."},
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
+from services.executor import run_blocking
 
 load_dotenv()
 router = APIRouter()
@@ -14,7 +15,8 @@ class QuestionRequest(BaseModel):
 @router.post("/ask")
 async def ask_question(request: QuestionRequest):
     try:
-        response = client.chat.completions.create(
+        response = await run_blocking(
+            'openai', client.chat.completions.create,
             model="gpt-3.5-turbo",  # Changed from gpt-4 to gpt-3.5-turbo
             messages=[
                 {"role": "system", "content": "You are an AWS cost optimization expert."},
@@ -1,42 +1,149 @@
-from fastapi import APIRouter, HTTPException
-import boto3
-from datetime import datetime
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from services.aws_service import get_aws_service
+from services.executor import run_blocking
+from services.snapshot_cache import SnapshotCache
+from services import advisor_history
+from database import get_db
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
 
 router = APIRouter()
+aws_service = get_aws_service()
+
+def _read_checks(db: Session):
+    rows = advisor_history.latest_rows(db)
+    if not rows:
+        return None
+
+    # Same shape the Support API crawl used to return, with flagged resources served
+    # separately by /{check_id}/flagged
+    results = []
+    for row in rows:
+        result = dict(row.result, flaggedResourcesCount=row.flagged_count)
+        results.append({
+            'id': row.check_id,
+            'name': row.name,
+            'category': row.category,
+            'result': result,
+            'timestamp': row.last_seen.isoformat()
+        })
+    return results, max(row.last_seen for row in rows)
+
+def _refresh_checks(db: Session):
+    # Only checks whose summary moved since the last crawl have their results fetched
+    details = aws_service.get_trusted_advisor_details(previous=advisor_history.previous_details(db))
+    checks = [check for category_checks in details.values() for check in category_checks]
+
+    stats = advisor_history.record_crawl(db, checks)
+    print(f"Trusted Advisor history: {stats}")
+
+    return _read_checks(db)[0]
+
+# Every crawl is recorded as a time series; requests are served from it and
+# re-crawl in the background once it is older than the soft TTL
+checks_cache = SnapshotCache(
+    "checks",
+    read=_read_checks,
+    refresh=_refresh_checks,
+    soft_ttl=timedelta(hours=6),
+    hard_ttl=timedelta(days=7)
+)
+
+def _with_flagged(db: Session, checks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        dict(check, result=dict(check['result'], flaggedResources=advisor_history.flagged_resources(db, check['id'])))
+        for check in checks
+    ]
 
 @router.get("/")
-async def get_checks():
+async def get_checks(refresh: bool = False, include_flagged: bool = False, db: Session = Depends(get_db)):
+    """Every check with its result summary; ``include_flagged`` inlines all flagged resources."""
     try:
-        # Initialize AWS Support client
-        support_client = boto3.client('support')
-        
-        # Get all available checks
-        checks_response = support_client.describe_trusted_advisor_checks(
-            language='en'
-        )
-        
-        # Get check results for each check
-        results = []
-        for check in checks_response['checks']:
-            try:
-                check_result = support_client.describe_trusted_advisor_check_result(
-                    checkId=check['id'],
-                    language='en'
-                )
-                
-                results.append({
-                    'id': check['id'],
-                    'name': check['name'],
-                    'category': check['category'],
-                    'result': check_result['result'],
-                    'timestamp': datetime.utcnow().isoformat()
-                })
-            except Exception as check_error:
-                print(f"Error fetching check {check['id']}: {str(check_error)}")
-                continue
-                
-        return results
+        data, source, stale = await checks_cache.get(db, force_refresh=refresh)
+        if include_flagged:
+            data = await run_blocking('db', _with_flagged, db, data)
+        return data
     except Exception as e:
+        db.rollback()
         print(f"Error fetching Trusted Advisor checks: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/latest")
+async def get_latest_checks(category: Optional[str] = None, db: Session = Depends(get_db)):
+    """Current state of every check, without flagged resources."""
+    try:
+        source, stale = await checks_cache.ensure_fresh(db)
+        return {
+            "status": "success",
+            "data": [advisor_history.state(row) for row in await run_blocking('db', advisor_history.latest_rows, db, category)],
+            "source": source,
+            "stale": stale
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_latest_checks: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/trend")
+async def get_checks_trend(
+    days: int = Query(30, ge=1, le=366),
+    check_id: Optional[str] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Daily flagged resources, savings and statuses for a check, a category, or all checks."""
+    try:
+        return {
+            "status": "success",
+            "data": await run_blocking('db', advisor_history.trend, db, days=days, check_id=check_id, category=category)
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_checks_trend: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{check_id}/history")
+async def get_check_history(
+    check_id: str,
+    since: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Recorded changes of one check, newest first."""
+    try:
+        return {
+            "status": "success",
+            "data": await run_blocking('db', advisor_history.history, db, check_id, since=since, limit=limit)
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_check_history: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{check_id}/flagged")
+async def get_flagged_resources(
+    check_id: str,
+    status: Optional[str] = None,
+    region: Optional[str] = None,
+    include_suppressed: bool = True,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """One page of a check's flagged resources; pass ``next_cursor`` back as ``after``."""
+    try:
+        resources, next_cursor, total = await run_blocking(
+            'db', advisor_history.flagged_page, db, check_id, status=status, region=region, include_suppressed=include_suppressed,
+            after=after, limit=limit
+        )
+        return {
+            "status": "success",
+            "data": resources,
+            "total": total,
+            "next_cursor": next_cursor
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_flagged_resources: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,18 +1,38 @@
-from fastapi import APIRouter, HTTPException
-from services.aws_service import AWSService
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from services.aws_service import get_aws_service
+from services.executor import run_blocking
+from services import cost_warehouse
+from services.cost_cache import cost_cache
+from database import get_db
 from datetime import datetime, timedelta
+from typing import List, Optional
 
 router = APIRouter()
-aws_service = AWSService()
+aws_service = get_aws_service()
 
 @router.get("/summary")
-async def get_cost_summary():
+async def get_cost_summary(db: Session = Depends(get_db)):
     try:
         end_date = datetime.now().strftime('%Y-%m-%d')
         start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
         
-        # Fetch fresh data from AWS
-        cost_data = aws_service.get_cost_and_usage(start_date, end_date)
+        # Keep the local warehouse topped up without making this request wait for it
+        if await run_blocking('db', cost_warehouse.ingest_due, db):
+            cost_warehouse.ingest_costs_in_background()
+        
+        # Serve from the local warehouse when it covers the window
+        cost_data = await run_blocking('db', cost_warehouse.get_cost_summary, db, start_date, end_date)
+        if cost_data is not None:
+            return {
+                "status": "success",
+                "data": cost_data,
+                "source": "database"
+            }
+        
+        # Fetch from AWS through the shared cost query cache
+        cost_data = await run_blocking('aws', cost_cache.get_cost_and_usage, start_date, end_date)
         
         return {
             "status": "success",
@@ -21,4 +41,53 @@ async def get_cost_summary():
         }
     except Exception as e:
         print(f"Error in get_cost_summary: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/query")
+async def query_costs(
+    start_date: str,
+    end_date: str,
+    group_by: List[str] = Query([]),
+    granularity: str = "DAILY",
+    filter: List[str] = Query([], description="DIMENSION=value, e.g. SERVICE=Amazon Simple Storage Service"),
+    db: Session = Depends(get_db)
+):
+    try:
+        filters = {}
+        for item in filter:
+            dimension, _, value = item.partition('=')
+            filters.setdefault(dimension, []).append(value)
+        
+        rows = await run_blocking(
+            'db', cost_warehouse.query_costs, db, start_date, end_date, group_by=group_by, granularity=granularity, filters=filters
+        )
+        return {
+            "status": "success",
+            "data": rows,
+            "source": "database"
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error in query_costs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats")
+async def get_cost_cache_stats():
+    return {
+        "status": "success",
+        "data": cost_cache.stats()
+    }
+
+@router.post("/ingest")
+async def ingest_costs(force: Optional[bool] = False):
+    # Joins an ingest already running in this worker rather than starting another
+    try:
+        written = await asyncio.wrap_future(cost_warehouse.start_ingest(force=force))
+        return {
+            "status": "success",
+            "data": written
+        }
+    except Exception as e:
+        print(f"Error in ingest_costs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,17 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import get_db, ArchitectureDiagram, AWSResource
+from database import get_db, ArchitectureDiagram, DiagramVersion
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional
 from datetime import datetime
 from agno import agent  # Import the agent for diagram generation
-from collections import Counter
 from agno.agent import Agent
-from agno.models.openai import OpenAIChat
 import os
 import json
 from dotenv import load_dotenv
-from agno.tools.python import PythonTools
+from services.executor import run_blocking
+from services.agent_pool import AgentPool, openai_model
+from services import diagram_layout, diagram_store, vpc_topology
+from services.diagram_store import diagram_stats
+import jsonpatch
+import jsonpointer
 
 router = APIRouter()
 
@@ -25,11 +30,73 @@ class DiagramResponse(BaseModel):
     name: str
     user_id: str
     diagram_data: Dict[str, Any]
+    version: int = 0
     created_at: datetime
     updated_at: datetime
 
+class DiagramPatchRequest(BaseModel):
+    # Version the patch was made against; see services/diagram_store.py
+    base_version: int
+    patch: List[Dict[str, Any]]
+
+class DiagramPatchResponse(BaseModel):
+    id: int
+    version: int
+    node_count: Optional[int]
+    edge_count: Optional[int]
+    size_bytes: Optional[int]
+    updated_at: datetime
+
+class DiagramSummary(BaseModel):
+    id: int
+    name: str
+    node_count: Optional[int]
+    edge_count: Optional[int]
+    size_bytes: Optional[int]
+    created_at: datetime
+    updated_at: datetime
+
+class DiagramListResponse(BaseModel):
+    items: List[DiagramSummary]
+    next_cursor: Optional[str]
+
+def set_diagram_stats(diagram: ArchitectureDiagram) -> None:
+    for column, value in diagram_stats(diagram.diagram_data).items():
+        setattr(diagram, column, value)
+
+def _diagram_response(db: Session, diagram: ArchitectureDiagram, data: Optional[Dict[str, Any]] = None):
+    # diagram_data on the row is the base snapshot; callers get the current version
+    return {
+        "id": diagram.id,
+        "name": diagram.name,
+        "user_id": diagram.user_id,
+        "diagram_data": data if data is not None else diagram_store.head(db, diagram),
+        "version": diagram.version or 0,
+        "created_at": diagram.created_at,
+        "updated_at": diagram.updated_at,
+    }
+
+def _get_or_404(db: Session, diagram_id: int) -> ArchitectureDiagram:
+    diagram = db.query(ArchitectureDiagram).filter(ArchitectureDiagram.id == diagram_id).first()
+    if not diagram:
+        raise HTTPException(status_code=404, detail="Diagram not found")
+    return diagram
+
+def _encode_cursor(diagram) -> str:
+    return f"{diagram.updated_at.isoformat()}_{diagram.id}"
+
+def _decode_cursor(cursor: str):
+    try:
+        updated_at, diagram_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(updated_at), int(diagram_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.post("/save", response_model=DiagramResponse)
 async def save_diagram(diagram: DiagramRequest, db: Session = Depends(get_db)):
+    return await run_blocking('db', _save_diagram, db, diagram)
+
+def _save_diagram(db: Session, diagram: DiagramRequest):
     try:
         # Check if a diagram with this name already exists for this user
         existing_diagram = db.query(ArchitectureDiagram).filter(
@@ -38,12 +105,12 @@ async def save_diagram(diagram: DiagramRequest, db: Session = Depends(get_db)):
         ).first()
         
         if existing_diagram:
-            # Update existing diagram
-            existing_diagram.diagram_data = diagram.diagram_data
+            # Store the change from the current version as a JSON-Patch
+            diagram_store.save(db, existing_diagram, diagram.diagram_data)
             existing_diagram.updated_at = datetime.utcnow()
             db.commit()
             db.refresh(existing_diagram)
-            return existing_diagram
+            return _diagram_response(db, existing_diagram, diagram.diagram_data)
         else:
             # Create new diagram
             new_diagram = ArchitectureDiagram(
@@ -51,6 +118,7 @@ async def save_diagram(diagram: DiagramRequest, db: Session = Depends(get_db)):
                 user_id=diagram.user_id,
                 diagram_data=diagram.diagram_data
             )
+            set_diagram_stats(new_diagram)
             db.add(new_diagram)
             db.commit()
             db.refresh(new_diagram)
@@ -59,34 +127,155 @@ async def save_diagram(diagram: DiagramRequest, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error saving diagram: {str(e)}")
 
-@router.get("/list/{user_id}", response_model=List[DiagramResponse])
-async def list_diagrams(user_id: str, db: Session = Depends(get_db)):
+# Columns a listing needs; diagram_data is only read by /{diagram_id}
+SUMMARY_COLUMNS = (
+    ArchitectureDiagram.id,
+    ArchitectureDiagram.name,
+    ArchitectureDiagram.node_count,
+    ArchitectureDiagram.edge_count,
+    ArchitectureDiagram.size_bytes,
+    ArchitectureDiagram.created_at,
+    ArchitectureDiagram.updated_at,
+)
+
+@router.get("/list/{user_id}", response_model=DiagramListResponse)
+async def list_diagrams(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """A user's diagrams without their data, most recently updated first; pass ``next_cursor`` back as ``cursor``."""
+    return await run_blocking('db', _list_diagrams, db, user_id, limit, cursor)
+
+def _list_diagrams(db: Session, user_id: str, limit: int, cursor: Optional[str]):
     try:
-        diagrams = db.query(ArchitectureDiagram).filter(
-            ArchitectureDiagram.user_id == user_id
-        ).all()
-        return diagrams
+        query = db.query(*SUMMARY_COLUMNS).filter(ArchitectureDiagram.user_id == user_id)
+        if cursor:
+            updated_at, diagram_id = _decode_cursor(cursor)
+            query = query.filter(
+                tuple_(ArchitectureDiagram.updated_at, ArchitectureDiagram.id) < tuple_(updated_at, diagram_id)
+            )
+        rows = query.order_by(
+            ArchitectureDiagram.updated_at.desc(), ArchitectureDiagram.id.desc()
+        ).limit(limit + 1).all()
+
+        # Diagrams saved before the stats columns existed get them once
+        missing = [row.id for row in rows if row.size_bytes is None]
+        if missing:
+            table = ArchitectureDiagram.__table__
+            for diagram_id, diagram_data in db.query(ArchitectureDiagram.id, ArchitectureDiagram.diagram_data).filter(
+                ArchitectureDiagram.id.in_(missing)
+            ):
+                # Keep updated_at (and so the listing order) as it was
+                db.execute(table.update().where(table.c.id == diagram_id).values(
+                    updated_at=table.c.updated_at, **diagram_stats(diagram_data)
+                ))
+            db.commit()
+            stats = {
+                row.id: row for row in db.query(*SUMMARY_COLUMNS).filter(ArchitectureDiagram.id.in_(missing))
+            }
+            rows = [stats.get(row.id, row) for row in rows]
+
+        return {
+            "items": [dict(row._mapping) for row in rows[:limit]],
+            "next_cursor": _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        }
+    except HTTPException:
+        raise
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Error listing diagrams: {str(e)}")
 
 @router.get("/{diagram_id}", response_model=DiagramResponse)
-async def get_diagram(diagram_id: int, db: Session = Depends(get_db)):
+async def get_diagram(
+    diagram_id: int,
+    request: Request,
+    response: Response,
+    version: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """The current diagram, or an earlier ``version``. Honours If-None-Match with the ETag of the current version."""
+    return await run_blocking('db', _get_diagram, db, diagram_id, request, response, version)
+
+def _get_diagram(db: Session, diagram_id: int, request: Request, response: Response, version: Optional[int]):
     try:
-        diagram = db.query(ArchitectureDiagram).filter(
-            ArchitectureDiagram.id == diagram_id
-        ).first()
-        
-        if not diagram:
-            raise HTTPException(status_code=404, detail="Diagram not found")
-            
-        return diagram
+        diagram = _get_or_404(db, diagram_id)
+
+        if version is not None and version != (diagram.version or 0):
+            try:
+                return _diagram_response(db, diagram, diagram_store.data_at(db, diagram, version))
+            except diagram_store.VersionNotFound as e:
+                raise HTTPException(status_code=404, detail=str(e))
+
+        tag = diagram_store.etag(diagram)
+        if tag in [value.strip() for value in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers={"ETag": tag})
+        response.headers["ETag"] = tag
+        return _diagram_response(db, diagram)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving diagram: {str(e)}")
 
+@router.patch("/{diagram_id}", response_model=DiagramPatchResponse)
+async def patch_diagram(diagram_id: int, request: DiagramPatchRequest, response: Response,
+                        db: Session = Depends(get_db)):
+    """
+    Apply a JSON-Patch (RFC 6902) made against ``base_version``. Responds 409 with
+    the current version if the diagram changed in between, 422 if the patch does not apply.
+    """
+    return await run_blocking('db', _patch_diagram, db, diagram_id, request, response)
+
+def _patch_diagram(db: Session, diagram_id: int, request: DiagramPatchRequest, response: Response):
+    try:
+        diagram = _get_or_404(db, diagram_id)
+        diagram_store.apply_patch(db, diagram, request.patch, request.base_version)
+        diagram.updated_at = datetime.utcnow()
+        db.commit()
+        db.refresh(diagram)
+
+        response.headers["ETag"] = diagram_store.etag(diagram)
+        return diagram
+    except HTTPException:
+        raise
+    except diagram_store.VersionConflict as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.current_version})
+    except IntegrityError:
+        # Another writer stored the same version number first
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": "Diagram was modified concurrently"})
+    except (jsonpatch.JsonPatchException, jsonpointer.JsonPointerException) as e:
+        db.rollback()
+        raise HTTPException(status_code=422, detail=f"Invalid patch: {str(e)}")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error patching diagram: {str(e)}")
+
+@router.get("/{diagram_id}/versions")
+async def list_diagram_versions(diagram_id: int, db: Session = Depends(get_db)):
+    """Kept versions of a diagram, newest first."""
+    return await run_blocking('db', _list_diagram_versions, db, diagram_id)
+
+def _list_diagram_versions(db: Session, diagram_id: int):
+    try:
+        diagram = _get_or_404(db, diagram_id)
+        return {
+            "id": diagram.id,
+            "version": diagram.version or 0,
+            "versions": diagram_store.versions(db, diagram)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing diagram versions: {str(e)}")
+
 @router.delete("/{diagram_id}")
 async def delete_diagram(diagram_id: int, db: Session = Depends(get_db)):
+    return await run_blocking('db', _delete_diagram, db, diagram_id)
+
+def _delete_diagram(db: Session, diagram_id: int):
     try:
         diagram = db.query(ArchitectureDiagram).filter(
             ArchitectureDiagram.id == diagram_id
@@ -95,6 +284,7 @@ async def delete_diagram(diagram_id: int, db: Session = Depends(get_db)):
         if not diagram:
             raise HTTPException(status_code=404, detail="Diagram not found")
             
+        db.query(DiagramVersion).filter(DiagramVersion.diagram_id == diagram.id).delete(synchronize_session=False)
         db.delete(diagram)
         db.commit()
         return {"status": "success", "message": "Diagram deleted successfully"}
@@ -106,46 +296,58 @@ async def delete_diagram(diagram_id: int, db: Session = Depends(get_db)):
 
 class GenerateDiagramRequest(BaseModel):
     user_id: Optional[str] = "anonymous"
+    # "service": one node per service type; "resource": one node per resource
+    granularity: Literal["service", "resource"] = "service"
+    # Ask the model which service types connect instead of using the built-in links
+    suggest_links: bool = False
+
+def _build_link_agent() -> Agent:
+    return Agent(
+        model=openai_model(),
+        description="You are an AI software architect. Given the AWS service types present in an account, infer which of them are likely connected in its architecture. Reply with only a JSON array of [source, target] pairs that use the given service types exactly as written, with no markdown and no extra text.",
+        markdown=False,
+        show_tool_calls=False,
+        # No run report to the agno API
+        telemetry=False
+    )
+
+link_agents = AgentPool("diagram_links", _build_link_agent)
+
+def _suggest_links(service_types: List[str]) -> List[List[str]]:
+    with link_agents.agent() as agent:
+        response = agent.run(f"Service types: {', '.join(service_types)}")
+    return json.loads(response.content)
+
+def _save_generated(db: Session, user_id: Optional[str], diagram_data: Dict[str, Any]) -> ArchitectureDiagram:
+    new_diagram = ArchitectureDiagram(
+        name="Generated Diagram"+ datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        user_id=user_id,
+        diagram_data=diagram_data
+    )
+    set_diagram_stats(new_diagram)
+    db.add(new_diagram)
+    db.commit()
+    db.refresh(new_diagram)
+    return new_diagram
 
 @router.post("/generate", response_model=DiagramResponse)
 async def generate_diagram(request: GenerateDiagramRequest, db: Session = Depends(get_db)):
+    """
+    Diagram of the current inventory, laid out locally (services/diagram_layout.py).
+    The model is only asked for connections when ``suggest_links`` is set.
+    """
     try:
-         # Get resources from database and count by type
-        db_resources = db.query(AWSResource).all()
-        resource_counts = Counter()
-        
-        for resource in db_resources:
-            resource_type = resource.resource_type
-            resource_counts[resource_type] += 1
-        
-        # Create simple context string with just resource types and counts
-        context = "AWS Resource Summary:\n"
-        context += "\n".join([f"- {res_type}: {count} resources" for res_type, count in resource_counts.items()])
-        
-        # Use the agent to generate a diagram based on the prompt
-        
-        agent = Agent(
-            model=OpenAIChat(id="gpt-4o-mini", api_key=os.getenv("OPENAI_API_KEY"),),
-            description="You are an AI software architect responsible for generating AWS architecture diagrams based on a provided list of resources. Your task is to analyze the given AWS resources, infer logical connections between them, and output the architecture in the exact JSON format provided below.Rules: Always use the provided resources to generate the architecture.Infer reasonable connections where applicable, but do not introduce services that are not in the input. Ensure the output strictly follows this JSON structure: {'nodes':[{'id':'EC2-1741291043012','type':'awsService','position':{'x':-82.49434798358902,'y':252.43995631315244},'data':{'label':'EC2','serviceType':'EC2'},'zIndex':999,'width':150,'height':92,'selected':false,'dragging':false,'positionAbsolute':{'x':-82.49434798358902,'y':252.43995631315244}},{'id':'RDS-1741291608483','type':'awsService','position':{'x':-278.95708108032454,'y':126.47258935332718},'data':{'label':'RDS','serviceType':'RDS'},'zIndex':999,'width':150,'height':92,'selected':false,'dragging':false,'positionAbsolute':{'x':-278.95708108032454,'y':126.47258935332718}}],'edges':[{'type':'straight','markerEnd':{'type':'arrowclosed'},'style':{'stroke':'#555'},'source':'RDS-1741291608483','sourceHandle':'bottom-source','target':'RDS-1741291608483','targetHandle':'bottom-target','animated':false,'id':'reactflow__edge-RDS-1741291608483bottom-source-RDS-1741291608483bottom-target'},{'type':'straight','markerEnd':{'type':'arrowclosed'},'style':{'stroke':'#555'},'source':'EC2-1741291043012','sourceHandle':'left-source','target':'RDS-1741291608483','targetHandle':'bottom-target','animated':false,'id':'reactflow__edge-EC2-1741291043012left-source-RDS-1741291608483bottom-target'}]}. Do not provide explanations, additional text, or formatting outside the JSON response. The response must be a valid JSON object with correct syntax, no markdown, and no extra text. Use service type from these types EC2, Lambda, ECS, EKS, Fargate, S3, EBS, EFS, RDS, DynamoDB, ElastiCache, Aurora, VPC, LoadBalancer, CloudFront, APIGateway, Route53, IAM, Cognito, WAF, SNS, SQS, EventBridge do not make anything lower case or upper case use as it is", 
-            markdown=True,
-            tools=[PythonTools()], 
-            show_tool_calls=False
-        )
-        
-        # Provide context and user query to the agent
-        full_prompt = f"Context about the user's AWS resources and costs:\n{context}\n\nUser question: Generate a json data for me based on the resources given"
-        response = agent.run(full_prompt)
-        # Save the generated diagram
-        new_diagram = ArchitectureDiagram(
-            name="Generated Diagram"+ datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-            user_id=request.user_id,
-            diagram_data=json.loads(response.content)
-        )
-        db.add(new_diagram)
-        db.commit()
-        db.refresh(new_diagram)
-        
-        return new_diagram
+        # VPC membership comes from the stored topology; never crawled inline here
+        topology = await run_blocking('db', vpc_topology.stored_topology, db)
+        if request.suggest_links:
+            diagram_data = await run_blocking(
+                'openai', diagram_layout.generate, db, request.granularity, suggest_links=_suggest_links,
+                topology=topology
+            )
+        else:
+            diagram_data = await run_blocking('db', diagram_layout.generate, db, request.granularity, topology=topology)
+
+        return await run_blocking('db', _save_generated, db, request.user_id, diagram_data)
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error generating diagram: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating diagram: {str(e)}")
@@ -5,6 +5,7 @@ import os
 from openai import OpenAI
 import json
 import logging
+from services.executor import run_blocking
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -20,7 +21,8 @@ async def structure_ppt(analysis_data: AnalysisData):
         client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
         logger.info("Structuring PPT from analysis data")
 
-        response = client.chat.completions.create(
+        response = await run_blocking(
+            'openai', client.chat.completions.create,
             model="gpt-4-turbo-preview",
             messages=[
                 {"role": "system", "content": """You are an expert presentation consultant specializing in creating executive-level business presentations. 
@@ -1,16 +1,60 @@
-from fastapi import APIRouter, HTTPException
-from services.aws_service import AWSService
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from services.aws_service import get_aws_service
+from services.executor import run_blocking
+from services.vpc_topology import topology_cache, vpc_summary, find_vpc
+from database import get_db
+from typing import Optional
 
 router = APIRouter()
-aws_service = AWSService()
+aws_service = get_aws_service()
 
 @router.get("/ec2")
 async def get_ec2_resources():
     try:
-        instances = aws_service.get_ec2_instances()
+        instances = await run_blocking('aws', aws_service.get_ec2_instances)
         return {
             "status": "success",
             "data": instances
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/vpcs")
+async def get_vpcs(region: Optional[str] = None, refresh: bool = False, db: Session = Depends(get_db)):
+    """Every VPC with counts of its subnets, instances, network interfaces and security groups."""
+    try:
+        topology, source, stale = await topology_cache.get(db, force_refresh=refresh)
+        return {
+            "status": "success",
+            "data": [vpc_summary(vpc) for vpc in topology['vpcs'] if not region or vpc['region'] == region],
+            "collected_at": topology['collected_at'],
+            "source": source,
+            "stale": stale
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_vpcs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/vpcs/{vpc_id}")
+async def get_vpc(vpc_id: str, db: Session = Depends(get_db)):
+    """One VPC with its members and the relationships among them."""
+    try:
+        topology, source, stale = await topology_cache.get(db)
+        vpc = find_vpc(topology, vpc_id)
+        if vpc is None:
+            raise HTTPException(status_code=404, detail="VPC not found")
+        return {
+            "status": "success",
+            "data": vpc,
+            "collected_at": topology['collected_at'],
+            "source": source,
+            "stale": stale
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_vpc: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
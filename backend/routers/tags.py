@@ -1,79 +1,241 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from services.aws_service import AWSService
-from database import get_db, AWSResource
+from services.aws_service import get_aws_service
+from services.executor import run_blocking
+from services.snapshot_cache import SnapshotCache
+from services.inventory_store import INVENTORY_SNAPSHOT, snapshot_state, write_snapshot_stream
+from services import tag_query
+from services.inventory_summary import get_inventory_summary
+from database import get_db, SessionLocal, AWSResource, ResourceTag
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import json
+import logging
 
 router = APIRouter()
-aws_service = AWSService()
+logger = logging.getLogger(__name__)
+aws_service = get_aws_service()
 
-# Define cache expiration time (e.g., 1 hour)
-CACHE_EXPIRATION = timedelta(hours=100000)
+# Rows fetched per round trip when reading the whole inventory
+READ_BATCH_SIZE = 1000
+# NDJSON lines per chunk written to the response
+STREAM_CHUNK_LINES = 200
+
+def _inventory_updated_at(db: Session) -> Optional[datetime]:
+    # When was the inventory last refreshed? Older databases only have row timestamps
+    state = snapshot_state(db, INVENTORY_SNAPSHOT)
+    if state is not None:
+        return state[1]
+    return db.query(func.max(AWSResource.last_updated)).scalar()
+
+def _read_inventory(db: Session):
+    updated_at = _inventory_updated_at(db)
+    if updated_at is None:
+        return None
+
+    # Group resources by resource_type for frontend compatibility
+    grouped_resources = {}
+    for resource_type, data in db.query(AWSResource.resource_type, AWSResource.data).yield_per(READ_BATCH_SIZE):
+        grouped_resources.setdefault(resource_type, []).append(data)
+
+    return grouped_resources, updated_at
+
+def _refresh_inventory(db: Session):
+    # Stream pages from AWS straight into batched writes; only what changed is written,
+    # atomically, and the full inventory is never held in memory during the crawl
+    stats = write_snapshot_stream(db, aws_service.iter_resources())
+    logger.debug("Inventory refresh: %s", stats)
+    # Nothing is read back here: background refreshes and ensure_fresh() don't need
+    # the data, and inventory_cache.get() reads it itself
+
+# Serve the stored inventory right away and re-crawl it in the background once it
+# is older than the soft TTL; only a missing or very old inventory is crawled inline
+inventory_cache = SnapshotCache(
+    "inventory",
+    read=_read_inventory,
+    refresh=_refresh_inventory,
+    soft_ttl=timedelta(hours=6),
+    hard_ttl=timedelta(days=7),
+    updated_at=_inventory_updated_at
+)
+
+def _inventory_page(db: Session, resource_type: Optional[str], after: Optional[str], limit: int):
+    # Keyset pagination: seek past the last id of the previous page instead of OFFSET
+    query = db.query(AWSResource.id, AWSResource.resource_type, AWSResource.data)
+    if resource_type:
+        query = query.filter(AWSResource.resource_type == resource_type)
+    if after:
+        query = query.filter(AWSResource.id > after)
+    rows = query.order_by(AWSResource.id).limit(limit + 1).all()
+
+    items = [dict(data, resource_type=row_type) for _, row_type, data in rows[:limit]]
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return items, next_cursor
+
+def _stream_inventory(resource_type: Optional[str]) -> Iterator[str]:
+    # The request's session is closed once the endpoint returns, so the stream
+    # reads through its own session and a server-side cursor
+    db = SessionLocal()
+    try:
+        query = db.query(AWSResource.resource_type, AWSResource.data)
+        if resource_type:
+            query = query.filter(AWSResource.resource_type == resource_type)
+        lines = []
+        for row_type, data in query.order_by(AWSResource.id).yield_per(READ_BATCH_SIZE):
+            lines.append(json.dumps(dict(data, resource_type=row_type), default=str) + "\n")
+            # Sync iterators are driven from a thread pool; send lines in chunks, not one by one
+            if len(lines) == STREAM_CHUNK_LINES:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+    finally:
+        db.close()
 
 @router.get("/resources")
-async def get_tagged_resources(db: Session = Depends(get_db)):
+async def get_tagged_resources(
+    resource_type: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    after: Optional[str] = None,
+    format: str = Query("json", regex="^(json|ndjson)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Without parameters, returns the whole inventory grouped by resource type.
+
+    - ``limit`` (and ``after``, the ``next_cursor`` of the previous page): one page
+      of resources ordered by id, optionally of a single ``resource_type``
+    - ``format=ndjson``: every resource as one JSON line, streamed as it is read
+    """
     try:
-        # Check if we have recent data in the database
-        latest_resource = db.query(AWSResource).order_by(AWSResource.last_updated.desc()).first()
-        
-        # If we have recent data (less than CACHE_EXPIRATION old), return it
-        if latest_resource and (datetime.utcnow() - latest_resource.last_updated) < CACHE_EXPIRATION:
-            # Get all resources from the database
-            db_resources = db.query(AWSResource).all()
-            
-            # Group resources by resource_type for frontend compatibility
-            grouped_resources = {}
-            for r in db_resources:
-                if r.resource_type not in grouped_resources:
-                    grouped_resources[r.resource_type] = []
-                
-                # Extract the data that matches frontend expectations
-                resource_data = r.data
-                grouped_resources[r.resource_type].append(resource_data)
-            
+        if format == "ndjson":
+            source, stale = await inventory_cache.ensure_fresh(db)
+            return StreamingResponse(
+                _stream_inventory(resource_type),
+                media_type="application/x-ndjson",
+                headers={"X-Inventory-Source": source, "X-Inventory-Stale": str(stale).lower()}
+            )
+
+        if limit is not None or after is not None or resource_type is not None:
+            source, stale = await inventory_cache.ensure_fresh(db)
+            items, next_cursor = await run_blocking('db', _inventory_page, db, resource_type, after, limit or 100)
             return {
                 "status": "success",
-                "data": grouped_resources,
-                "source": "database"
+                "data": items,
+                "next_cursor": next_cursor,
+                "source": source,
+                "stale": stale
             }
-        
-        # Otherwise, fetch fresh data from AWS
-        aws_resources = aws_service.get_resources_by_tag()
-        
-        # Clear existing resources and store new ones
-        db.query(AWSResource).delete()
-        db.commit()
-        
-        # Process and store resources by type
-        processed_resources = {}
-        
-        # Process the AWS response to match frontend expectations
-        for resource_type, items in aws_resources.items():
-            processed_resources[resource_type] = []
-            
-            for item in items:
-                # Store each resource in the database
-                resource_id = item.get('arn', f"unknown-{datetime.utcnow().timestamp()}")
-                
-                db_resource = AWSResource(
-                    id=resource_id,
-                    resource_type=resource_type,
-                    tags=item.get('tags', []),
-                    data=item,
-                    last_updated=datetime.utcnow()
-                )
-                db.add(db_resource)
-                processed_resources[resource_type].append(item)
-        
-        db.commit()
-        
+
+        data, source, stale = await inventory_cache.get(db)
         return {
             "status": "success",
-            "data": processed_resources,
-            "source": "aws"
+            "data": data,
+            "source": source,
+            "stale": stale
         }
     except Exception as e:
+        db.rollback()
         print(f"Error in get_tagged_resources: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/query")
+async def query_tagged_resources(
+    q: str,
+    resource_type: Optional[str] = None,
+    count_only: bool = False,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Filter the stored inventory by tags, e.g. ``q=env=prod AND NOT owner``.
+    See services/tag_query.py for the expression syntax.
+    """
+    return await run_blocking('db', _query_tagged_resources, db, q, resource_type, count_only, limit, offset)
+
+def _query_tagged_resources(db: Session, q: str, resource_type: Optional[str], count_only: bool, limit: int, offset: int):
+    try:
+        condition = tag_query.parse(q)
+    except tag_query.TagQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        filters = [condition]
+        if resource_type:
+            filters.append(AWSResource.resource_type == resource_type)
+
+        counts = dict(
+            db.query(AWSResource.resource_type, func.count(AWSResource.id))
+            .filter(*filters)
+            .group_by(AWSResource.resource_type)
+            .all()
+        )
+        state = snapshot_state(db, INVENTORY_SNAPSHOT)
+        result = {
+            "status": "success",
+            "count": sum(counts.values()),
+            "counts": counts,
+            "updated_at": state[1] if state else None
+        }
+        if not count_only:
+            rows = (
+                db.query(AWSResource.resource_type, AWSResource.data)
+                .filter(*filters)
+                .order_by(AWSResource.id)
+                .limit(limit)
+                .offset(offset)
+                .all()
+            )
+            result["data"] = [dict(data, resource_type=row_type) for row_type, data in rows]
+        return result
+    except Exception as e:
+        db.rollback()
+        print(f"Error in query_tagged_resources: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/keys")
+async def get_tag_keys(key: Optional[str] = None, db: Session = Depends(get_db)):
+    """Resource counts per tag key, or per value of ``key`` when given."""
+    return await run_blocking('db', _get_tag_keys, db, key)
+
+def _get_tag_keys(db: Session, key: Optional[str]):
+    try:
+        if key:
+            rows = (
+                db.query(ResourceTag.value, func.count(ResourceTag.resource_id))
+                .filter(ResourceTag.key == key)
+                .group_by(ResourceTag.value)
+                .order_by(func.count(ResourceTag.resource_id).desc())
+                .all()
+            )
+        else:
+            rows = (
+                db.query(ResourceTag.key, func.count(ResourceTag.resource_id))
+                .group_by(ResourceTag.key)
+                .order_by(func.count(ResourceTag.resource_id).desc())
+                .all()
+            )
+        return {
+            "status": "success",
+            "data": [{"name": name, "count": count} for name, count in rows]
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_tag_keys: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/summary")
+async def get_resource_summary(db: Session = Depends(get_db)):
+    """Resource counts by type, service, region and account, and tag coverage."""
+    try:
+        return {
+            "status": "success",
+            "data": await run_blocking('db', get_inventory_summary, db)
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error in get_resource_summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
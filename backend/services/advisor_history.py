@@ -0,0 +1,301 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import json
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import FlaggedResource, TrustedAdvisorCheck
+from services.inventory_store import mark_snapshot, snapshot_state
+
+# Summary fields that make a new history row when they change
+TRACKED_FIELDS = ('status', 'resourcesSummary', 'estimatedMonthlySavings')
+FLAGGED_SNAPSHOT = "flagged_resources"
+# Flagged resources kept inline in check lists and the advisor snapshot
+FLAGGED_PREVIEW_SIZE = 5
+
+
+def record_crawl(db: Session, checks: Iterable[Dict], observed_at: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Append one crawl (check details as built by ``AWSService.get_trusted_advisor_details``).
+
+    A check gets a new row only when its status, resource summary, savings or set of
+    flagged resources changed; otherwise its latest row's ``last_seen`` is bumped.
+    Details without a ``flaggedResources`` key are taken as unchanged since the
+    latest row (the crawl reused them from ``previous_details``).
+    """
+    observed_at = observed_at or datetime.utcnow()
+    ensure_flagged_index(db)
+    latest = {row.check_id: row for row in latest_rows(db)}
+    stats = {'changed': 0, 'unchanged': 0}
+
+    for check in checks:
+        row = latest.get(check['id'])
+        if row is not None and ('flaggedResources' not in check or not _record_change(db, row, check, observed_at)):
+            row.last_seen = observed_at
+            stats['unchanged'] += 1
+            continue
+        if row is None:
+            _add_row(db, check, observed_at, baseline=True, added=check.get('flaggedResources', []), removed=[])
+        stats['changed'] += 1
+
+    mark_snapshot(db, FLAGGED_SNAPSHOT, changed=stats['changed'] > 0, updated_at=observed_at)
+
+    db.commit()
+    return stats
+
+
+def _record_change(db: Session, row: TrustedAdvisorCheck, check: Dict, observed_at: datetime) -> bool:
+    previous = dict(db.query(FlaggedResource.resource_id, FlaggedResource.content_hash).filter(
+        FlaggedResource.check_id == row.check_id
+    ))
+    current = {_resource_id(resource): resource for resource in check.get('flaggedResources', [])}
+    added = [resource for resource_id, resource in current.items()
+             if previous.get(resource_id) != _resource_hash(resource)]
+    removed = [resource_id for resource_id in previous if resource_id not in current]
+
+    summary_changed = any(row.result.get(field) != check.get(field) for field in TRACKED_FIELDS)
+    if not added and not removed and not summary_changed:
+        return False
+
+    # Store a full copy instead when the delta would not be smaller
+    if len(added) + len(removed) >= len(current):
+        _add_row(db, check, observed_at, baseline=True, added=list(current.values()), removed=[])
+    else:
+        _add_row(db, check, observed_at, baseline=False, added=added, removed=removed)
+    return True
+
+
+def _add_row(db: Session, check: Dict, observed_at: datetime, baseline: bool, added: List[Dict],
+             removed: List[str]) -> None:
+    result = {key: value for key, value in check.items() if key != 'flaggedResources'}
+    db.add(TrustedAdvisorCheck(
+        check_id=check['id'],
+        name=check.get('name'),
+        category=check.get('category'),
+        status=check.get('status'),
+        result=result,
+        flagged_count=len(check.get('flaggedResources', [])),
+        estimated_savings=check.get('estimatedMonthlySavings'),
+        baseline=baseline,
+        added=added,
+        removed=removed,
+        timestamp=observed_at,
+        last_seen=observed_at
+    ))
+    _sync_flagged(db, check['id'], baseline, added, removed, observed_at)
+    # Sessions don't autoflush; later lookups in this crawl must see the row
+    db.flush()
+
+
+def _sync_flagged(db: Session, check_id: str, baseline: bool, added: List[Dict], removed: List[str],
+                  observed_at: datetime) -> None:
+    stale = FlaggedResource.__table__.delete().where(FlaggedResource.check_id == check_id)
+    if not baseline:
+        stale = stale.where(FlaggedResource.resource_id.in_(removed + [_resource_id(resource) for resource in added]))
+    db.execute(stale)
+    if added:
+        db.execute(FlaggedResource.__table__.insert(), [
+            {
+                'check_id': check_id,
+                'resource_id': _resource_id(resource),
+                'region': resource.get('region'),
+                'status': resource.get('status'),
+                'is_suppressed': bool(resource.get('isSuppressed')),
+                'metadata': resource.get('metadata'),
+                'content_hash': _resource_hash(resource),
+                'first_seen': observed_at,
+            }
+            for resource in {_resource_id(resource): resource for resource in added}.values()
+        ])
+
+
+def ensure_flagged_index(db: Session) -> None:
+    """Fill ``flagged_resources`` from the history once, e.g. for history recorded before it existed."""
+    if snapshot_state(db, FLAGGED_SNAPSHOT) is not None:
+        return
+    db.execute(FlaggedResource.__table__.delete())
+    for row in latest_rows(db):
+        _sync_flagged(db, row.check_id, True, _replay(db, row.check_id), [], row.timestamp)
+    mark_snapshot(db, FLAGGED_SNAPSHOT, changed=True)
+    db.commit()
+
+
+def latest_rows(db: Session, category: Optional[str] = None) -> List[TrustedAdvisorCheck]:
+    """The current state of every recorded check."""
+    latest_ids = db.query(func.max(TrustedAdvisorCheck.id)).filter(
+        TrustedAdvisorCheck.check_id.isnot(None)
+    ).group_by(TrustedAdvisorCheck.check_id)
+    query = db.query(TrustedAdvisorCheck).filter(TrustedAdvisorCheck.id.in_(latest_ids.scalar_subquery()))
+    if category:
+        query = query.filter(TrustedAdvisorCheck.category == category)
+    return query.order_by(TrustedAdvisorCheck.category, TrustedAdvisorCheck.name).all()
+
+
+def previous_details(db: Session) -> Dict[str, List[Dict]]:
+    """
+    Latest recorded checks in the ``previous`` shape of ``get_trusted_advisor_details``,
+    so a crawl only fetches results for checks whose summary moved.
+    """
+    by_category = {}
+    for row in latest_rows(db):
+        by_category.setdefault(row.category, []).append(dict(row.result))
+    return by_category
+
+
+def flagged_resources(db: Session, check_id: str, at: Optional[datetime] = None) -> List[Dict]:
+    """Flagged resources of a check now, or at ``at`` (replayed from the history)."""
+    if at is not None:
+        return _replay(db, check_id, at)
+    ensure_flagged_index(db)
+    rows = db.query(FlaggedResource).filter(FlaggedResource.check_id == check_id).order_by(FlaggedResource.resource_id)
+    return [flagged_resource(row) for row in rows]
+
+
+def flagged_page(db: Session, check_id: str, status: Optional[str] = None, region: Optional[str] = None,
+                 include_suppressed: bool = True, after: Optional[str] = None, limit: int = 100):
+    """
+    One page of a check's current flagged resources, ordered by resource id.
+    Returns ``(resources, next_cursor, total)``; pass ``next_cursor`` back as ``after``.
+    """
+    ensure_flagged_index(db)
+    query = db.query(FlaggedResource).filter(FlaggedResource.check_id == check_id)
+    if status:
+        query = query.filter(FlaggedResource.status == status)
+    if region:
+        query = query.filter(FlaggedResource.region == region)
+    if not include_suppressed:
+        query = query.filter(FlaggedResource.is_suppressed.is_(False))
+    total = query.count()
+
+    if after:
+        query = query.filter(FlaggedResource.resource_id > after)
+    rows = query.order_by(FlaggedResource.resource_id).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].resource_id if len(rows) > limit else None
+    return [flagged_resource(row) for row in rows[:limit]], next_cursor, total
+
+
+def flagged_resource(row: FlaggedResource) -> Dict:
+    """A stored flagged resource in the Support API's shape."""
+    return {
+        'resourceId': row.resource_id,
+        'status': row.status,
+        'region': row.region,
+        'isSuppressed': row.is_suppressed,
+        'metadata': row.resource_metadata,
+    }
+
+
+def compact(check: Dict) -> Dict:
+    """A check without its flagged resources: their count and a short preview instead."""
+    if 'flaggedResources' not in check:
+        return check
+    flagged = check['flaggedResources']
+    result = {key: value for key, value in check.items() if key != 'flaggedResources'}
+    result['flaggedResourcesCount'] = len(flagged)
+    result['flaggedResourcesPreview'] = flagged[:FLAGGED_PREVIEW_SIZE]
+    return result
+
+
+def _replay(db: Session, check_id: str, at: Optional[datetime] = None) -> List[Dict]:
+    query = db.query(TrustedAdvisorCheck).filter(TrustedAdvisorCheck.check_id == check_id)
+    if at is not None:
+        query = query.filter(TrustedAdvisorCheck.timestamp <= at)
+
+    last_baseline = query.filter(TrustedAdvisorCheck.baseline.is_(True)).order_by(
+        TrustedAdvisorCheck.id.desc()
+    ).first()
+    if last_baseline is None:
+        return []
+
+    resources = {}
+    for row in query.filter(TrustedAdvisorCheck.id >= last_baseline.id).order_by(TrustedAdvisorCheck.id):
+        if row.baseline:
+            resources = {}
+        for resource_id in row.removed or []:
+            resources.pop(resource_id, None)
+        for resource in row.added or []:
+            resources[_resource_id(resource)] = resource
+    return list(resources.values())
+
+
+def history(db: Session, check_id: str, since: Optional[datetime] = None, limit: int = 100) -> List[Dict]:
+    """Changes of one check, newest first."""
+    query = db.query(TrustedAdvisorCheck).filter(TrustedAdvisorCheck.check_id == check_id)
+    if since is not None:
+        query = query.filter(TrustedAdvisorCheck.last_seen >= since)
+    rows = query.order_by(TrustedAdvisorCheck.id.desc()).limit(limit).all()
+    return [
+        dict(
+            state(row),
+            added=len(row.added or []) if not row.baseline else None,
+            removed=len(row.removed or []) if not row.baseline else None,
+            baseline=bool(row.baseline)
+        )
+        for row in rows
+    ]
+
+
+def trend(db: Session, days: int = 30, check_id: Optional[str] = None,
+          category: Optional[str] = None) -> List[Dict]:
+    """
+    Daily series over the last ``days`` days: flagged resources, estimated savings and
+    checks per status, for one check, one category, or everything. Each day uses the
+    state every check was in at the end of that day.
+    """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    day_ends = [today - timedelta(days=offset) + timedelta(days=1) for offset in range(days - 1, -1, -1)]
+
+    query = db.query(
+        TrustedAdvisorCheck.check_id, TrustedAdvisorCheck.timestamp, TrustedAdvisorCheck.status,
+        TrustedAdvisorCheck.flagged_count, TrustedAdvisorCheck.estimated_savings
+    ).filter(TrustedAdvisorCheck.check_id.isnot(None))
+    if check_id:
+        query = query.filter(TrustedAdvisorCheck.check_id == check_id)
+    if category:
+        query = query.filter(TrustedAdvisorCheck.category == category)
+
+    changes = {}
+    for row in query.order_by(TrustedAdvisorCheck.timestamp):
+        changes.setdefault(row.check_id, []).append(row)
+
+    series = []
+    for day_end in day_ends:
+        point = {'date': (day_end - timedelta(days=1)).date().isoformat(), 'flagged': 0, 'savings': 0.0, 'statuses': {}}
+        for rows in changes.values():
+            current = None
+            for row in rows:
+                if row.timestamp >= day_end:
+                    break
+                current = row
+            if current is None:
+                continue
+            point['flagged'] += current.flagged_count or 0
+            point['savings'] += current.estimated_savings or 0
+            point['statuses'][current.status] = point['statuses'].get(current.status, 0) + 1
+        series.append(point)
+    return series
+
+
+def state(row: TrustedAdvisorCheck) -> Dict:
+    """Compact view of a history row, without flagged resources."""
+    return {
+        'id': row.check_id,
+        'name': row.name,
+        'category': row.category,
+        'status': row.status,
+        'flagged_count': row.flagged_count,
+        'estimated_savings': row.estimated_savings,
+        'resourcesSummary': (row.result or {}).get('resourcesSummary', {}),
+        'changed_at': row.timestamp,
+        'last_seen': row.last_seen,
+    }
+
+
+def _resource_id(resource: Dict) -> str:
+    return resource.get('resourceId') or _resource_hash(resource)
+
+
+def _resource_hash(resource: Dict) -> str:
+    return hashlib.sha256(json.dumps(resource, sort_keys=True, default=str).encode()).hexdigest()
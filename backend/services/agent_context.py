@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import AWSAdvisor, VpcTopology
+from services import vpc_topology
+from services.inventory_store import SUMMARY_SNAPSHOT, snapshot_state
+from services.inventory_summary import get_inventory_summary, summary_context
+
+# Rough prompt budget for the context; the resource summary is always included
+CONTEXT_TOKEN_BUDGET = int(os.getenv('AGENT_CONTEXT_TOKENS', '4000'))
+SEVERITY = {'error': 0, 'warning': 1}
+DESCRIPTION_CHARS = 300
+FLAGGED_LISTED = 5
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_BREAK = re.compile(r'<br\s*/?>')
+_SPACE = re.compile(r'\s+')
+
+# (snapshot key, context), shared by every request in this worker
+_cached: Optional[Tuple[tuple, str]] = None
+_lock = threading.Lock()
+
+
+def get_agent_context(db: Session) -> str:
+    """
+    Prompt context for the agent: resource summary, Trusted Advisor recommendations
+    and VPCs, trimmed to ``CONTEXT_TOKEN_BUDGET``.
+
+    Built once per inventory summary / advisor / topology snapshot and kept in memory
+    until one of them moves, so a chat message costs three small lookups.
+    """
+    global _cached
+    key = snapshot_key(db)
+    with _lock:
+        if _cached is not None and _cached[0] == key:
+            return _cached[1]
+
+    context = build_context(db)
+    with _lock:
+        _cached = (key, context)
+    return context
+
+
+def snapshot_key(db: Session) -> tuple:
+    summary = snapshot_state(db, SUMMARY_SNAPSHOT)
+    advisor = db.query(func.count(AWSAdvisor.id), func.max(AWSAdvisor.last_updated)).one()
+    topology = db.query(func.max(VpcTopology.collected_at)).scalar()
+    return (summary[0] if summary else None, tuple(advisor), topology, CONTEXT_TOKEN_BUDGET)
+
+
+def build_context(db: Session, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    context = summary_context(get_inventory_summary(db))
+    remaining = budget - estimate_tokens(context)
+
+    # Recommendations by severity, then savings; VPCs after them
+    recommendations = sorted(_recommendations(db), key=lambda item: (item[0], -item[1]))
+    topology = vpc_topology.read_topology(db)
+    vpc_lines = vpc_topology.topology_context(topology[0]).split("\n")[1:] if topology else []
+
+    kept_recommendations, remaining = _fit([(category, text) for _, _, category, text in recommendations], remaining)
+    kept_vpcs, remaining = _fit(vpc_lines, remaining)
+
+    if recommendations:
+        context += "\n\nAWS Cost Optimization Recommendations:\n"
+        by_category: Dict[str, List[str]] = {}
+        for category, text in kept_recommendations:
+            by_category.setdefault(category, []).append(text)
+        for category, texts in by_category.items():
+            context += f"- {category.replace('_', ' ').title()} Recommendations:\n" + "".join(texts)
+        if len(kept_recommendations) < len(recommendations):
+            context += f"  ({len(recommendations) - len(kept_recommendations)} lower-priority recommendations omitted)\n"
+    else:
+        context += "\n\nNo AWS Cost Optimization Recommendations available.\n"
+
+    if vpc_lines:
+        context += "\n\nVPCs:\n" + "\n".join(kept_vpcs)
+        if len(kept_vpcs) < len(vpc_lines):
+            context += f"\n({len(vpc_lines) - len(kept_vpcs)} more VPCs omitted; use get_vpc_topology)"
+    return context
+
+
+def estimate_tokens(text: str) -> int:
+    """About four characters per token for English text and ids."""
+    return (len(text) + 3) // 4
+
+
+def _fit(items: List, remaining: int):
+    kept = []
+    for item in items:
+        cost = estimate_tokens(item[1] if isinstance(item, tuple) else item)
+        if cost > remaining:
+            break
+        kept.append(item)
+        remaining -= cost
+    return kept, remaining
+
+
+def _recommendations(db: Session) -> List[Tuple[int, float, str, str]]:
+    """``(severity rank, savings, category, text)`` for every warning/error cost check."""
+    entries = []
+    for row in db.query(AWSAdvisor.data):
+        if not isinstance(row.data, dict):
+            continue
+        for category, checks in row.data.items():
+            if 'cost' not in category.lower() or not isinstance(checks, list):
+                continue
+            for check in checks:
+                if not isinstance(check, dict):
+                    continue
+                status = (check.get('status') or '').lower()
+                if status not in SEVERITY:
+                    continue
+                savings = check.get('estimatedMonthlySavings') or 0
+                entries.append((SEVERITY[status], savings, category, _format_check(check, status, savings)))
+    return entries
+
+
+def _format_check(check: Dict, status: str, savings: float) -> str:
+    text = ""
+    if check.get('name'):
+        text += f"  • {check['name']}\n"
+    if check.get('description'):
+        description = _SPACE.sub(' ', _HTML_TAG.sub('', _BREAK.sub(' ', check['description']))).strip()
+        if len(description) > DESCRIPTION_CHARS:
+            description = description[:DESCRIPTION_CHARS - 3] + "..."
+        text += f"    Description: {description}\n"
+    text += f"    Status: {status}\n"
+    if savings > 0:
+        text += f"    Estimated Monthly Savings: ${savings}\n"
+
+    # A preview of the flagged resources; older snapshots have them all
+    flagged = check.get('flaggedResourcesPreview', check.get('flaggedResources', []))
+    flagged_count = check.get('flaggedResourcesCount', len(flagged))
+    if flagged:
+        text += f"    Affected Resources ({flagged_count}):\n"
+        for resource in flagged[:FLAGGED_LISTED]:
+            if resource.get('resourceId'):
+                text += f"      - {resource['resourceId']} ({resource.get('region', '')})\n"
+        if flagged_count > FLAGGED_LISTED:
+            text += f"      - ... and {flagged_count - FLAGGED_LISTED} more resources\n"
+    return text
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+import os
+import threading
+
+import httpx
+from agno.agent import Agent
+from agno.models.openai import OpenAIChat
+
+from services.executor import BACKEND_CONCURRENCY
+
+_http_client: Optional[httpx.Client] = None
+_http_lock = threading.Lock()
+
+
+def http_client() -> httpx.Client:
+    """
+    The process-wide connection pool to the model API.
+
+    Every pooled model shares it, so requests reuse warm keep-alive connections
+    instead of opening (and TLS-handshaking) a new one per chat.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_lock:
+            if _http_client is None:
+                connections = int(os.getenv('OPENAI_MAX_CONNECTIONS', str(BACKEND_CONCURRENCY['openai'] * 2)))
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+                    timeout=httpx.Timeout(float(os.getenv('OPENAI_TIMEOUT_SECONDS', '120')), connect=10.0),
+                )
+    return _http_client
+
+
+def openai_model(model_id: str = "gpt-4o-mini") -> OpenAIChat:
+    return OpenAIChat(id=model_id, api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client())
+
+
+class AgentPool:
+    """
+    Idle, pre-built agents of one configuration.
+
+    Building an ``Agent`` means building its model client and, on the first run,
+    introspecting every tool into a schema; a pooled agent keeps both. An agent is
+    not safe for concurrent runs, so each request checks one out and gets it back
+    with its memory cleared, which keeps pooled agents stateless between requests.
+    At most ``size`` idle agents are kept; bursts beyond that build extra agents
+    that are dropped on release.
+    """
+
+    def __init__(self, name: str, build: Callable[[], Agent], size: Optional[int] = None):
+        self.name = name
+        self.build = build
+        self.size = size or int(os.getenv('AGENT_POOL_SIZE', str(BACKEND_CONCURRENCY['openai'])))
+        self._idle: List[Agent] = []
+        self._lock = threading.Lock()
+        self._counters = {'built': 0, 'reused': 0}
+
+    @contextmanager
+    def agent(self) -> Iterator[Agent]:
+        agent = self.acquire()
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def acquire(self) -> Agent:
+        with self._lock:
+            if self._idle:
+                self._counters['reused'] += 1
+                return self._idle.pop()
+            self._counters['built'] += 1
+        return self.build()
+
+    def release(self, agent: Agent) -> None:
+        # Nothing from one request may leak into the next
+        if agent.memory is not None:
+            agent.memory.clear()
+        agent.run_id = None
+        agent.run_input = None
+        agent.run_response = None
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(agent)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, idle=len(self._idle))
@@ -0,0 +1,391 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+import functools
+import inspect
+import json
+import os
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import AWSResource, CostIngestState, ResourceTag, SessionLocal, VpcTopology
+from services import cost_warehouse, tag_query, vpc_topology
+from services.cost_cache import cost_cache
+from services.inventory_index import parse_arn
+from services.inventory_store import INVENTORY_SNAPSHOT, SUMMARY_SNAPSHOT, snapshot_state
+from services.inventory_summary import get_inventory_summary
+
+TOOL_CACHE_SIZE = 256
+MAX_ITEMS = 200
+
+
+class ToolRegistry:
+    """
+    Typed tools for the agent, each answered from the local stores.
+
+    A tool is a function whose first parameter is a database session; the agent
+    sees the remaining parameters (their type hints and the docstring's Args are
+    turned into the tool schema). Results are cached per tool and arguments until
+    the tool's data version moves or ``ttl`` passes, so repeated questions cost
+    neither AWS calls nor queries.
+    """
+
+    def __init__(self, max_entries: int = TOOL_CACHE_SIZE,
+                 ttl: timedelta = timedelta(minutes=int(os.getenv('AGENT_TOOL_CACHE_MINUTES', '15')))):
+        self.tools: List[Callable] = []
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._results: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0}
+
+    def tool(self, version: Callable[[Session], Any]):
+        """Register ``func(db, ...)``; ``version(db)`` changes whenever the data it reads does."""
+        def decorator(func: Callable) -> Callable:
+            signature = inspect.signature(func)
+            parameters = list(signature.parameters.values())[1:]
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.replace(parameters=parameters).bind(*args, **kwargs)
+                bound.apply_defaults()
+                db = SessionLocal()
+                try:
+                    key = (func.__name__, json.dumps(bound.arguments, sort_keys=True, default=str), version(db))
+                    now = datetime.utcnow()
+                    with self._lock:
+                        cached = self._results.get(key)
+                        if cached is not None and cached[0] > now:
+                            self._results.move_to_end(key)
+                            self._counters['hits'] += 1
+                            return cached[1]
+                        self._counters['misses'] += 1
+
+                    result = json.dumps(func(db, **bound.arguments), default=str)
+                    with self._lock:
+                        self._results[key] = (now + self.ttl, result)
+                        while len(self._results) > self.max_entries:
+                            self._results.popitem(last=False)
+                    return result
+                except Exception as e:
+                    print(f"Error in agent tool {func.__name__}: {str(e)}")
+                    return json.dumps({"error": str(e)})
+                finally:
+                    db.close()
+
+            # The agent sees the parameters after ``db``
+            wrapper.__signature__ = signature.replace(parameters=parameters)
+            wrapper.__annotations__ = {name: hint for name, hint in func.__annotations__.items() if name != 'db'}
+            self.tools.append(wrapper)
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, entries=len(self._results))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+registry = ToolRegistry()
+
+
+def inventory_version(db: Session):
+    return snapshot_state(db, INVENTORY_SNAPSHOT)
+
+
+def summary_version(db: Session):
+    return snapshot_state(db, SUMMARY_SNAPSHOT)
+
+
+def topology_version(db: Session):
+    return db.query(func.max(VpcTopology.collected_at)).scalar()
+
+
+def cost_version(db: Session):
+    return db.query(func.max(CostIngestState.last_run)).scalar()
+
+
+INSTANCE_GROUPS = ('region', 'state', 'instance_type', 'account')
+RESOURCE_GROUPS = ('resource_type', 'service', 'region', 'account')
+COST_GROUPS = ('SERVICE', 'REGION', 'USAGE_TYPE', 'LINKED_ACCOUNT')
+
+
+@registry.tool(version=inventory_version)
+def count_instances(db: Session, group_by: str = "region", state: Optional[str] = None,
+                    region: Optional[str] = None) -> Dict:
+    """
+    Count EC2 instances, grouped by region, state, instance_type or account.
+    Use this for questions like "how many instances do I have per region" or "how many are stopped".
+
+    Args:
+        group_by (str): One of region, state, instance_type, account
+        state (str, optional): Only instances in this state, e.g. running or stopped
+        region (str, optional): Only instances in this region, e.g. us-east-1
+
+    Returns:
+        str: JSON with the total and the count per group
+    """
+    if group_by not in INSTANCE_GROUPS:
+        return {"error": f"group_by must be one of {', '.join(INSTANCE_GROUPS)}"}
+    counts = {}
+    for instance in _instances(db, state=state, region=region):
+        key = instance[group_by] or 'unknown'
+        counts[key] = counts.get(key, 0) + 1
+    return {"total": sum(counts.values()), "by_" + group_by: dict(sorted(counts.items(), key=lambda item: -item[1]))}
+
+
+@registry.tool(version=inventory_version)
+def list_instances(db: Session, state: Optional[str] = None, region: Optional[str] = None,
+                   instance_type: Optional[str] = None, tags: Optional[str] = None, limit: int = 50) -> Dict:
+    """
+    List EC2 instances with their id, name, region, state, instance type and tags.
+
+    Args:
+        state (str, optional): Only instances in this state, e.g. running or stopped
+        region (str, optional): Only instances in this region
+        instance_type (str, optional): Only instances of this type, e.g. t3.micro
+        tags (str, optional): Tag expression, e.g. "env=prod AND NOT owner"
+        limit (int): Maximum number of instances to return (at most 200)
+
+    Returns:
+        str: JSON with the number of matching instances and the first `limit` of them
+    """
+    instances = [
+        instance for instance in _instances(db, state=state, region=region, tags=tags)
+        if not instance_type or instance['instance_type'] == instance_type
+    ]
+    return {"count": len(instances), "instances": instances[:min(limit, MAX_ITEMS)]}
+
+
+@registry.tool(version=summary_version)
+def count_resources(db: Session, group_by: str = "resource_type") -> Dict:
+    """
+    Count all inventoried AWS resources, grouped by resource_type, service, region or account,
+    plus tag coverage.
+
+    Args:
+        group_by (str): One of resource_type, service, region, account
+
+    Returns:
+        str: JSON with the total, the count per group and the share of tagged resources
+    """
+    if group_by not in RESOURCE_GROUPS:
+        return {"error": f"group_by must be one of {', '.join(RESOURCE_GROUPS)}"}
+    summary = get_inventory_summary(db)
+    return {
+        "total": summary['total'],
+        "by_" + group_by: summary.get(group_by, {}),
+        "tag_coverage": summary['tag_coverage'],
+        "updated_at": summary['updated_at'],
+    }
+
+
+@registry.tool(version=inventory_version)
+def find_resources_by_tag(db: Session, query: str, resource_type: Optional[str] = None, limit: int = 50) -> Dict:
+    """
+    Find resources by their tags.
+    Expressions: env=prod, env!=prod, owner (tag exists), NOT owner (tag missing), untagged,
+    combined with AND, OR, NOT and parentheses.
+
+    Args:
+        query (str): Tag expression, e.g. "env=prod AND (NOT owner OR NOT cost-center)"
+        resource_type (str, optional): Only this resource type, e.g. ec2, s3, rds
+        limit (int): Maximum number of resources to return (at most 200)
+
+    Returns:
+        str: JSON with the number of matches per resource type and the first `limit` resources
+    """
+    try:
+        condition = tag_query.parse(query)
+    except tag_query.TagQueryError as e:
+        return {"error": str(e)}
+    filtered = db.query(AWSResource).filter(condition)
+    if resource_type:
+        filtered = filtered.filter(AWSResource.resource_type == resource_type)
+    counts = dict(filtered.with_entities(AWSResource.resource_type, func.count(AWSResource.id)).group_by(
+        AWSResource.resource_type
+    ).all())
+    rows = filtered.with_entities(AWSResource.id, AWSResource.resource_type, AWSResource.tags).order_by(
+        AWSResource.id
+    ).limit(min(limit, MAX_ITEMS))
+    return {
+        "count": sum(counts.values()),
+        "counts": counts,
+        "resources": [{"arn": arn, "type": kind, "tags": _tags(tags)} for arn, kind, tags in rows],
+    }
+
+
+@registry.tool(version=inventory_version)
+def list_tag_keys(db: Session, limit: int = 50) -> Dict:
+    """
+    Tag keys in use, with how many resources carry each and how many distinct values it has.
+
+    Args:
+        limit (int): Maximum number of keys to return, most used first
+
+    Returns:
+        str: JSON list of tag keys with resource and value counts
+    """
+    rows = db.query(
+        ResourceTag.key, func.count(ResourceTag.resource_id), func.count(func.distinct(ResourceTag.value))
+    ).group_by(ResourceTag.key).order_by(func.count(ResourceTag.resource_id).desc()).limit(min(limit, MAX_ITEMS))
+    return {"keys": [{"key": key, "resources": resources, "values": values} for key, resources, values in rows]}
+
+
+@registry.tool(version=topology_version)
+def get_vpc_topology(db: Session, vpc_id: Optional[str] = None, region: Optional[str] = None) -> Dict:
+    """
+    Get the network topology of the user's VPCs.
+    Use this function for questions about VPCs, subnets, route tables, internet gateways,
+    network interfaces, security groups or which instances run in which VPC.
+    Without a vpc_id it returns every VPC with counts of its members; with a vpc_id it
+    returns that VPC's subnets, instances, network interfaces, route tables, internet
+    gateways and security groups, and the relationships between them.
+
+    Args:
+        vpc_id (str, optional): VPC id, e.g. vpc-0abc1234
+        region (str, optional): Only VPCs in this region
+
+    Returns:
+        str: JSON string containing the VPC topology
+    """
+    snapshot = vpc_topology.read_topology(db)
+    topology = snapshot[0] if snapshot else vpc_topology.refresh_topology(db)
+    if vpc_id:
+        vpc = vpc_topology.find_vpc(topology, vpc_id)
+        return vpc if vpc else {"error": f"VPC {vpc_id} not found"}
+    return {
+        "vpcs": [vpc_topology.vpc_summary(vpc) for vpc in topology['vpcs'] if not region or vpc['region'] == region],
+        "collected_at": topology['collected_at']
+    }
+
+
+@registry.tool(version=cost_version)
+def get_cost_by_service(db: Session, start_date: str, end_date: str, group_by: str = "SERVICE",
+                        service: Optional[str] = None, top: int = 15) -> Dict:
+    """
+    Total AWS cost over a date range, broken down by SERVICE, REGION, USAGE_TYPE or LINKED_ACCOUNT.
+    Figure out the start and end date based on the user question.
+
+    Args:
+        start_date (str): Start date in YYYY-MM-DD format (inclusive)
+        end_date (str): End date in YYYY-MM-DD format (exclusive)
+        group_by (str): One of SERVICE, REGION, USAGE_TYPE, LINKED_ACCOUNT
+        service (str, optional): Only this service, e.g. "Amazon Elastic Compute Cloud - Compute"
+        top (int): Number of largest groups to return; the rest are summed as "Other"
+
+    Returns:
+        str: JSON with the total and the largest groups, most expensive first
+    """
+    group_by = group_by.upper()
+    if group_by not in COST_GROUPS:
+        return {"error": f"group_by must be one of {', '.join(COST_GROUPS)}"}
+
+    totals = {}
+    unit = 'USD'
+    dimensions = [group_by] if group_by == 'SERVICE' or not service else ['SERVICE', group_by]
+    try:
+        covered = cost_warehouse.is_covered(db, cost_warehouse.view_for(dimensions), start_date, end_date)
+    except ValueError:
+        covered = False
+    if covered:
+        rows = cost_warehouse.query_costs(db, start_date, end_date, group_by=dimensions, granularity='TOTAL',
+                                          filters={'SERVICE': [service]} if service else None)
+        for row in rows:
+            totals[row[group_by]] = totals.get(row[group_by], 0.0) + row['amount']
+            unit = row['unit']
+    else:
+        response = cost_cache.get_cost_and_usage(start_date, end_date, group_by=dimensions)
+        for period in response.get('ResultsByTime', []):
+            for group in period.get('Groups', []):
+                keys = dict(zip(dimensions, group['Keys']))
+                if service and keys.get('SERVICE') != service:
+                    continue
+                metric = group['Metrics']['UnblendedCost']
+                totals[keys[group_by]] = totals.get(keys[group_by], 0.0) + float(metric['Amount'])
+                unit = metric.get('Unit', unit)
+
+    ranked = sorted(totals.items(), key=lambda item: -item[1])
+    groups = [{"key": key, "amount": round(amount, 2)} for key, amount in ranked[:top]]
+    if len(ranked) > top:
+        groups.append({"key": "Other", "amount": round(sum(amount for _, amount in ranked[top:]), 2)})
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "total": round(sum(totals.values()), 2),
+        "unit": unit,
+        "source": "warehouse" if covered else "cost_explorer",
+        "by_" + group_by.lower(): groups,
+    }
+
+
+@registry.tool(version=cost_version)
+def get_cost_data(db: Session, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
+    """
+    Get AWS cost data for the specified date range.
+    Use this function to get information about cost and total cost for same services
+    Figure out the start and end date based on user question and provide to the function.
+    If dates are not provided, default to the last 30 days from today's date which is 06 march 2025.
+
+    Args:
+        start_date (str, optional): Start date in YYYY-MM-DD format
+        end_date (str, optional): End date in YYYY-MM-DD format
+
+    Returns:
+        str: JSON string containing AWS cost data for the specified period
+    """
+    try:
+        # Read from the local cost warehouse when it covers the range, otherwise ask AWS
+        cost_data = cost_warehouse.get_cost_summary(db, start_date, end_date)
+        if cost_data is None:
+            cost_data = cost_cache.get_cost_and_usage(start_date, end_date)
+        return cost_data
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error fetching cost data: {error_msg}")
+
+        # Handle specific AWS error for historical data limitation
+        if "historical data beyond 14 months" in error_msg:
+            # Return a more user-friendly error message
+            return {
+                "error": "AWS Cost Explorer can only access data from the last 14 months",
+                "suggestion": "Please try with a more recent date range"
+            }
+        return {"error": error_msg}
+
+
+def _instances(db: Session, state: Optional[str] = None, region: Optional[str] = None,
+               tags: Optional[str] = None) -> List[Dict]:
+    query = db.query(AWSResource.id, AWSResource.region, AWSResource.account, AWSResource.tags, AWSResource.data).filter(
+        AWSResource.resource_type == 'ec2', AWSResource.id.like('%:instance/%')
+    )
+    if region:
+        query = query.filter(AWSResource.region == region)
+    if tags:
+        query = query.filter(tag_query.parse(tags))
+
+    instances = []
+    for arn, instance_region, account, instance_tags, data in query.order_by(AWSResource.id).yield_per(1000):
+        data = data or {}
+        if state and data.get('state') != state:
+            continue
+        tag_map = _tags(instance_tags)
+        instances.append({
+            'id': parse_arn(arn).resource_id,
+            'name': tag_map.get('Name'),
+            'region': instance_region,
+            'account': account,
+            'state': data.get('state'),
+            'instance_type': data.get('instance_type'),
+            'tags': tag_map,
+        })
+    return instances
+
+
+def _tags(tags: Optional[List[Dict]]) -> Dict[str, str]:
+    return {tag.get('Key'): tag.get('Value') for tag in tags or []}
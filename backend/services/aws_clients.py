@@ -0,0 +1,89 @@
+import boto3
+from botocore.config import Config
+from typing import Dict, Optional, Tuple
+import hashlib
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ClientRegistry:
+    """
+    Process-wide cache of boto3 clients keyed by (credentials, region, service).
+
+    Building a client costs tens of milliseconds and a fair amount of memory, and
+    every new client starts with a cold HTTPS connection pool. Clients are
+    thread-safe once built, so one per key is shared by every request and worker
+    thread. Sessions are not thread-safe, so creation is serialized behind a lock.
+    """
+
+    def __init__(self, max_pool_connections: Optional[int] = None, max_attempts: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._sessions: Dict[Tuple, boto3.Session] = {}
+        self._clients: Dict[Tuple, object] = {}
+        self.config = Config(
+            max_pool_connections=max_pool_connections or int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50')),
+            retries={
+                'mode': 'adaptive',
+                'max_attempts': max_attempts or int(os.getenv('AWS_MAX_ATTEMPTS', '5')),
+            },
+        )
+        # Lets the whole backend point at moto/localstack
+        self.endpoint_url = os.getenv('AWS_ENDPOINT_URL') or None
+
+    def client(self, service: str, region_name: Optional[str] = None, credentials: Optional[Dict] = None):
+        credentials = credentials or _env_credentials()
+        region_name = region_name or default_region()
+        key = (_credentials_key(credentials), region_name, service)
+
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                session = self._session(key[0], credentials)
+                client = session.client(service, region_name=region_name, config=self.config,
+                                        endpoint_url=self.endpoint_url)
+                self._clients[key] = client
+            return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+
+    def _session(self, credentials_key: Tuple, credentials: Dict) -> boto3.Session:
+        session = self._sessions.get(credentials_key)
+        if session is None:
+            session = boto3.Session(**{k: v for k, v in credentials.items() if v})
+            self._sessions[credentials_key] = session
+        return session
+
+
+def default_region() -> str:
+    return os.getenv('AWS_REGION', 'us-east-1')
+
+
+def _env_credentials() -> Dict:
+    return {
+        'aws_access_key_id': os.getenv('AWS_ACCESS_KEY_ID'),
+        'aws_secret_access_key': os.getenv('AWS_SECRET_ACCESS_KEY'),
+        'aws_session_token': os.getenv('AWS_SESSION_TOKEN'),
+    }
+
+
+def _credentials_key(credentials: Dict) -> Tuple:
+    # Never keep raw secrets in the cache key
+    secret = f"{credentials.get('aws_secret_access_key') or ''}:{credentials.get('aws_session_token') or ''}"
+    return credentials.get('aws_access_key_id'), hashlib.sha256(secret.encode()).hexdigest()
+
+
+registry = ClientRegistry()
+
+
+def get_client(service: str, region_name: Optional[str] = None, credentials: Optional[Dict] = None):
+    return registry.client(service, region_name=region_name, credentials=credentials)
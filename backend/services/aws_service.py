@@ -1,39 +1,152 @@
-import boto3
 from botocore.exceptions import ClientError
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import queue
+from functools import lru_cache
+import random
+import threading
+import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from services.aws_clients import default_region, get_client
+from services.inventory_index import InventoryIndex
+
+TRUSTED_ADVISOR_CATEGORIES = ['cost_optimizing', 'security', 'fault_tolerance', 'performance', 'service_limits']
+TRUSTED_ADVISOR_SUMMARY_BATCH_SIZE = 50
+THROTTLING_ERROR_CODES = {'Throttling', 'ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded'}
+
+
+def _call_with_retry(operation, **kwargs):
+    """Call a boto3 operation, backing off with jitter while AWS reports throttling."""
+    max_attempts = int(os.getenv('AWS_THROTTLE_MAX_ATTEMPTS', '6'))
+    for attempt in range(max_attempts):
+        try:
+            return operation(**kwargs)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in THROTTLING_ERROR_CODES or attempt == max_attempts - 1:
+                raise
+            time.sleep(min(20.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def _build_check_details(check: Dict, result: Dict) -> Dict:
+    check_details = {
+        'id': check['id'],
+        'name': check['name'],
+        'description': check['description'],
+        'category': check['category'],
+        'status': result['status'],
+        'resourcesSummary': result.get('resourcesSummary', {}),
+        'flaggedResources': result.get('flaggedResources', []),
+        'timestamp': result.get('timestamp'),
+    }
+
+    if check['category'] == 'cost_optimizing':
+        check_details['estimatedMonthlySavings'] = result.get('categorySpecificSummary', {}).get(
+            'costOptimizing', {}).get('estimatedMonthlySavings', 0)
+
+    return check_details
+
+
+def _merge_results_by_time(results: Dict[str, Dict], results_by_time: List[Dict]) -> Dict[str, Dict]:
+    """Fold ResultsByTime entries into ``results`` keyed by period start, concatenating their groups."""
+    for period in results_by_time:
+        start = period['TimePeriod']['Start']
+        if start in results:
+            results[start]['Groups'].extend(period.get('Groups', []))
+        else:
+            results[start] = {**period, 'Groups': list(period.get('Groups', []))}
+    return results
+
+
+def _month_windows(start_date: str, end_date: str) -> List[Tuple[str, str]]:
+    """Split [start_date, end_date) on calendar-month boundaries."""
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    windows = []
+    while start < end:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        window_end = min(next_month, end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end
+    return windows or [(start_date, end_date)]
+
+
+def _fetch_cost_window(client, request: Dict, start_date: str, end_date: str) -> Dict:
+    """One Cost Explorer window with every page folded in; groups split across pages are rejoined."""
+    request = {**request, 'TimePeriod': {'Start': start_date, 'End': end_date}}
+    response = client.get_cost_and_usage(**request)
+    results = _merge_results_by_time({}, response.get('ResultsByTime', []))
+    attributes = list(response.get('DimensionValueAttributes', []))
+    while response.get('NextPageToken'):
+        response = client.get_cost_and_usage(NextPageToken=response['NextPageToken'], **request)
+        _merge_results_by_time(results, response.get('ResultsByTime', []))
+        attributes.extend(response.get('DimensionValueAttributes', []))
+
+    response.pop('NextPageToken', None)
+    response['ResultsByTime'] = [results[start] for start in sorted(results)]
+    response['DimensionValueAttributes'] = attributes
+    return response
+
 
 class AWSService:
-    def __init__(self):
+    _ta_catalogue: Optional[Tuple[datetime, List[Dict]]] = None
+    _ta_catalogue_lock = threading.Lock()
+
+    def __init__(self, credentials: Optional[Dict] = None, region_name: Optional[str] = None):
         load_dotenv()
-        self.session = boto3.Session(
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION', 'us-east-1')
-        )
-
-    def get_cost_and_usage(self, start_date: str, end_date: str) -> Dict:
-        client = self.session.client('ce')
+        self.credentials = credentials
+        self.region_name = region_name or default_region()
+
+    def client(self, service: str, region_name: Optional[str] = None):
+        """Shared, pooled boto3 client from the process-wide registry."""
+        return get_client(service, region_name=region_name or self.region_name, credentials=self.credentials)
+
+    def get_cost_and_usage(self, start_date: str, end_date: str, granularity: str = 'MONTHLY',
+                           group_by: Optional[List[str]] = None, metrics: Optional[List[str]] = None,
+                           max_workers: Optional[int] = None) -> Dict:
+        """
+        Cost Explorer costs for [start_date, end_date), grouped by up to two dimensions.
+
+        Long ranges (up to Cost Explorer's 14-month limit) are split into calendar-month
+        windows that are fetched concurrently (COST_EXPLORER_MAX_WORKERS), each following
+        every NextPageToken. The windows are merged back into one ``ResultsByTime`` list
+        ordered by period, so a year-over-year view costs about one month's round trip.
+        """
+        client = self.client('ce')
+        request = {
+            'Granularity': granularity,
+            'Metrics': metrics or ['UnblendedCost'],
+            'GroupBy': [
+                {'Type': 'DIMENSION', 'Key': key} for key in (group_by or ['SERVICE'])
+            ]
+        }
+        if max_workers is None:
+            max_workers = int(os.getenv('COST_EXPLORER_MAX_WORKERS', '6'))
+        windows = _month_windows(start_date, end_date)
+
         try:
-            response = client.get_cost_and_usage(
-                TimePeriod={
-                    'Start': start_date,
-                    'End': end_date
-                },
-                Granularity='MONTHLY',  # Changed from DAILY to MONTHLY
-                Metrics=['UnblendedCost'],
-                GroupBy=[
-                    {'Type': 'DIMENSION', 'Key': 'SERVICE'}
-                ]
-            )
-            return response
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+                responses = list(executor.map(
+                    lambda window: _fetch_cost_window(client, request, *window), windows
+                ))
         except ClientError as e:
             raise Exception(f"Error fetching AWS costs: {str(e)}")
 
+        results = {}
+        attributes = {}
+        for response in responses:
+            _merge_results_by_time(results, response.get('ResultsByTime', []))
+            for attribute in response.get('DimensionValueAttributes', []):
+                attributes.setdefault(attribute['Value'], attribute)
+
+        merged = responses[0]
+        merged['ResultsByTime'] = [results[start] for start in sorted(results)]
+        merged['DimensionValueAttributes'] = list(attributes.values())
+        return merged
+
     def get_ec2_instances(self) -> List[Dict]:
-        ec2 = self.session.client('ec2')
+        ec2 = self.client('ec2')
         try:
             response = ec2.describe_instances()
             instances = []
@@ -49,135 +162,288 @@ class AWSService:
         except ClientError as e:
             raise Exception(f"Error fetching EC2 instances: {str(e)}")
 
-    def get_trusted_advisor_details(self) -> Dict:
-        support = self.session.client('support')
+    def get_trusted_advisor_checks(self, force_refresh: bool = False) -> List[Dict]:
+        """
+        Return the Trusted Advisor check catalogue.
+
+        The catalogue rarely changes, so it is fetched once and shared by every
+        AWSService instance until TRUSTED_ADVISOR_CATALOGUE_TTL_HOURS have passed.
+        """
+        ttl = timedelta(hours=float(os.getenv('TRUSTED_ADVISOR_CATALOGUE_TTL_HOURS', '24')))
+        with AWSService._ta_catalogue_lock:
+            cached = AWSService._ta_catalogue
+            if force_refresh or cached is None or datetime.utcnow() - cached[0] > ttl:
+                support = self.client('support')
+                response = _call_with_retry(support.describe_trusted_advisor_checks, language='en')
+                cached = (datetime.utcnow(), response['checks'])
+                AWSService._ta_catalogue = cached
+            return cached[1]
+
+    def get_trusted_advisor_details(self, previous: Optional[Dict] = None, statuses: Optional[Iterable[str]] = None,
+                                    max_workers: Optional[int] = None) -> Dict:
+        """
+        Crawl Trusted Advisor results grouped by category.
+
+        Args:
+            previous: The last stored result of this method. Checks whose status and
+                timestamp are unchanged according to the batched check summaries are
+                reused from it instead of being fetched again.
+            statuses: Only return checks in these statuses (e.g. warning/error). Checks
+                outside them are skipped based on their summary, without fetching results.
+            max_workers: Size of the pool fetching check results concurrently
+                (TRUSTED_ADVISOR_MAX_WORKERS by default).
+        """
+        support = self.client('support')
+        if max_workers is None:
+            max_workers = int(os.getenv('TRUSTED_ADVISOR_MAX_WORKERS', '8'))
+        wanted_statuses = {status.lower() for status in statuses} if statuses else None
+
         try:
-            # Get all check categories
-            categories = ['cost_optimizing', 'security', 'fault_tolerance', 'performance', 'service_limits']
+            catalogue = [
+                check for check in self.get_trusted_advisor_checks()
+                if check['category'] in TRUSTED_ADVISOR_CATEGORIES
+            ]
+
+            previous_checks = {}
+            for checks in (previous or {}).values():
+                if isinstance(checks, list):
+                    previous_checks.update({c['id']: c for c in checks if isinstance(c, dict) and 'id' in c})
+
+            summaries = {}
+            if previous_checks or wanted_statuses:
+                summaries = self._get_trusted_advisor_summaries(support, [c['id'] for c in catalogue], max_workers)
+
+            details_by_id = {}
+            to_fetch = []
+            for check in catalogue:
+                summary = summaries.get(check['id'])
+                if summary:
+                    if wanted_statuses and summary['status'].lower() not in wanted_statuses:
+                        continue
+                    cached = previous_checks.get(check['id'])
+                    if cached and cached.get('status') == summary['status'] \
+                            and cached.get('timestamp') == summary.get('timestamp'):
+                        details_by_id[check['id']] = cached
+                        continue
+                to_fetch.append(check)
+
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                futures = {
+                    executor.submit(
+                        _call_with_retry, support.describe_trusted_advisor_check_result,
+                        checkId=check['id'], language='en'
+                    ): check
+                    for check in to_fetch
+                }
+                for future in as_completed(futures):
+                    check = futures[future]
+                    details = _build_check_details(check, future.result()['result'])
+                    if wanted_statuses and (details['status'] or '').lower() not in wanted_statuses:
+                        continue
+                    details_by_id[check['id']] = details
+
+            # Keep the catalogue order and only add categories that have checks
             all_checks = {}
-            
-            for category in categories:
-                checks_response = support.describe_trusted_advisor_checks(
-                    language='en'
-                )
-                category_checks = []
-                
-                # Filter checks by category
-                category_checks_list = [
-                    check for check in checks_response['checks']
-                    if check['category'] == category
+            for category in TRUSTED_ADVISOR_CATEGORIES:
+                category_checks = [
+                    details_by_id[check['id']] for check in catalogue
+                    if check['category'] == category and check['id'] in details_by_id
                 ]
-                
-                for check in category_checks_list:
-                    result = support.describe_trusted_advisor_check_result(
-                        checkId=check['id'],
-                        language='en'
-                    )
-                    
-                    check_details = {
-                        'id': check['id'],
-                        'name': check['name'],
-                        'description': check['description'],
-                        'category': category,
-                        'status': result['result']['status'],
-                        'resourcesSummary': result['result'].get('resourcesSummary', {}),
-                        'flaggedResources': result['result'].get('flaggedResources', []),
-                        'timestamp': result['result'].get('timestamp'),
-                    }
-                    
-                    if category == 'cost_optimizing':
-                        check_details['estimatedMonthlySavings'] = result['result'].get('costOptimizing', {}).get('estimatedMonthlySavings', 0)
-                
-                    category_checks.append(check_details)
-                
-                if category_checks:  # Only add category if it has checks
+                if category_checks:
                     all_checks[category] = category_checks
-                
+
             return all_checks
         except ClientError as e:
             raise Exception(f"Error fetching Trusted Advisor details: {str(e)}")
 
-    def get_resources_by_tag(self) -> Dict:
-        client = self.session.client('resourcegroupstaggingapi')
-        try:
-            paginator = client.get_paginator('get_resources')
-            resources_by_type = {}
-            
-            # Iterate through all pages of resources
-            for page in paginator.paginate(
-                ResourcesPerPage=100,
-                IncludeComplianceDetails=False,
-                ExcludeCompliantResources=False
+    def _get_trusted_advisor_summaries(self, support, check_ids: List[str], max_workers: int) -> Dict[str, Dict]:
+        batches = [
+            check_ids[i:i + TRUSTED_ADVISOR_SUMMARY_BATCH_SIZE]
+            for i in range(0, len(check_ids), TRUSTED_ADVISOR_SUMMARY_BATCH_SIZE)
+        ]
+        summaries = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+            for response in executor.map(
+                lambda batch: _call_with_retry(support.describe_trusted_advisor_check_summaries, checkIds=batch),
+                batches
             ):
-                for resource in page.get('ResourceTagMappingList', []):
-                    arn = resource['ResourceARN']
-                    tags = resource.get('Tags', [])
-                    resource_type = arn.split(':')[2]
-                    
-                    if resource_type not in resources_by_type:
-                        resources_by_type[resource_type] = []
-                        
-                    resources_by_type[resource_type].append({
-                        'arn': arn,
-                        'tags': tags,
-                        'name': arn.split('/')[-1] if '/' in arn else arn.split(':')[-1]
-                    })
-            
-            # Get additional resources without tags
-            ec2 = self.session.client('ec2')
-            rds = self.session.client('rds')
-            s3 = self.session.client('s3')
-            
-            # Add EC2 instances
-            try:
-                ec2_response = ec2.describe_instances()
-                if 'ec2' not in resources_by_type:
-                    resources_by_type['ec2'] = []
-                for reservation in ec2_response['Reservations']:
-                    for instance in reservation['Instances']:
-                        if not any(r['arn'].endswith(instance['InstanceId']) for r in resources_by_type.get('ec2', [])):
-                            resources_by_type['ec2'].append({
-                                'arn': f"arn:aws:ec2:{self.session.region_name}:{instance['OwnerId']}:instance/{instance['InstanceId']}",
-                                'tags': instance.get('Tags', []),
-                                'name': instance['InstanceId']
-                            })
-            except ClientError:
-                pass
-        
-            # Add S3 buckets
+                for summary in response['summaries']:
+                    summaries[summary['checkId']] = summary
+        return summaries
+
+    def get_enabled_regions(self) -> List[str]:
+        """Return the regions enabled for this account (opt-in regions included once opted in)."""
+        ec2 = self.client('ec2')
+        try:
+            response = ec2.describe_regions(AllRegions=False)
+            return sorted(region['RegionName'] for region in response['Regions'])
+        except ClientError as e:
+            raise Exception(f"Error fetching enabled regions: {str(e)}")
+
+    def get_resources_by_tag(self, all_regions: Optional[bool] = None, regions: Optional[List[str]] = None,
+                             max_workers: Optional[int] = None) -> Dict:
+        """
+        Crawl the account inventory grouped by service.
+
+        This materializes the whole inventory; prefer ``iter_resources`` when the
+        result is only going to be written to the database.
+        """
+        index = InventoryIndex()
+        # Keep the historical shape: these keys exist even when nothing was found
+        for kind in ('ec2', 's3', 'rds'):
+            index.ensure_type(kind)
+        for resource_type, item in self.iter_resources(all_regions=all_regions, regions=regions,
+                                                       max_workers=max_workers):
+            index.add(resource_type, item)
+        return index.to_dict()
+
+    def iter_resources(self, all_regions: Optional[bool] = None, regions: Optional[List[str]] = None,
+                       max_workers: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Stream ``(resource_type, item)`` pairs from every crawl as pages arrive.
+
+        By default only the configured region is crawled. With ``all_regions`` (or
+        ``AWS_CRAWL_ALL_REGIONS=true``) every enabled region is crawled, and every
+        region x service call runs on a bounded worker pool so the refresh takes
+        roughly as long as the slowest region. An explicit ``regions`` list wins over both.
+
+        Workers hand over one API page at a time through a bounded queue, so at most
+        AWS_CRAWL_QUEUE_PAGES pages are buffered however large the account is. The
+        same resource may be yielded by several sources (tagging API and describe
+        calls); consumers de-duplicate on the ARN.
+        """
+        if all_regions is None:
+            all_regions = os.getenv('AWS_CRAWL_ALL_REGIONS', 'false').lower() == 'true'
+        if max_workers is None:
+            max_workers = int(os.getenv('AWS_CRAWL_MAX_WORKERS', '16'))
+
+        if not regions:
+            regions = self.get_enabled_regions() if all_regions else [self.region_name]
+        home_region = self.region_name if self.region_name in regions else regions[0]
+
+        # Clients come from the shared registry; only the (thread-safe) clients are handed to the workers
+        tasks = []
+        for region in regions:
+            tasks.append(('tagging', region, self._crawl_tagged_resources,
+                          self.client('resourcegroupstaggingapi', region_name=region)))
+            tasks.append(('ec2', region, self._crawl_ec2_instances,
+                          self.client('ec2', region_name=region)))
+            tasks.append(('rds', region, self._crawl_rds_instances,
+                          self.client('rds', region_name=region)))
+        # S3 bucket listing is global, so it only needs to run once
+        tasks.append(('s3', home_region, self._crawl_s3_buckets,
+                      self.client('s3', region_name=home_region)))
+
+        pages = queue.Queue(maxsize=int(os.getenv('AWS_CRAWL_QUEUE_PAGES', '64')))
+        stop = threading.Event()
+
+        def put(message) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(message, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def run(kind, region, crawl, client):
             try:
-                s3_response = s3.list_buckets()
-                if 's3' not in resources_by_type:
-                    resources_by_type['s3'] = []
-                for bucket in s3_response['Buckets']:
-                    if not any(r['arn'].endswith(bucket['Name']) for r in resources_by_type.get('s3', [])):
-                        try:
-                            tags = s3.get_bucket_tagging(Bucket=bucket['Name']).get('TagSet', [])
-                        except ClientError:
-                            tags = []
-                        resources_by_type['s3'].append({
-                            'arn': f"arn:aws:s3:::{bucket['Name']}",
-                            'tags': tags,
-                            'name': bucket['Name']
-                        })
-            except ClientError:
-                pass
-        
-            # Add RDS instances
+                for page in crawl(client, region):
+                    if not put(('page', page)):
+                        return
+            except ClientError as e:
+                if kind == 'tagging' and len(regions) == 1:
+                    put(('error', Exception(f"Error fetching tagged resources: {str(e)}")))
+                    return
+                # A region or service we cannot read (SCPs, disabled services) must
+                # not sink the whole crawl
+                print(f"Skipping {kind} in {region}: {str(e)}")
+            except Exception as e:
+                put(('error', e))
+                return
+            put(('done', None))
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))))
+        try:
+            for task in tasks:
+                executor.submit(run, *task)
+            remaining = len(tasks)
+            while remaining:
+                kind, payload = pages.get()
+                if kind == 'error':
+                    raise payload
+                if kind == 'done':
+                    remaining -= 1
+                    continue
+                yield from payload
+        finally:
+            # Unblock workers if the consumer stopped early
+            stop.set()
+            executor.shutdown(wait=False)
+
+    def _crawl_tagged_resources(self, client, region: str) -> Iterator[List[Tuple[str, Dict]]]:
+        paginator = client.get_paginator('get_resources')
+        for page in paginator.paginate(
+            ResourcesPerPage=100,
+            IncludeComplianceDetails=False,
+            ExcludeCompliantResources=False
+        ):
+            resources = []
+            for resource in page.get('ResourceTagMappingList', []):
+                arn = resource['ResourceARN']
+                resources.append((arn.split(':')[2], {
+                    'arn': arn,
+                    'tags': resource.get('Tags', []),
+                    'name': arn.split('/')[-1] if '/' in arn else arn.split(':')[-1]
+                }))
+            yield resources
+
+    def _crawl_ec2_instances(self, client, region: str) -> Iterator[List[Tuple[str, Dict]]]:
+        paginator = client.get_paginator('describe_instances')
+        for page in paginator.paginate():
+            resources = []
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    owner_id = instance.get('OwnerId', reservation.get('OwnerId', ''))
+                    resources.append(('ec2', {
+                        'arn': f"arn:aws:ec2:{region}:{owner_id}:instance/{instance['InstanceId']}",
+                        'tags': instance.get('Tags', []),
+                        'name': instance['InstanceId'],
+                        'state': instance.get('State', {}).get('Name'),
+                        'instance_type': instance.get('InstanceType')
+                    }))
+            yield resources
+
+    def _crawl_s3_buckets(self, client, region: str) -> Iterator[List[Tuple[str, Dict]]]:
+        resources = []
+        for bucket in client.list_buckets()['Buckets']:
             try:
-                rds_response = rds.describe_db_instances()
-                if 'rds' not in resources_by_type:
-                    resources_by_type['rds'] = []
-                for instance in rds_response['DBInstances']:
-                    if not any(r['arn'].endswith(instance['DBInstanceIdentifier']) for r in resources_by_type.get('rds', [])):
-                        resources_by_type['rds'].append({
-                            'arn': instance['DBInstanceArn'],
-                            'tags': instance.get('TagList', []),
-                            'name': instance['DBInstanceIdentifier']
-                        })
+                tags = client.get_bucket_tagging(Bucket=bucket['Name']).get('TagSet', [])
             except ClientError:
-                pass
-        
-            return resources_by_type
-        except ClientError as e:
-            raise Exception(f"Error fetching tagged resources: {str(e)}")
\ No newline at end of file
+                tags = []
+            resources.append(('s3', {
+                'arn': f"arn:aws:s3:::{bucket['Name']}",
+                'tags': tags,
+                'name': bucket['Name']
+            }))
+            if len(resources) == 100:
+                yield resources
+                resources = []
+        yield resources
+
+    def _crawl_rds_instances(self, client, region: str) -> Iterator[List[Tuple[str, Dict]]]:
+        paginator = client.get_paginator('describe_db_instances')
+        for page in paginator.paginate():
+            yield [
+                ('rds', {
+                    'arn': instance['DBInstanceArn'],
+                    'tags': instance.get('TagList', []),
+                    'name': instance['DBInstanceIdentifier']
+                })
+                for instance in page['DBInstances']
+            ]
+
+@lru_cache(maxsize=None)
+def get_aws_service() -> AWSService:
+    """The process-wide AWSService shared by every router."""
+    return AWSService()
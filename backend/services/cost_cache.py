@@ -0,0 +1,143 @@
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+
+from database import CostQueryCacheEntry, SessionLocal
+from services.aws_service import AWSService, get_aws_service
+
+
+class CostQueryCache:
+    """
+    Two-tier cache for Cost Explorer queries shared by the API and the agent.
+
+    Entries are keyed on the normalized request. An in-process LRU answers repeat
+    queries without I/O and a ``cost_query_cache`` table survives restarts and is
+    shared by every worker. Windows that include today (or days AWS may still
+    restate) expire after COST_CACHE_OPEN_TTL_MINUTES; closed windows are
+    effectively immutable and live for COST_CACHE_CLOSED_TTL_DAYS.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv('COST_CACHE_MAX_ENTRIES', '256'))
+        self._entries: 'OrderedDict[str, Tuple[datetime, Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    @staticmethod
+    def normalize(start_date: str, end_date: str, granularity: str = 'MONTHLY',
+                  group_by: Optional[List[str]] = None, metrics: Optional[List[str]] = None) -> Dict:
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'granularity': granularity.upper(),
+            # Group order decides the order of each group's Keys, so it is part of the key
+            'group_by': [key.upper() for key in (group_by or ['SERVICE'])],
+            'metrics': sorted(metrics or ['UnblendedCost']),
+        }
+
+    @staticmethod
+    def key_for(request: Dict) -> str:
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def ttl_for(end_date: str) -> timedelta:
+        restatement_days = int(os.getenv('COST_RESTATEMENT_DAYS', '3'))
+        closed_before = datetime.utcnow().date() - timedelta(days=restatement_days)
+        if datetime.strptime(end_date, '%Y-%m-%d').date() > closed_before:
+            return timedelta(minutes=float(os.getenv('COST_CACHE_OPEN_TTL_MINUTES', '60')))
+        return timedelta(days=float(os.getenv('COST_CACHE_CLOSED_TTL_DAYS', '30')))
+
+    def get_cost_and_usage(self, start_date: str, end_date: str, granularity: str = 'MONTHLY',
+                           group_by: Optional[List[str]] = None, metrics: Optional[List[str]] = None,
+                           aws_service: Optional[AWSService] = None) -> Dict:
+        request = self.normalize(start_date, end_date, granularity, group_by, metrics)
+        key = self.key_for(request)
+        now = datetime.utcnow()
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] > now:
+                self._entries.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return cached[1]
+
+        entry = self._read_db(key, now)
+        if entry is not None:
+            with self._lock:
+                self._counters['db_hits'] += 1
+            self._remember(key, entry[1], entry[0])
+            return entry[1]
+
+        with self._lock:
+            self._counters['misses'] += 1
+        aws_service = aws_service or get_aws_service()
+        response = aws_service.get_cost_and_usage(
+            request['start_date'], request['end_date'], granularity=request['granularity'],
+            group_by=request['group_by'], metrics=request['metrics']
+        )
+        response.pop('ResponseMetadata', None)
+        expires_at = now + self.ttl_for(end_date)
+        self._remember(key, response, expires_at)
+        self._write_db(key, request, response, expires_at)
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = sum(self._counters.values())
+            hits = self._counters['memory_hits'] + self._counters['db_hits']
+            return {
+                'memory_hits': self._counters['memory_hits'],
+                'db_hits': self._counters['db_hits'],
+                'misses': self._counters['misses'],
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+    def _remember(self, key: str, response: Dict, expires_at: datetime) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_db(self, key: str, now: datetime) -> Optional[Tuple[datetime, Dict]]:
+        db = SessionLocal()
+        try:
+            entry = db.query(CostQueryCacheEntry).get(key)
+            if entry is None or entry.expires_at <= now:
+                return None
+            return entry.expires_at, entry.response
+        except Exception as e:
+            print(f"Error reading cost cache: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def _write_db(self, key: str, request: Dict, response: Dict, expires_at: datetime) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(CostQueryCacheEntry(
+                key=key, request=request, response=response, expires_at=expires_at, created_at=datetime.utcnow()
+            ))
+            # Expired entries are only ever overwritten, so sweep them opportunistically
+            db.query(CostQueryCacheEntry).filter(
+                CostQueryCacheEntry.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Error writing cost cache: {str(e)}")
+        finally:
+            db.close()
+
+
+cost_cache = CostQueryCache()
@@ -0,0 +1,287 @@
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import CostEntry, CostIngestState, SessionLocal
+from services.aws_service import AWSService, get_aws_service
+from services.single_flight import cross_process_lock, single_flight
+
+# Cost Explorer groups by at most two dimensions per query, so the warehouse
+# stores one "view" per dimension pair. Queries are answered from the first view
+# that covers every requested dimension.
+COST_VIEWS = {
+    'service_region': ('SERVICE', 'REGION'),
+    'service_usage_type': ('SERVICE', 'USAGE_TYPE'),
+    'account_service': ('LINKED_ACCOUNT', 'SERVICE'),
+}
+
+DIMENSION_COLUMNS = {
+    'SERVICE': 'service',
+    'REGION': 'region',
+    'USAGE_TYPE': 'usage_type',
+    'LINKED_ACCOUNT': 'account',
+}
+
+# Single-flight key shared by background and manual ingests; forced ones join each
+# other under their own key and then take INGEST_KEY's lock
+INGEST_KEY = 'cost_ingest'
+FORCED_INGEST_KEY = 'cost_ingest_forced'
+
+# Cost Explorer refuses anything older than 14 months
+MAX_BACKFILL_DAYS = 395
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def ingest_due(db: Session) -> bool:
+    """True if any view has not been ingested within COST_INGEST_INTERVAL_HOURS."""
+    interval = timedelta(hours=_env_int('COST_INGEST_INTERVAL_HOURS', 6))
+    states = {state.view: state for state in db.query(CostIngestState).all()}
+    return any(
+        view not in states or not states[view].last_run or datetime.utcnow() - states[view].last_run > interval
+        for view in COST_VIEWS
+    )
+
+
+def ingest_costs(db: Session, aws_service: Optional[AWSService] = None, today: Optional[date] = None,
+                 force: bool = False) -> Dict[str, int]:
+    """
+    Incrementally load daily costs into ``cost_entries``.
+
+    For each view only the days after the last ingested one are fetched, plus any
+    day Cost Explorer still flagged as estimated and the last COST_RESTATEMENT_DAYS,
+    which AWS may restate. Those days are replaced in full. Returns rows written per view.
+    """
+    aws_service = aws_service or get_aws_service()
+    today = today or datetime.utcnow().date()
+    interval = timedelta(hours=_env_int('COST_INGEST_INTERVAL_HOURS', 6))
+    written = {}
+
+    for view, dimensions in COST_VIEWS.items():
+        state = db.query(CostIngestState).get(view)
+        if state and state.last_run and not force and datetime.utcnow() - state.last_run < interval:
+            continue
+
+        start = _window_start(db, view, state, today)
+        # End is exclusive; include today's (estimated) partial day
+        end = today + timedelta(days=1)
+        response = aws_service.get_cost_and_usage(
+            start.isoformat(), end.isoformat(), granularity='DAILY', group_by=list(dimensions)
+        )
+
+        rows = []
+        for period in response.get('ResultsByTime', []):
+            day = datetime.strptime(period['TimePeriod']['Start'], '%Y-%m-%d')
+            for group in period.get('Groups', []):
+                metric = group['Metrics']['UnblendedCost']
+                row = {
+                    'view': view,
+                    'date': day,
+                    'cost': float(metric['Amount']),
+                    'unit': metric.get('Unit'),
+                    'estimated': bool(period.get('Estimated', False)),
+                }
+                for dimension, key in zip(dimensions, group['Keys']):
+                    row[DIMENSION_COLUMNS[dimension]] = key
+                rows.append(row)
+
+        window_start = datetime.combine(start, datetime.min.time())
+        db.query(CostEntry).filter(
+            CostEntry.view == view, CostEntry.date >= window_start
+        ).delete(synchronize_session=False)
+        db.bulk_insert_mappings(CostEntry, rows)
+
+        if state is None:
+            state = CostIngestState(view=view)
+            db.add(state)
+        # Days before the window stay covered only if the window joins on to them
+        if state.covered_from is None or state.covered_to is None or state.covered_to < window_start:
+            state.covered_from = window_start
+        else:
+            state.covered_from = min(state.covered_from, window_start)
+        state.covered_to = datetime.combine(end, datetime.min.time())
+        state.last_run = datetime.utcnow()
+        db.commit()
+        written[view] = len(rows)
+
+    return written
+
+
+def ingest_costs_in_background() -> None:
+    """Start an ingest unless one is already running; concurrent workers take turns and skip fresh views."""
+    if not ingest_in_flight():
+        start_ingest()
+
+
+def ingest_in_flight() -> bool:
+    return single_flight.in_flight(INGEST_KEY) or single_flight.in_flight(FORCED_INGEST_KEY)
+
+
+def start_ingest(force: bool = False) -> Future:
+    """
+    Ingest in a session of its own under the ``cost_ingest`` single flight, so it never
+    overlaps another ingest in this or another worker; joins one already in flight here.
+    A forced ingest only joins another forced one: it waits out a normal ingest and then
+    re-fetches every view. The Future resolves to the rows written per view.
+    """
+    if force:
+        return single_flight.run(FORCED_INGEST_KEY, _forced_ingest)
+    return single_flight.run(INGEST_KEY, _ingest_with_own_session)
+
+
+def _forced_ingest() -> Dict[str, int]:
+    with cross_process_lock(INGEST_KEY):
+        return _ingest_with_own_session(force=True)
+
+
+def _ingest_with_own_session(force: bool = False) -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return ingest_costs(db, force=force)
+    except Exception as e:
+        db.rollback()
+        print(f"Error ingesting costs: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+def _window_start(db: Session, view: str, state: Optional[CostIngestState], today: date) -> date:
+    earliest = today - timedelta(days=min(_env_int('COST_BACKFILL_DAYS', 90), MAX_BACKFILL_DAYS))
+
+    if state is None or state.covered_to is None:
+        # Nothing ingested yet, or only rows from before the covered range was tracked
+        return earliest
+    first_estimated = db.query(func.min(CostEntry.date)).filter(
+        CostEntry.view == view, CostEntry.estimated.is_(True)
+    ).scalar()
+
+    candidates = [
+        state.covered_to.date(),
+        today - timedelta(days=_env_int('COST_RESTATEMENT_DAYS', 3)),
+    ]
+    if first_estimated is not None:
+        candidates.append(first_estimated.date())
+    return max(earliest, min(candidates))
+
+
+def view_for(dimensions: List[str]) -> str:
+    """The first view covering every dimension (SERVICE, REGION, USAGE_TYPE, LINKED_ACCOUNT)."""
+    wanted = {dimension.upper() for dimension in dimensions}
+    for view, view_dimensions in COST_VIEWS.items():
+        if wanted <= set(view_dimensions):
+            return view
+    raise ValueError(f"No cost view covers the dimensions {sorted(wanted)}")
+
+
+def is_covered(db: Session, view: str, start_date: str, end_date: str) -> bool:
+    """
+    True if the warehouse holds every day of [start_date, end_date) for ``view``. Goes by
+    the ingested range rather than the stored rows, as days without spend have none.
+    """
+    state = db.query(CostIngestState).get(view)
+    if state is None or state.covered_from is None or state.covered_to is None:
+        return False
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = min(datetime.strptime(end_date, '%Y-%m-%d').date(), datetime.utcnow().date() + timedelta(days=1))
+    return state.covered_from.date() <= start and state.covered_to.date() >= end
+
+
+def query_costs(db: Session, start_date: str, end_date: str, group_by: Optional[List[str]] = None,
+                granularity: str = 'DAILY', filters: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+    """
+    Aggregate warehouse costs for [start_date, end_date).
+
+    Args:
+        group_by: Dimensions to group by (SERVICE, REGION, USAGE_TYPE, LINKED_ACCOUNT).
+        granularity: DAILY, MONTHLY or TOTAL.
+        filters: Dimension -> allowed values.
+
+    Returns:
+        Rows of {'start', 'end', <dimension>: value..., 'amount', 'unit'} ordered by period.
+    """
+    group_by = [dimension.upper() for dimension in (group_by or [])]
+    filters = {dimension.upper(): values for dimension, values in (filters or {}).items()}
+    view = view_for(group_by + list(filters))
+    columns = [getattr(CostEntry, DIMENSION_COLUMNS[dimension]) for dimension in group_by]
+
+    query = db.query(CostEntry.date, *columns, func.sum(CostEntry.cost), func.max(CostEntry.unit)).filter(
+        CostEntry.view == view,
+        CostEntry.date >= datetime.strptime(start_date, '%Y-%m-%d'),
+        CostEntry.date < datetime.strptime(end_date, '%Y-%m-%d'),
+    )
+    for dimension, values in filters.items():
+        query = query.filter(getattr(CostEntry, DIMENSION_COLUMNS[dimension]).in_(values))
+    query = query.group_by(CostEntry.date, *columns)
+
+    # Days are grouped in SQL; coarser periods are rolled up here so the query stays portable
+    totals = defaultdict(float)
+    units = {}
+    for row in query:
+        day, keys, amount, unit = row[0].date(), tuple(row[1:-2]), row[-2], row[-1]
+        period = _period(day, granularity, start_date, end_date)
+        totals[(period, keys)] += amount or 0.0
+        units[(period, keys)] = unit
+
+    results = []
+    for (period, keys), amount in sorted(totals.items(), key=lambda item: (item[0][0], tuple(map(str, item[0][1])))):
+        entry = {'start': period[0], 'end': period[1]}
+        entry.update({dimension: key for dimension, key in zip(group_by, keys)})
+        entry['amount'] = amount
+        entry['unit'] = units[(period, keys)] or 'USD'
+        results.append(entry)
+    return results
+
+
+def _period(day: date, granularity: str, start_date: str, end_date: str):
+    granularity = granularity.upper()
+    if granularity == 'DAILY':
+        return day.isoformat(), (day + timedelta(days=1)).isoformat()
+    if granularity == 'MONTHLY':
+        month_start = day.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        # Clip to the requested window, like Cost Explorer does
+        return max(month_start.isoformat(), start_date), min(next_month.isoformat(), end_date)
+    if granularity == 'TOTAL':
+        return start_date, end_date
+    raise ValueError(f"Unsupported granularity: {granularity}")
+
+
+def to_cost_explorer_response(rows: List[Dict], group_by: List[str]) -> Dict:
+    """Shape query_costs() rows like a Cost Explorer get_cost_and_usage response."""
+    periods = {}
+    for row in rows:
+        period = periods.setdefault(row['start'], {
+            'TimePeriod': {'Start': row['start'], 'End': row['end']},
+            'Total': {},
+            'Groups': [],
+            'Estimated': False,
+        })
+        period['Groups'].append({
+            'Keys': [row[dimension.upper()] for dimension in group_by],
+            'Metrics': {'UnblendedCost': {'Amount': str(row['amount']), 'Unit': row['unit']}},
+        })
+    return {'GroupDefinitions': [{'Type': 'DIMENSION', 'Key': key.upper()} for key in group_by],
+            'ResultsByTime': [periods[start] for start in sorted(periods)],
+            'DimensionValueAttributes': []}
+
+
+def get_cost_summary(db: Session, start_date: str, end_date: str, granularity: str = 'MONTHLY',
+                     group_by: Optional[List[str]] = None) -> Optional[Dict]:
+    """Cost Explorer-shaped costs from the warehouse, or None if it does not cover the window yet."""
+    group_by = group_by or ['SERVICE']
+    try:
+        view = view_for(group_by)
+    except ValueError:
+        return None
+    if not is_covered(db, view, start_date, end_date):
+        return None
+    rows = query_costs(db, start_date, end_date, group_by=group_by, granularity=granularity)
+    return to_cost_explorer_response(rows, group_by)
@@ -0,0 +1,380 @@
+from collections import OrderedDict
+from itertools import islice, product
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import os
+import threading
+
+from sqlalchemy.orm import Session
+
+from database import AWSResource
+from services.inventory_index import InventoryIndex, parse_arn
+from services import vpc_topology
+from services.inventory_store import INVENTORY_SNAPSHOT, snapshot_state
+
+# Service types the diagram editor has icons for (frontend AwsIcons)
+SERVICE_TYPES = (
+    'EC2', 'Lambda', 'ECS', 'EKS', 'Fargate', 'S3', 'EBS', 'EFS', 'RDS', 'DynamoDB', 'ElastiCache', 'Aurora',
+    'VPC', 'LoadBalancer', 'CloudFront', 'APIGateway', 'Route53', 'IAM', 'Cognito', 'WAF', 'SNS', 'SQS',
+    'EventBridge'
+)
+
+# (ARN service, resource kind) -> service type; kind None matches any resource of the service
+ARN_SERVICE_TYPES = {
+    ('ec2', 'instance'): 'EC2',
+    ('ec2', 'volume'): 'EBS',
+    ('ec2', 'vpc'): 'VPC',
+    ('lambda', None): 'Lambda',
+    ('ecs', None): 'ECS',
+    ('eks', None): 'EKS',
+    ('s3', None): 'S3',
+    ('elasticfilesystem', None): 'EFS',
+    ('rds', 'db'): 'RDS',
+    ('rds', 'cluster'): 'Aurora',
+    ('dynamodb', None): 'DynamoDB',
+    ('elasticache', None): 'ElastiCache',
+    ('elasticloadbalancing', None): 'LoadBalancer',
+    ('cloudfront', None): 'CloudFront',
+    ('apigateway', None): 'APIGateway',
+    ('route53', None): 'Route53',
+    ('iam', None): 'IAM',
+    ('cognito-idp', None): 'Cognito',
+    ('wafv2', None): 'WAF',
+    ('waf', None): 'WAF',
+    ('waf-regional', None): 'WAF',
+    ('sns', None): 'SNS',
+    ('sqs', None): 'SQS',
+    ('events', None): 'EventBridge',
+}
+
+# Layers top to bottom: entry points, load balancing, compute, messaging, data, shared infrastructure
+TIERS = (
+    ('Route53', 'WAF', 'CloudFront', 'Cognito'),
+    ('APIGateway', 'LoadBalancer'),
+    ('EC2', 'ECS', 'EKS', 'Fargate', 'Lambda'),
+    ('SNS', 'SQS', 'EventBridge'),
+    ('RDS', 'Aurora', 'DynamoDB', 'ElastiCache', 'S3', 'EFS', 'EBS'),
+    ('VPC', 'IAM'),
+)
+TIER_OF = {service_type: tier for tier, types in enumerate(TIERS) for service_type in types}
+
+_COMPUTE = ('EC2', 'ECS', 'EKS', 'Lambda')
+# Connections drawn between service types when both are present
+DEFAULT_LINKS = (
+    [('Route53', target) for target in ('CloudFront', 'LoadBalancer', 'APIGateway')]
+    + [('WAF', target) for target in ('CloudFront', 'LoadBalancer', 'APIGateway')]
+    + [('CloudFront', target) for target in ('LoadBalancer', 'APIGateway', 'S3')]
+    + [('Cognito', 'APIGateway'), ('APIGateway', 'Lambda')]
+    + [('LoadBalancer', target) for target in ('EC2', 'ECS', 'EKS')]
+    + [(source, target) for source in _COMPUTE for target in ('RDS', 'Aurora', 'DynamoDB', 'ElastiCache', 'S3')]
+    + [('Lambda', 'SNS'), ('Lambda', 'SQS'), ('Lambda', 'EventBridge')]
+    + [('SNS', 'SQS'), ('SQS', 'Lambda'), ('EventBridge', 'Lambda')]
+    + [('EC2', 'EBS'), ('EC2', 'EFS'), ('ECS', 'EFS')]
+    + [('VPC', 'EC2')]
+)
+
+# Tags that put resources into the same application; resource diagrams only link resources
+# within one application
+GROUP_TAG_KEYS = ('aws:cloudformation:stack-name', 'Application', 'application', 'App', 'app',
+                  'Project', 'project', 'Service', 'service')
+# Cap on edges drawn for one link inside one application
+EDGES_PER_LINK = 64
+
+# Same box size and edge style as nodes placed in the editor
+NODE_WIDTH = 150
+NODE_HEIGHT = 92
+X_STEP = NODE_WIDTH + 60
+Y_STEP = NODE_HEIGHT + 48
+LAYER_GAP = 80
+# Wide layers wrap into rows of at most this many nodes
+MAX_ROW_NODES = int(os.getenv('DIAGRAM_MAX_ROW_NODES', '24'))
+# Barycenter ordering passes (one down and one up sweep each)
+ORDERING_SWEEPS = 4
+
+LAYOUT_CACHE_SIZE = 16
+# Layouts by (inventory hash, granularity, suggested links)
+_layouts: "OrderedDict[tuple, Dict]" = OrderedDict()
+# Inventory hash by inventory snapshot version
+_hashes: Dict[int, str] = {}
+_lock = threading.Lock()
+
+
+def service_type(arn: str) -> Optional[str]:
+    """Editor service type of a resource, or None if the editor has no icon for it."""
+    try:
+        parts = parse_arn(arn)
+    except ValueError:
+        return None
+    kind = parts.resource.replace(':', '/').split('/')[0]
+    return ARN_SERVICE_TYPES.get((parts.service, kind)) or ARN_SERVICE_TYPES.get((parts.service, None))
+
+
+def inventory_hash(db: Session) -> str:
+    """Hash of every stored resource's id and content hash; computed once per inventory version."""
+    state = snapshot_state(db, INVENTORY_SNAPSHOT)
+    with _lock:
+        if state is not None and state[0] in _hashes:
+            return _hashes[state[0]]
+
+    digest = hashlib.sha256()
+    for resource_id, content_hash in db.query(AWSResource.id, AWSResource.content_hash).order_by(
+        AWSResource.id
+    ).yield_per(1000):
+        digest.update(f"{resource_id}\0{content_hash}\n".encode())
+    value = digest.hexdigest()
+
+    if state is not None:
+        with _lock:
+            _hashes.clear()
+            _hashes[state[0]] = value
+    return value
+
+
+def generate(db: Session, granularity: str = 'service',
+             suggest_links: Optional[Callable[[List[str]], Sequence[Sequence[str]]]] = None,
+             topology: Optional[Dict] = None) -> Dict:
+    """
+    React Flow diagram of the stored inventory, laid out in layers.
+
+    ``granularity`` is ``service`` (one node per service type, with its resource count)
+    or ``resource`` (one node per resource). ``suggest_links`` is given the service
+    types present and returns ``[source, target]`` pairs to connect instead of
+    ``DEFAULT_LINKS``; pairs naming absent types are dropped. Results are cached by
+    inventory hash, so the same inventory is only laid out (and sent for
+    suggestions) once.
+
+    ``topology`` (services/vpc_topology.py) adds VPCs and instances the inventory
+    lacks, and links each instance to its VPC.
+    """
+    key = (inventory_hash(db), granularity, suggest_links is not None, topology and topology['collected_at'])
+    with _lock:
+        if key in _layouts:
+            _layouts.move_to_end(key)
+            return _layouts[key]
+
+    resources = [
+        (resource_id, (data or {}).get('name'), tags)
+        for resource_id, data, tags in db.query(AWSResource.id, AWSResource.data, AWSResource.tags).order_by(
+            AWSResource.id
+        ).yield_per(1000)
+    ]
+    parents = {}
+    if topology:
+        resources, parents = _with_topology(resources, topology)
+    present = sorted({service_type(arn) for arn, _, _ in resources} - {None}, key=SERVICE_TYPES.index)
+    links = DEFAULT_LINKS
+    if suggest_links is not None and present:
+        try:
+            links = valid_links(suggest_links(present), present)
+        except Exception as e:
+            print(f"Error suggesting diagram links, using defaults: {str(e)}")
+
+    diagram = layout(*build_graph(resources, granularity, links, parents))
+    with _lock:
+        _layouts[key] = diagram
+        while len(_layouts) > LAYOUT_CACHE_SIZE:
+            _layouts.popitem(last=False)
+    return diagram
+
+
+def _with_topology(resources: List[Tuple[str, Optional[str], Optional[List[Dict]]]],
+                   topology: Dict) -> Tuple[List[Tuple[str, Optional[str], Optional[List[Dict]]]], Dict[str, str]]:
+    # The topology's ARNs may carry an account id the inventory's lack (or the other
+    # way round); the index matches them so a resource is drawn once, under its inventory ARN
+    index = InventoryIndex()
+    for arn, _, _ in resources:
+        try:
+            index.add('resource', {'arn': arn}, merge=False)
+        except ValueError:
+            pass
+
+    def canonical(arn: str) -> str:
+        known = index.get(arn)
+        return known['arn'] if known is not None else arn
+
+    extra, parents = vpc_topology.diagram_input(topology)
+    resources = resources + [resource for resource in extra if resource[0] not in index]
+    return resources, {canonical(child): canonical(parent) for child, parent in parents.items()}
+
+
+def valid_links(pairs: Iterable[Sequence[str]], present: Sequence[str]) -> List[Tuple[str, str]]:
+    allowed = set(present)
+    links = []
+    for pair in pairs:
+        if len(pair) == 2 and pair[0] in allowed and pair[1] in allowed and pair[0] != pair[1]:
+            links.append((pair[0], pair[1]))
+    return links
+
+
+def build_graph(resources: Iterable[Tuple[str, Optional[str], Optional[List[Dict]]]], granularity: str,
+                links: Iterable[Tuple[str, str]],
+                parents: Optional[Dict[str, str]] = None) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """
+    Nodes and edges for ``(arn, name, tags)`` resources; resources without an editor
+    icon are left out. ``parents`` maps a resource's ARN to its container's (an
+    instance's VPC) and adds an edge between them. Returns ``(nodes, edges)``, each node a dict with ``id``,
+    ``serviceType``, ``label``, ``layer`` and a ``sort`` key for the initial order.
+    """
+    if granularity == 'service':
+        counts = {}
+        for arn, _, _ in resources:
+            kind = service_type(arn)
+            if kind:
+                counts[kind] = counts.get(kind, 0) + 1
+        nodes = [
+            {
+                'id': kind,
+                'serviceType': kind,
+                'label': kind if count == 1 else f"{kind} ({count})",
+                'count': count,
+                'layer': TIER_OF[kind],
+                'sort': (SERVICE_TYPES.index(kind),)
+            }
+            for kind, count in counts.items()
+        ]
+        edges = [(source, target) for source, target in dict.fromkeys(links) if source in counts and target in counts]
+        return nodes, edges
+
+    if granularity != 'resource':
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    nodes = []
+    node_ids = {}
+    groups: Dict[str, Dict[str, List[str]]] = {}
+    for arn, name, tags in resources:
+        kind = service_type(arn)
+        if not kind:
+            continue
+        node_id = f"{kind}-{hashlib.sha1(arn.encode()).hexdigest()[:12]}"
+        node_ids[arn] = node_id
+        group = _group(tags)
+        nodes.append({
+            'id': node_id,
+            'serviceType': kind,
+            'label': name or parse_arn(arn).resource_id,
+            'arn': arn,
+            'layer': TIER_OF[kind],
+            'sort': (group or '\uffff', SERVICE_TYPES.index(kind), name or arn)
+        })
+        if group:
+            groups.setdefault(group, {}).setdefault(kind, []).append(node_id)
+
+    edges = []
+    for by_type in groups.values():
+        for source, target in dict.fromkeys(links):
+            edges.extend(islice(product(by_type.get(source, []), by_type.get(target, [])), EDGES_PER_LINK))
+    for child, parent in (parents or {}).items():
+        if child in node_ids and parent in node_ids:
+            edges.append((node_ids[parent], node_ids[child]))
+    return nodes, list(dict.fromkeys(edges))
+
+
+def layout(nodes: List[Dict], edges: List[Tuple[str, str]]) -> Dict:
+    """
+    Place nodes in their layers, order each layer by the barycenter of its neighbours
+    to cut crossings, wrap wide layers into rows, and emit the editor's node and edge
+    format. Each pass is O(nodes log nodes + edges).
+    """
+    layers: Dict[int, List[Dict]] = {}
+    for node in sorted(nodes, key=lambda node: node['sort']):
+        layers.setdefault(node['layer'], []).append(node)
+    order = [layers[layer] for layer in sorted(layers)]
+
+    neighbours: Dict[str, List[str]] = {node['id']: [] for node in nodes}
+    for source, target in edges:
+        neighbours[source].append(target)
+        neighbours[target].append(source)
+    layer_index = {node['id']: i for i, layer_nodes in enumerate(order) for node in layer_nodes}
+
+    for _ in range(ORDERING_SWEEPS):
+        for sweep in (range(1, len(order)), range(len(order) - 2, -1, -1)):
+            rank = _ranks(order)
+            for i in sweep:
+                # Down sweeps look at layers above, up sweeps at layers below
+                fixed = (lambda j: j < i) if sweep.step == 1 else (lambda j: j > i)
+                order[i] = _by_barycenter(order[i], neighbours, layer_index, rank, fixed)
+                rank.update(_ranks([order[i]]))
+
+    positions = {}
+    y = 0
+    for layer_nodes in order:
+        for start in range(0, len(layer_nodes), MAX_ROW_NODES):
+            row = layer_nodes[start:start + MAX_ROW_NODES]
+            for column, node in enumerate(row):
+                positions[node['id']] = (round((column - (len(row) - 1) / 2) * X_STEP, 2), y)
+            y += Y_STEP
+        y += LAYER_GAP
+
+    return {
+        'nodes': [_node(node, positions[node['id']]) for layer_nodes in order for node in layer_nodes],
+        'edges': [_edge(source, target, positions[source], positions[target]) for source, target in edges],
+    }
+
+
+def _ranks(order: List[List[Dict]]) -> Dict[str, float]:
+    # Position within the layer scaled to 0..1, so layers of different widths compare
+    return {
+        node['id']: (i + 0.5) / len(layer_nodes)
+        for layer_nodes in order for i, node in enumerate(layer_nodes)
+    }
+
+
+def _by_barycenter(layer_nodes: List[Dict], neighbours: Dict[str, List[str]], layer_index: Dict[str, int],
+                   rank: Dict[str, float], fixed: Callable[[int], bool]) -> List[Dict]:
+    keys = {}
+    for node in layer_nodes:
+        placed = [rank[other] for other in neighbours[node['id']] if fixed(layer_index[other])]
+        # Nodes without placed neighbours keep their current place
+        keys[node['id']] = sum(placed) / len(placed) if placed else rank[node['id']]
+    return sorted(layer_nodes, key=lambda node: (keys[node['id']], rank[node['id']]))
+
+
+def _group(tags: Optional[List[Dict]]) -> Optional[str]:
+    values = {tag.get('Key'): tag.get('Value') for tag in tags or []}
+    for key in GROUP_TAG_KEYS:
+        if values.get(key):
+            return f"{key}={values[key]}"
+    return None
+
+
+def _node(node: Dict, position: Tuple[float, float]) -> Dict:
+    data = {'label': node['label'], 'serviceType': node['serviceType']}
+    for extra in ('count', 'arn'):
+        if extra in node:
+            data[extra] = node[extra]
+    x, y = position
+    return {
+        'id': node['id'],
+        'type': 'awsService',
+        'position': {'x': x, 'y': y},
+        'data': data,
+        'zIndex': 999,
+        'width': NODE_WIDTH,
+        'height': NODE_HEIGHT,
+        'selected': False,
+        'dragging': False,
+        'positionAbsolute': {'x': x, 'y': y},
+    }
+
+
+def _edge(source: str, target: str, source_position: Tuple[float, float],
+          target_position: Tuple[float, float]) -> Dict:
+    if source_position[1] < target_position[1]:
+        source_handle, target_handle = 'bottom-source', 'top-target'
+    elif source_position[1] > target_position[1]:
+        source_handle, target_handle = 'top-source', 'bottom-target'
+    elif source_position[0] < target_position[0]:
+        source_handle, target_handle = 'right-source', 'left-target'
+    else:
+        source_handle, target_handle = 'left-source', 'right-target'
+    return {
+        'type': 'straight',
+        'markerEnd': {'type': 'arrowclosed'},
+        'style': {'stroke': '#555'},
+        'source': source,
+        'sourceHandle': source_handle,
+        'target': target,
+        'targetHandle': target_handle,
+        'animated': False,
+        'id': f"reactflow__edge-{source}{source_handle}-{target}{target_handle}",
+    }
@@ -0,0 +1,211 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import copy
+import json
+import os
+import threading
+
+import jsonpatch
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import ArchitectureDiagram, DiagramVersion
+
+# Fold pending patches into a new base after this many versions...
+COMPACT_EVERY = int(os.getenv('DIAGRAM_COMPACT_EVERY', '20'))
+# ...or once they add up to this share of the base's size
+COMPACT_RATIO = 0.5
+# Former bases kept for version history; older versions are pruned at compaction
+HISTORY_SNAPSHOTS = int(os.getenv('DIAGRAM_HISTORY_SNAPSHOTS', '5'))
+HEAD_CACHE_SIZE = 64
+
+
+class VersionConflict(Exception):
+    def __init__(self, current_version: int):
+        super().__init__(f"Diagram is at version {current_version}")
+        self.current_version = current_version
+
+
+class VersionNotFound(Exception):
+    pass
+
+
+# Materialized heads by (diagram id, version); an entry never goes stale because
+# every write moves the version
+_heads: "OrderedDict[tuple, Dict]" = OrderedDict()
+_heads_lock = threading.Lock()
+# Heads written in a session wait here until it commits: a concurrent writer may
+# win the same version number, and the loser's rollback must not leave its data cached
+PENDING_HEADS = 'diagram_store.pending_heads'
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_heads(session: Session) -> None:
+    for key, data in session.info.pop(PENDING_HEADS, {}).items():
+        _cache_head(key, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending_heads(session: Session) -> None:
+    session.info.pop(PENDING_HEADS, None)
+
+
+def etag(diagram: ArchitectureDiagram) -> str:
+    return f'"diagram-{diagram.id}-v{diagram.version or 0}"'
+
+
+def head(db: Session, diagram: ArchitectureDiagram) -> Dict[str, Any]:
+    """Current data: the base snapshot with the pending patches applied."""
+    key = (diagram.id, diagram.version or 0)
+    # A version this session wrote but has not committed yet is only its own to see
+    pending = db.info.get(PENDING_HEADS, {})
+    if key in pending:
+        return pending[key]
+
+    with _heads_lock:
+        if key in _heads:
+            _heads.move_to_end(key)
+            return _heads[key]
+
+    data = _replay(db, diagram.id, diagram.diagram_data or {}, diagram.base_version or 0, diagram.version or 0)
+    _cache_head(key, data)
+    return data
+
+
+def _cache_head(key: tuple, data: Dict[str, Any]) -> None:
+    with _heads_lock:
+        _heads[key] = data
+        _heads.move_to_end(key)
+        while len(_heads) > HEAD_CACHE_SIZE:
+            _heads.popitem(last=False)
+
+
+def data_at(db: Session, diagram: ArchitectureDiagram, version: int) -> Dict[str, Any]:
+    """Data at an earlier ``version``, replayed from the nearest snapshot before it."""
+    current = diagram.version or 0
+    if version > current or version < 0:
+        raise VersionNotFound(f"Version {version} does not exist")
+    if version == current:
+        return head(db, diagram)
+    if version >= (diagram.base_version or 0):
+        return _replay(db, diagram.id, diagram.diagram_data or {}, diagram.base_version or 0, version)
+
+    snapshot = db.query(DiagramVersion).filter(
+        DiagramVersion.diagram_id == diagram.id,
+        DiagramVersion.version <= version,
+        DiagramVersion.snapshot.isnot(None)
+    ).order_by(DiagramVersion.version.desc()).first()
+    if snapshot is None:
+        raise VersionNotFound(f"Version {version} is no longer kept")
+    return _replay(db, diagram.id, snapshot.snapshot, snapshot.version, version)
+
+
+def versions(db: Session, diagram: ArchitectureDiagram) -> List[Dict[str, Any]]:
+    """Kept versions, newest first, with the size of each delta."""
+    rows = db.query(DiagramVersion).filter(DiagramVersion.diagram_id == diagram.id).order_by(
+        DiagramVersion.version.desc()
+    )
+    return [
+        {
+            'version': row.version,
+            'operations': len(row.patch or []),
+            'patch_bytes': _size(row.patch) if row.patch is not None else 0,
+            'snapshot': row.snapshot is not None,
+            'created_at': row.created_at,
+        }
+        for row in rows
+    ]
+
+
+def save(db: Session, diagram: ArchitectureDiagram, data: Dict[str, Any]) -> bool:
+    """Store full ``data`` as the next version, as the patch from the current head. Returns False if unchanged."""
+    patch = jsonpatch.make_patch(head(db, diagram), data).patch
+    if not patch:
+        return False
+    _append(db, diagram, patch, data)
+    return True
+
+
+def apply_patch(db: Session, diagram: ArchitectureDiagram, patch: List[Dict], base_version: int) -> Dict[str, Any]:
+    """
+    Apply a client's JSON-Patch made against ``base_version``.
+    Raises VersionConflict if the diagram has moved on, and jsonpatch/jsonpointer
+    errors if the patch does not apply.
+    """
+    if base_version != (diagram.version or 0):
+        raise VersionConflict(diagram.version or 0)
+    data = jsonpatch.apply_patch(head(db, diagram), patch)
+    if patch:
+        _append(db, diagram, patch, data)
+    return data
+
+
+def diagram_stats(data: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    data = data or {}
+    return {
+        'node_count': len(data.get('nodes') or []),
+        'edge_count': len(data.get('edges') or []),
+        'size_bytes': _size(data),
+    }
+
+
+def _append(db: Session, diagram: ArchitectureDiagram, patch: List[Dict], data: Dict[str, Any]) -> None:
+    version = (diagram.version or 0) + 1
+    db.add(DiagramVersion(diagram_id=diagram.id, version=version, patch=patch))
+    diagram.version = version
+    for column, value in diagram_stats(data).items():
+        setattr(diagram, column, value)
+
+    base_version = diagram.base_version or 0
+    pending = db.query(DiagramVersion.patch).filter(
+        DiagramVersion.diagram_id == diagram.id,
+        DiagramVersion.version > base_version,
+        DiagramVersion.version < version
+    ).all()
+    pending_bytes = sum(_size(row.patch) for row in pending) + _size(patch)
+    if len(pending) + 1 >= COMPACT_EVERY or pending_bytes >= _size(diagram.diagram_data or {}) * COMPACT_RATIO:
+        _compact(db, diagram, data)
+
+    db.info.setdefault(PENDING_HEADS, {})[(diagram.id, version)] = copy.deepcopy(data)
+
+
+def _compact(db: Session, diagram: ArchitectureDiagram, data: Dict[str, Any]) -> None:
+    # Keep the old base as a snapshot for history, then make the head the new base
+    old_base_version = diagram.base_version or 0
+    row = db.query(DiagramVersion).filter(
+        DiagramVersion.diagram_id == diagram.id, DiagramVersion.version == old_base_version
+    ).first()
+    if row is None:
+        row = DiagramVersion(diagram_id=diagram.id, version=old_base_version)
+        db.add(row)
+    row.snapshot = diagram.diagram_data
+    db.flush()
+
+    diagram.diagram_data = copy.deepcopy(data)
+    diagram.base_version = diagram.version
+
+    kept = db.query(DiagramVersion.version).filter(
+        DiagramVersion.diagram_id == diagram.id, DiagramVersion.snapshot.isnot(None)
+    ).order_by(DiagramVersion.version.desc()).offset(HISTORY_SNAPSHOTS - 1).first()
+    if kept is not None:
+        db.query(DiagramVersion).filter(
+            DiagramVersion.diagram_id == diagram.id, DiagramVersion.version < kept.version
+        ).delete(synchronize_session=False)
+
+
+def _replay(db: Session, diagram_id: int, base: Dict[str, Any], from_version: int, to_version: int) -> Dict[str, Any]:
+    data = copy.deepcopy(base)
+    if to_version <= from_version:
+        return data
+    rows = db.query(DiagramVersion.patch).filter(
+        DiagramVersion.diagram_id == diagram_id,
+        DiagramVersion.version > from_version,
+        DiagramVersion.version <= to_version
+    ).order_by(DiagramVersion.version)
+    for row in rows:
+        data = jsonpatch.apply_patch(data, row.patch, in_place=True)
+    return data
+
+
+def _size(data: Any) -> int:
+    return len(json.dumps(data, separators=(',', ':')))
@@ -0,0 +1,46 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Default number of concurrent blocking calls per backend, overridable with
+# <BACKEND>_MAX_CONCURRENCY (e.g. AWS_MAX_CONCURRENCY=32)
+BACKEND_CONCURRENCY = {
+    'aws': 16,
+    'openai': 8,
+    'db': 8,
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def get_executor(backend: str) -> ThreadPoolExecutor:
+    """The bounded thread pool that runs blocking calls for ``backend``."""
+    executor = _executors.get(backend)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(backend)
+            if executor is None:
+                max_workers = int(os.getenv(f'{backend.upper()}_MAX_CONCURRENCY', BACKEND_CONCURRENCY.get(backend, 4)))
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{backend}-io')
+                _executors[backend] = executor
+    return executor
+
+
+async def run_blocking(backend: str, func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking boto3/OpenAI call off the event loop.
+
+    Each backend gets its own pool, so a slow Trusted Advisor crawl can only ever
+    tie up the AWS pool, never the loop itself or the OpenAI pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(backend), functools.partial(func, *args, **kwargs))
+
+
+def submit(backend: str, func: Callable, *args, **kwargs) -> Future:
+    """Fire-and-forget variant of run_blocking for work no request is waiting on."""
+    return get_executor(backend).submit(func, *args, **kwargs)
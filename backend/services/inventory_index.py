@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class ArnParts(NamedTuple):
+    partition: str
+    service: str
+    region: str
+    account: str
+    resource: str
+
+    @property
+    def resource_id(self) -> str:
+        """Short resource id, e.g. ``i-0abc`` for ``instance/i-0abc`` or ``mydb`` for ``db:mydb``."""
+        return self.resource.replace(':', '/').split('/')[-1]
+
+
+def parse_arn(arn: str) -> ArnParts:
+    """Split an ARN into its parts. Raises ValueError for anything that is not an ARN."""
+    parts = arn.split(':', 5)
+    if len(parts) != 6 or parts[0] != 'arn':
+        raise ValueError(f"Invalid ARN: {arn}")
+    return ArnParts(*parts[1:])
+
+
+class InventoryIndex:
+    """
+    In-memory inventory keyed by parsed ARN.
+
+    Membership checks, de-duplication and lookups are O(1), replacing the linear
+    ``any(r['arn'].endswith(...))`` scans over the per-type lists. Resources are
+    also indexed by (service, short resource id) so callers that only know an
+    instance id or bucket name can find the full record.
+    """
+
+    def __init__(self):
+        self._by_key: Dict[ArnParts, Dict] = {}
+        self._by_type: Dict[str, List[Dict]] = {}
+        self._by_resource_id: Dict[Tuple[str, str], List[ArnParts]] = {}
+
+    @classmethod
+    def from_resources(cls, resources_by_type: Dict[str, List[Dict]]) -> 'InventoryIndex':
+        index = cls()
+        for resource_type, items in resources_by_type.items():
+            for item in items:
+                index.add(resource_type, item)
+        return index
+
+    def add(self, resource_type: str, item: Dict, merge: bool = True) -> bool:
+        """
+        Add a resource. Returns True if it was new.
+
+        When the ARN is already known and ``merge`` is set, keys missing from the
+        stored record are filled in from ``item`` so later, richer sources (e.g.
+        describe calls) can enrich what the tagging API returned.
+        """
+        key = parse_arn(item['arn'])
+        existing = self._by_key.get(key) or self._match_without_account(key)
+        if existing is not None:
+            if merge:
+                for field, value in item.items():
+                    if not existing.get(field) and value:
+                        existing[field] = value
+            return False
+
+        self._by_key[key] = item
+        self._by_type.setdefault(resource_type, []).append(item)
+        self._by_resource_id.setdefault((key.service, key.resource_id), []).append(key)
+        return True
+
+    def _match_without_account(self, key: ArnParts) -> Optional[Dict]:
+        # Some sources (and moto) omit the account id from ARNs; treat a missing
+        # account as matching the same resource in the same region
+        for candidate in self._by_resource_id.get((key.service, key.resource_id), []):
+            if candidate.resource == key.resource and candidate.region == key.region \
+                    and candidate.partition == key.partition and (not candidate.account or not key.account):
+                return self._by_key[candidate]
+        return None
+
+    def ensure_type(self, resource_type: str) -> None:
+        self._by_type.setdefault(resource_type, [])
+
+    def get(self, arn: str) -> Optional[Dict]:
+        """The stored resource for ``arn``, matched the same way ``add`` de-duplicates."""
+        try:
+            key = parse_arn(arn)
+        except ValueError:
+            return None
+        return self._by_key.get(key) or self._match_without_account(key)
+
+    def find(self, service: str, resource_id: str) -> List[Dict]:
+        """All resources of ``service`` whose short id is ``resource_id`` (one per region/account)."""
+        return [self._by_key[key] for key in self._by_resource_id.get((service, resource_id), [])]
+
+    def by_type(self, resource_type: str) -> List[Dict]:
+        return self._by_type.get(resource_type, [])
+
+    def types(self) -> Iterable[str]:
+        return self._by_type.keys()
+
+    def to_dict(self) -> Dict[str, List[Dict]]:
+        """The ``resources_by_type`` shape used by the API and the database layer."""
+        return {resource_type: list(items) for resource_type, items in self._by_type.items()}
+
+    def __contains__(self, arn: str) -> bool:
+        return self.get(arn) is not None
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self._by_key.values())
+
+    def __len__(self) -> int:
+        return len(self._by_key)
@@ -0,0 +1,323 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+
+from sqlalchemy import JSON, Column, MetaData, String, Table, bindparam, case, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import AWSResource, DatasetSnapshot, InventorySummary, ResourceTag
+from services.inventory_index import parse_arn
+
+INVENTORY_SNAPSHOT = "inventory"
+TAG_INDEX_SNAPSHOT = "resource_tags"
+SUMMARY_SNAPSHOT = "inventory_summary"
+SUMMARY_DIMENSIONS = ('resource_type', 'service', 'region', 'account')
+# Rows per INSERT ... ON CONFLICT statement / ids per DELETE ... IN
+WRITE_BATCH_SIZE = 500
+
+# Resources reported during one write, merged across sources, by match key;
+# private to the writing connection
+_staged = Table(
+    'inventory_staged', MetaData(),
+    Column('match_key', String, primary_key=True),
+    Column('id', String, nullable=False),
+    Column('resource_type', String),
+    Column('data', JSON),
+    prefixes=['TEMPORARY']
+)
+
+
+def resource_hash(resource_type: str, item: Dict) -> str:
+    payload = json.dumps({'type': resource_type, 'data': item}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def write_snapshot(db: Session, resources_by_type: Dict[str, List[Dict]]) -> Dict[str, int]:
+    """Replace the stored inventory with an already materialized ``resources_by_type``."""
+    return write_snapshot_stream(db, (
+        (resource_type, item) for resource_type, items in resources_by_type.items() for item in items
+    ))
+
+
+def write_snapshot_stream(db: Session, resources: Iterable[Tuple[str, Dict]],
+                          batch_size: int = WRITE_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Replace the stored inventory with the ``(resource_type, item)`` stream, in one transaction.
+
+    The stream is consumed in fixed-size batches, so memory stays flat however many
+    resources the account has. Each batch is staged in a temporary table: a resource
+    reported again by another source (tagging API vs describe call), possibly in a
+    later batch, has its missing fields filled in there rather than being duplicated.
+    Once the stream is done, the merged resources are hashed page by page and only
+    new or changed rows are written, with INSERT ... ON CONFLICT DO UPDATE; rows not
+    staged in this run are deleted in bulk. Readers never see an empty or
+    half-written inventory, and an unchanged 50k-resource account writes nothing
+    but the snapshot marker.
+    """
+    now = datetime.utcnow()
+    stats = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    try:
+        if snapshot_state(db, TAG_INDEX_SNAPSHOT) is None:
+            rebuild_tag_index(db)
+        summary_missing = snapshot_state(db, SUMMARY_SNAPSHOT) is None
+        if summary_missing:
+            _backfill_arn_columns(db)
+
+        db.execute(text(f"DROP TABLE IF EXISTS {_staged.name}"))
+        _staged.create(bind=db.connection())
+
+        batch = []
+        for resource in resources:
+            batch.append(resource)
+            if len(batch) >= batch_size:
+                _stage_batch(db, batch, now)
+                batch = []
+        if batch:
+            _stage_batch(db, batch, now)
+
+        last_key = None
+        while True:
+            query = select(_staged).order_by(_staged.c.match_key).limit(batch_size)
+            if last_key is not None:
+                query = query.where(_staged.c.match_key > last_key)
+            page = db.execute(query).fetchall()
+            if not page:
+                break
+            _write_page(db, page, now, stats)
+            last_key = page[-1].match_key
+
+        stats['deleted'] = db.execute(
+            AWSResource.__table__.delete().where(~AWSResource.id.in_(select(_staged.c.id)))
+        ).rowcount
+        db.execute(ResourceTag.__table__.delete().where(~ResourceTag.resource_id.in_(select(_staged.c.id))))
+        db.execute(text(f"DROP TABLE {_staged.name}"))
+
+        changed = bool(stats['inserted'] or stats['updated'] or stats['deleted'])
+        mark_snapshot(db, INVENTORY_SNAPSHOT, changed=changed, stats=stats, updated_at=now)
+        mark_snapshot(db, TAG_INDEX_SNAPSHOT, changed=changed, updated_at=now)
+        if changed or summary_missing:
+            rebuild_summary(db)
+        mark_snapshot(db, SUMMARY_SNAPSHOT, changed=changed or summary_missing, updated_at=now)
+        db.commit()
+        return stats
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _stage_batch(db: Session, batch: List[Tuple[str, Dict]], now: datetime) -> None:
+    # De-duplicate within the batch, filling in fields a second source adds
+    items = {}
+    for resource_type, item in batch:
+        key = _match_key(item.get('arn', f"unknown-{now.timestamp()}"))
+        if key in items:
+            items[key] = (items[key][0], _merge(items[key][1], item))
+        else:
+            items[key] = (resource_type, item)
+
+    # Resources staged by an earlier batch keep their id and type and are merged with what was staged
+    staged = {
+        row.match_key: row for row in db.execute(
+            select(_staged.c.match_key, _staged.c.data).where(_staged.c.match_key.in_(list(items)))
+        )
+    }
+    merged, new_rows = [], []
+    for key, (resource_type, item) in items.items():
+        if key in staged:
+            merged.append({'key': key, 'merged': _merge(staged[key].data, item)})
+        else:
+            new_rows.append({
+                'match_key': key,
+                'id': item.get('arn', f"unknown-{now.timestamp()}"),
+                'resource_type': resource_type,
+                'data': item,
+            })
+
+    if merged:
+        db.execute(
+            _staged.update().where(_staged.c.match_key == bindparam('key')).values(data=bindparam('merged')),
+            merged
+        )
+    if new_rows:
+        db.execute(_staged.insert(), new_rows)
+
+
+def _write_page(db: Session, page: List, now: datetime, stats: Dict[str, int]) -> None:
+    # Diff a page of fully merged resources against what is stored
+    existing = dict(
+        db.query(AWSResource.id, AWSResource.content_hash).filter(AWSResource.id.in_([row.id for row in page]))
+    )
+    rows = []
+    for row in page:
+        previous_hash = existing.get(row.id)
+        content_hash = resource_hash(row.resource_type, row.data)
+        stats[_classify(previous_hash, content_hash)] += 1
+        if previous_hash == content_hash:
+            continue
+        rows.append({
+            'id': row.id,
+            'resource_type': row.resource_type,
+            'tags': row.data.get('tags', []),
+            'data': row.data,
+            'content_hash': content_hash,
+            'last_updated': now,
+            **arn_columns(row.id),
+        })
+
+    if rows:
+        _upsert(db, rows)
+        _write_tags(db, rows)
+
+
+def _write_tags(db: Session, rows: List[Dict]) -> None:
+    db.execute(ResourceTag.__table__.delete().where(ResourceTag.resource_id.in_([row['id'] for row in rows])))
+    tags = [tag for row in rows for tag in tag_rows(row['id'], row['tags'])]
+    if tags:
+        db.execute(ResourceTag.__table__.insert(), tags)
+
+
+def tag_rows(resource_id: str, tags: Optional[List[Dict]]) -> List[Dict]:
+    """``resource_tags`` rows for one resource's ``[{'Key': ..., 'Value': ...}]`` tag list."""
+    values = {}
+    for tag in tags or []:
+        if isinstance(tag, dict) and tag.get('Key') is not None:
+            values[tag['Key']] = tag.get('Value', '')
+    return [{'resource_id': resource_id, 'key': key, 'value': value} for key, value in values.items()]
+
+
+def rebuild_tag_index(db: Session, batch_size: int = WRITE_BATCH_SIZE) -> int:
+    """Rebuild ``resource_tags`` from the stored inventory, e.g. for databases created before it existed."""
+    db.execute(ResourceTag.__table__.delete())
+    count, tags = 0, []
+    for resource_id, resource_tags in db.query(AWSResource.id, AWSResource.tags).yield_per(batch_size):
+        tags.extend(tag_rows(resource_id, resource_tags))
+        if len(tags) >= batch_size:
+            db.execute(ResourceTag.__table__.insert(), tags)
+            count, tags = count + len(tags), []
+    if tags:
+        db.execute(ResourceTag.__table__.insert(), tags)
+        count += len(tags)
+    mark_snapshot(db, TAG_INDEX_SNAPSHOT, changed=True)
+    return count
+
+
+def arn_columns(arn: str) -> Dict[str, Optional[str]]:
+    try:
+        parts = parse_arn(arn)
+    except ValueError:
+        return {'service': None, 'region': None, 'account': None}
+    return {'service': parts.service, 'region': parts.region, 'account': parts.account}
+
+
+def _backfill_arn_columns(db: Session, batch_size: int = WRITE_BATCH_SIZE) -> None:
+    # Rows written before the service/region/account columns existed
+    ids = [resource_id for resource_id, in db.query(AWSResource.id).filter(AWSResource.service.is_(None))]
+    for start in range(0, len(ids), batch_size):
+        db.bulk_update_mappings(AWSResource, [
+            {'id': resource_id, **arn_columns(resource_id)} for resource_id in ids[start:start + batch_size]
+        ])
+
+
+def rebuild_summary(db: Session) -> None:
+    """Recompute ``inventory_summary`` with one GROUP BY per dimension."""
+    tagged = case((AWSResource.id.in_(select(ResourceTag.resource_id)), 1), else_=0)
+    db.execute(InventorySummary.__table__.delete())
+    for dimension in SUMMARY_DIMENSIONS:
+        column = getattr(AWSResource, dimension)
+        # NULL (no ARN) and '' (e.g. S3's region) both count as ''
+        counts = {}
+        for value, count, tagged_count in db.query(column, func.count(AWSResource.id), func.sum(tagged)).group_by(column):
+            total = counts.setdefault(value or '', [0, 0])
+            total[0] += count
+            total[1] += tagged_count or 0
+        if counts:
+            db.execute(InventorySummary.__table__.insert(), [
+                {'dimension': dimension, 'value': value, 'count': count, 'tagged': tagged_count}
+                for value, (count, tagged_count) in counts.items()
+            ])
+
+
+def _classify(previous_hash: Optional[str], content_hash: str) -> str:
+    if previous_hash is None:
+        return 'inserted'
+    return 'unchanged' if previous_hash == content_hash else 'updated'
+
+
+def _match_key(arn: str) -> str:
+    # Same rule as InventoryIndex: some sources (and moto) omit the account id from
+    # ARNs, so a resource is matched on everything but the account
+    try:
+        parts = parse_arn(arn)
+    except ValueError:
+        return arn
+    return ':'.join(['arn', parts.partition, parts.service, parts.region, '', parts.resource])
+
+
+def _merge(stored: Dict, item: Dict) -> Dict:
+    merged = dict(stored)
+    for field, value in item.items():
+        if not merged.get(field) and value:
+            merged[field] = value
+    return merged
+
+
+def mark_snapshot(db: Session, name: str, changed: bool, stats: Optional[Dict] = None,
+                  updated_at: Optional[datetime] = None) -> DatasetSnapshot:
+    """Record a refresh of ``name``; the version only moves when the content changed."""
+    snapshot = db.query(DatasetSnapshot).get(name)
+    if snapshot is None:
+        snapshot = DatasetSnapshot(name=name, version=0)
+        db.add(snapshot)
+        # Sessions don't autoflush; make the new row visible to the next lookup
+        db.flush()
+    if changed or not snapshot.version:
+        snapshot.version = (snapshot.version or 0) + 1
+    snapshot.updated_at = updated_at or datetime.utcnow()
+    snapshot.stats = stats
+    return snapshot
+
+
+def snapshot_state(db: Session, name: str) -> Optional[Tuple[int, datetime]]:
+    snapshot = db.query(DatasetSnapshot).get(name)
+    if snapshot is None:
+        return None
+    return snapshot.version, snapshot.updated_at
+
+
+def _upsert(db: Session, rows: List[Dict]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(AWSResource).values(rows)
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(AWSResource).values(rows)
+    else:
+        # No INSERT ... ON CONFLICT here: update the ids that exist, insert the rest
+        existing = {resource_id for resource_id, in db.query(AWSResource.id).filter(
+            AWSResource.id.in_([row['id'] for row in rows])
+        )}
+        updates = [dict(row, row_id=row['id']) for row in rows if row['id'] in existing]
+        if updates:
+            db.execute(
+                AWSResource.__table__.update().where(AWSResource.id == bindparam('row_id')),
+                updates
+            )
+        inserts = [row for row in rows if row['id'] not in existing]
+        if inserts:
+            db.execute(AWSResource.__table__.insert(), inserts)
+        return
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[AWSResource.id],
+        set_={
+            'resource_type': statement.excluded.resource_type,
+            'tags': statement.excluded.tags,
+            'data': statement.excluded.data,
+            'content_hash': statement.excluded.content_hash,
+            'service': statement.excluded.service,
+            'region': statement.excluded.region,
+            'account': statement.excluded.account,
+            'last_updated': statement.excluded.last_updated,
+        }
+    ))
@@ -0,0 +1,74 @@
+from typing import Dict, Optional, Tuple
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import AWSResource, InventorySummary
+from services.inventory_store import SUMMARY_DIMENSIONS, SUMMARY_SNAPSHOT, snapshot_state
+
+# (summary snapshot version, summary), shared by every request in this worker
+_cached: Optional[Tuple[int, Dict]] = None
+_lock = threading.Lock()
+
+
+def get_inventory_summary(db: Session) -> Dict:
+    """
+    Resource counts by type, service, region and account, plus tag coverage.
+
+    Served from the ``inventory_summary`` table written with the inventory, and kept
+    in memory until its version moves, so each call costs one primary-key lookup
+    instead of a scan of ``aws_resources``.
+    """
+    global _cached
+    state = snapshot_state(db, SUMMARY_SNAPSHOT)
+    summary = {dimension: {} for dimension in SUMMARY_DIMENSIONS}
+    tagged = {}
+
+    if state is None:
+        # Inventory not refreshed since the summary was introduced: count types directly
+        summary['resource_type'] = dict(
+            db.query(AWSResource.resource_type, func.count(AWSResource.id)).group_by(AWSResource.resource_type).all()
+        )
+        return _finish(summary, tagged, None)
+
+    with _lock:
+        if _cached is not None and _cached[0] == state[0]:
+            return _cached[1]
+
+    for row in db.query(InventorySummary):
+        summary.setdefault(row.dimension, {})[row.value] = row.count
+        if row.dimension == 'resource_type':
+            tagged[row.value] = row.tagged
+    summary = _finish(summary, tagged, state[1])
+
+    with _lock:
+        _cached = (state[0], summary)
+    return summary
+
+
+def _finish(summary: Dict, tagged: Dict, updated_at) -> Dict:
+    total = sum(summary['resource_type'].values())
+    summary['total'] = total
+    summary['tagged'] = tagged
+    summary['tag_coverage'] = round(sum(tagged.values()) / total, 4) if total and tagged else None
+    summary['updated_at'] = updated_at
+    return summary
+
+
+def summary_context(summary: Dict, detailed: bool = True) -> str:
+    """Prompt context for the agent and diagram generator."""
+    context = "AWS Resource Summary:\n"
+    context += "\n".join([f"- {res_type}: {count} resources" for res_type, count in summary['resource_type'].items()])
+    if not detailed or not summary['region']:
+        return context
+
+    regions = sorted(summary['region'].items(), key=lambda item: -item[1])
+    context += "\n\nResources by region:\n"
+    context += "\n".join([f"- {region or 'global'}: {count}" for region, count in regions])
+    if len([account for account in summary['account'] if account]) > 1:
+        context += "\n\nResources by account:\n"
+        context += "\n".join([f"- {account}: {count}" for account, count in summary['account'].items() if account])
+    if summary['tag_coverage'] is not None:
+        context += f"\n\nTag coverage: {summary['tag_coverage']:.0%} of resources have at least one tag"
+    return context
@@ -0,0 +1,189 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import math
+import os
+import re
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import AWSResource, FlaggedResource, TrustedAdvisorCheck
+from services import advisor_history
+from services.agent_context import estimate_tokens
+from services.inventory_index import parse_arn
+from services.inventory_store import INVENTORY_SNAPSHOT, snapshot_state
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Records injected per question, and their rough token budget
+RETRIEVAL_LIMIT = int(os.getenv('AGENT_RETRIEVAL_LIMIT', '40'))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('AGENT_RETRIEVAL_TOKENS', '1500'))
+METADATA_FIELDS = 8
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset((
+    'a', 'all', 'an', 'and', 'any', 'are', 'by', 'do', 'does', 'for', 'from', 'have', 'how', 'i', 'in', 'is',
+    'it', 'list', 'many', 'me', 'my', 'of', 'on', 'or', 'show', 'that', 'the', 'there', 'to', 'we', 'what',
+    'which', 'who', 'with'
+))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric runs, stop words dropped, plural ``s`` stripped."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class RetrievalIndex:
+    """
+    Inverted index with BM25 ranking over one-line text records.
+
+    Postings are kept per term as parallel lists of record numbers and term
+    frequencies, so a query only touches the records containing its terms.
+    """
+
+    def __init__(self):
+        self.records: List[str] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._total_length = 0
+
+    def add(self, record: str, terms: Iterable[str]) -> None:
+        number = len(self.records)
+        counts = Counter(terms)
+        self.records.append(record)
+        self._lengths.append(sum(counts.values()))
+        self._total_length += self._lengths[-1]
+        for term, count in counts.items():
+            numbers, frequencies = self._postings.setdefault(term, ([], []))
+            numbers.append(number)
+            frequencies.append(count)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[float, str]]:
+        """Best ``limit`` records for ``query`` as ``(score, record)``, highest first."""
+        if not self.records:
+            return []
+        total = len(self.records)
+        average_length = self._total_length / total or 1
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            numbers, frequencies = postings
+            idf = math.log(1 + (total - len(numbers) + 0.5) / (len(numbers) + 0.5))
+            for number, frequency in zip(numbers, frequencies):
+                norm = K1 * (1 - B + B * self._lengths[number] / average_length)
+                scores[number] = scores.get(number, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, self.records[number]) for number, score in best]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+# (snapshot key, index), shared by every request in this worker
+_cached: Optional[Tuple[tuple, RetrievalIndex]] = None
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def get_index(db: Session) -> RetrievalIndex:
+    """
+    Index over the stored inventory, the latest Trusted Advisor checks and their flagged
+    resources. Rebuilt when the inventory, flagged resources or check history move.
+    """
+    global _cached
+    key = snapshot_key(db)
+    with _lock:
+        if _cached is not None and _cached[0] == key:
+            return _cached[1]
+
+    # One build at a time; a request that waited reuses the index just built
+    with _build_lock:
+        with _lock:
+            if _cached is not None and _cached[0] == key:
+                return _cached[1]
+        index = build_index(db)
+        with _lock:
+            _cached = (key, index)
+    return index
+
+
+def snapshot_key(db: Session) -> tuple:
+    inventory = snapshot_state(db, INVENTORY_SNAPSHOT)
+    flagged = snapshot_state(db, advisor_history.FLAGGED_SNAPSHOT)
+    checks = db.query(func.max(TrustedAdvisorCheck.id)).scalar()
+    return (inventory[0] if inventory else None, flagged[0] if flagged else None, checks)
+
+
+def build_index(db: Session) -> RetrievalIndex:
+    index = RetrievalIndex()
+    # Short id (instance id, bucket name, ...) -> (ARN, tag text), to tie flagged resources to the inventory
+    by_short_id: Dict[str, Tuple[str, str]] = {}
+
+    for arn, resource_type, tags, data in db.query(
+        AWSResource.id, AWSResource.resource_type, AWSResource.tags, AWSResource.data
+    ).yield_per(1000):
+        tag_text = ", ".join(f"{tag.get('Key')}={tag.get('Value')}" for tag in tags or [])
+        name = (data or {}).get('name')
+        record = f"resource {arn}" + (f" name={name}" if name and name not in arn else "")
+        record += f" tags: {tag_text}" if tag_text else " untagged"
+        index.add(record, tokenize(f"{resource_type} {_arn_text(arn)} {name or ''} {tag_text}"))
+        try:
+            by_short_id[parse_arn(arn).resource_id] = (arn, tag_text)
+        except ValueError:
+            pass
+
+    checks = {row.check_id: row for row in advisor_history.latest_rows(db)}
+    for row in checks.values():
+        savings = f", estimated savings ${row.estimated_savings}" if row.estimated_savings else ""
+        record = (f"check '{row.name}' [{row.category}] status={row.status}, "
+                  f"{row.flagged_count or 0} flagged resources{savings}")
+        index.add(record, tokenize(f"check {row.name} {row.category} {row.status}"))
+
+    for row in db.query(FlaggedResource).yield_per(1000):
+        check = checks.get(row.check_id)
+        check_name = check.name if check else row.check_id
+        metadata = [str(value) for value in (row.resource_metadata or []) if value not in (None, '')]
+        linked = next((by_short_id[value] for value in metadata if value in by_short_id), None)
+        record = f"flagged by '{check_name}' ({row.status}, {row.region or 'global'}): {row.resource_id}"
+        if linked:
+            record += f" -> {linked[0]}" + (f" tags: {linked[1]}" if linked[1] else "")
+        record += f" details: {', '.join(metadata[:METADATA_FIELDS])}"
+        terms = f"flagged {check_name} {check.category if check else ''} {row.status} {row.region or ''} {' '.join(metadata)}"
+        if linked:
+            terms += f" {_arn_text(linked[0])} {linked[1]}"
+        index.add(record, tokenize(terms))
+    return index
+
+
+def retrieval_context(db: Session, query: str, limit: int = RETRIEVAL_LIMIT,
+                      budget: int = RETRIEVAL_TOKEN_BUDGET) -> str:
+    """The records most relevant to ``query``, one per line, within ``budget`` tokens."""
+    lines = []
+    remaining = budget
+    for _, record in get_index(db).search(query, limit):
+        cost = estimate_tokens(record) + 1
+        if cost > remaining:
+            break
+        lines.append(f"- {record}")
+        remaining -= cost
+    return "\n".join(lines)
+
+
+def _arn_text(arn: str) -> str:
+    try:
+        parts = parse_arn(arn)
+    except ValueError:
+        return arn
+    return f"{parts.service} {parts.region} {parts.account} {parts.resource}"
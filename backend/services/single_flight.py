@@ -0,0 +1,88 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+import hashlib
+import os
+import tempfile
+import threading
+
+from sqlalchemy import text
+
+from database import engine
+from services.executor import submit
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process coalescing only
+    fcntl = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time and share its result with every caller.
+
+    Within a worker, callers arriving while a call is in flight get the same
+    Future. Across uvicorn workers the call runs under ``cross_process_lock``,
+    so a second worker waits for the first one to finish; ``fn`` should then
+    re-check whether the work is still needed before redoing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._calls: Dict[str, Future] = {}
+
+    def run(self, key: str, fn: Callable[[], Any], backend: str = 'aws') -> Future:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = submit(backend, self._lead, key, fn)
+                self._calls[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+            return future
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Any:
+        with cross_process_lock(key):
+            return fn()
+
+    def _forget(self, key: str, done: Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is done:
+                del self._calls[key]
+
+
+@contextmanager
+def cross_process_lock(key: str):
+    """
+    Block until no other worker holds ``key``.
+
+    Uses a PostgreSQL session advisory lock when the database is Postgres, and an
+    flock()ed file in the temp directory as a local stand-in otherwise.
+    """
+    if engine.dialect.name == 'postgresql':
+        lock_id = int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'big', signed=True)
+        connection = engine.connect()
+        try:
+            connection.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": lock_id})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": lock_id})
+        finally:
+            connection.close()
+    elif fcntl is not None:
+        path = os.path.join(tempfile.gettempdir(), f"tcat-{hashlib.sha256(key.encode()).hexdigest()[:16]}.lock")
+        with open(path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Callable, Optional, Tuple
+import asyncio
+import os
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from services.executor import run_blocking
+from services.single_flight import single_flight
+
+
+class SnapshotCache:
+    """
+    Stale-while-revalidate access to a stored dataset snapshot.
+
+    ``read(db)`` returns the stored ``(data, updated_at)`` or None, and
+    ``refresh(db)`` crawls AWS, stores a new snapshot and returns its data, or
+    None for datasets too large to hand around (``get`` then reads it back).
+
+    - younger than the soft TTL: served as is
+    - between the soft and hard TTL: served right away, refreshed in the background
+    - older than the hard TTL, or missing: refreshed inline
+
+    Refreshes go through ``single_flight``, so concurrent callers in this worker
+    share one crawl and other workers wait for it instead of starting their own.
+    Reads run on the ``db`` pool, never on the event loop.
+
+    TTLs default to the constructor values and can be overridden with
+    ``<NAME>_SOFT_TTL_HOURS`` / ``<NAME>_HARD_TTL_HOURS``.
+
+    ``updated_at(db)``, when given, returns just the snapshot time; ``ensure_fresh``
+    and refreshes then check freshness without reading the data, so callers that
+    read it themselves (e.g. page by page) never load it whole.
+    """
+
+    def __init__(self, name: str, read: Callable[[Session], Optional[Tuple[Any, datetime]]],
+                 refresh: Callable[[Session], Any], soft_ttl: timedelta, hard_ttl: timedelta, backend: str = 'aws',
+                 updated_at: Optional[Callable[[Session], Optional[datetime]]] = None):
+        self.name = name
+        self.read = read
+        self.refresh = refresh
+        self.updated_at = updated_at
+        self.soft_ttl = _ttl_from_env(f'{name.upper()}_SOFT_TTL_HOURS', soft_ttl)
+        self.hard_ttl = max(self.soft_ttl, _ttl_from_env(f'{name.upper()}_HARD_TTL_HOURS', hard_ttl))
+        self.backend = backend
+
+    async def get(self, db: Session, force_refresh: bool = False) -> Tuple[Any, str, bool]:
+        """Returns ``(data, source, stale)`` where source is "database" or "aws"."""
+        snapshot = None if force_refresh else await run_blocking('db', self.read, db)
+        if snapshot is not None:
+            data, updated_at = snapshot
+            age = datetime.utcnow() - updated_at
+            if age < self.soft_ttl:
+                return data, "database", False
+            if age < self.hard_ttl:
+                self.refresh_in_background()
+                return data, "database", True
+
+        # Every caller waiting on this dataset shares one refresh
+        future = single_flight.run(self.name, partial(self._refresh_once, datetime.utcnow()), self.backend)
+        data = await asyncio.wrap_future(future)
+        if data is None:
+            snapshot = await run_blocking('db', self.read, db)
+            data = snapshot[0] if snapshot is not None else None
+        return data, "aws", False
+
+    async def ensure_fresh(self, db: Session) -> Tuple[str, bool]:
+        """
+        Apply the same TTL rules without returning the data; returns ``(source, stale)``.
+        Only a missing or very old snapshot makes the caller wait for a refresh.
+        """
+        updated_at = await run_blocking('db', self._snapshot_time, db)
+        if updated_at is not None:
+            age = datetime.utcnow() - updated_at
+            if age < self.soft_ttl:
+                return "database", False
+            if age < self.hard_ttl:
+                self.refresh_in_background()
+                return "database", True
+
+        future = single_flight.run(self.name, partial(self._refresh_once, datetime.utcnow()), self.backend)
+        await asyncio.wrap_future(future)
+        return "aws", False
+
+    def refresh_in_background(self) -> bool:
+        """Schedule a refresh unless one is already in flight in this worker."""
+        if single_flight.in_flight(self.name):
+            return False
+        single_flight.run(self.name, partial(self._refresh_once, datetime.utcnow()), self.backend)
+        return True
+
+    def _refresh_once(self, requested_at: datetime) -> Any:
+        db = SessionLocal()
+        try:
+            # Another worker may have refreshed while this one waited for the lock;
+            # callers that need the data read it themselves
+            updated_at = self._snapshot_time(db)
+            if updated_at is not None and updated_at >= requested_at:
+                return None
+            return self.refresh(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Error refreshing {self.name} snapshot: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+    def _snapshot_time(self, db: Session) -> Optional[datetime]:
+        if self.updated_at is not None:
+            return self.updated_at(db)
+        snapshot = self.read(db)
+        return snapshot[1] if snapshot is not None else None
+
+
+def _ttl_from_env(name: str, default: timedelta) -> timedelta:
+    value = os.getenv(name)
+    return timedelta(hours=float(value)) if value else default
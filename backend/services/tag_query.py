@@ -0,0 +1,123 @@
+from typing import List, Optional, Tuple
+import re
+
+from sqlalchemy import and_, not_, or_, select
+
+from database import AWSResource, ResourceTag
+
+# Tokens: parentheses, operators, and predicates. Keys may contain ':' (aws:cloudformation:stack-name),
+# and keys or values containing spaces can be double-quoted
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<paren>[()])
+      | (?P<predicate>
+            (?P<key>"[^"]*"|[^\s()"=!]+)
+            (?:(?P<op>!=|=)(?P<value>"[^"]*"|[^\s()"]*))?
+        )
+    )''', re.VERBOSE)
+_KEYWORDS = {'AND', 'OR', 'NOT'}
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+def parse(query: str):
+    """
+    Parse a tag expression into a SQLAlchemy filter on ``AWSResource``.
+
+    - ``env=prod``: tag ``env`` has value ``prod``
+    - ``env!=prod``: tag ``env`` is missing or has another value
+    - ``owner`` or ``owner=*``: tag ``owner`` exists
+    - ``NOT owner`` or ``owner!=*``: tag ``owner`` is missing
+    - ``untagged``: the resource has no tags at all
+
+    Predicates combine with ``AND``, ``OR``, ``NOT`` and parentheses; AND binds
+    tighter than OR. Example: ``env=prod AND (NOT owner OR NOT cost-center)``.
+    Every predicate is an ``id IN (SELECT resource_id FROM resource_tags ...)``
+    served by the (key, value) index.
+    """
+    tokens = _tokenize(query)
+    if not tokens:
+        raise TagQueryError("Empty tag query")
+    expression, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise TagQueryError(f"Unexpected '{tokens[position][1]}' in tag query")
+    return expression
+
+
+def _tokenize(query: str) -> List[Tuple[str, object]]:
+    tokens, position = [], 0
+    query = query.strip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None or match.end() == position:
+            raise TagQueryError(f"Invalid tag query near '{query[position:]}'")
+        position = match.end()
+        if match.group('paren'):
+            tokens.append(('paren', match.group('paren')))
+        elif match.group('op') is None and match.group('key').upper() in _KEYWORDS:
+            tokens.append(('keyword', match.group('key').upper()))
+        else:
+            key = _unquote(match.group('key'))
+            value = match.group('value')
+            tokens.append(('predicate', (key, match.group('op'), None if value is None else _unquote(value))))
+    return tokens
+
+
+def _parse_or(tokens, position):
+    expression, position = _parse_and(tokens, position)
+    terms = [expression]
+    while position < len(tokens) and tokens[position] == ('keyword', 'OR'):
+        expression, position = _parse_and(tokens, position + 1)
+        terms.append(expression)
+    return (or_(*terms) if len(terms) > 1 else terms[0]), position
+
+
+def _parse_and(tokens, position):
+    expression, position = _parse_not(tokens, position)
+    terms = [expression]
+    while position < len(tokens) and tokens[position] == ('keyword', 'AND'):
+        expression, position = _parse_not(tokens, position + 1)
+        terms.append(expression)
+    return (and_(*terms) if len(terms) > 1 else terms[0]), position
+
+
+def _parse_not(tokens, position):
+    if position < len(tokens) and tokens[position] == ('keyword', 'NOT'):
+        expression, position = _parse_not(tokens, position + 1)
+        return not_(expression), position
+    return _parse_atom(tokens, position)
+
+
+def _parse_atom(tokens, position):
+    if position >= len(tokens):
+        raise TagQueryError("Tag query ends unexpectedly")
+    kind, token = tokens[position]
+    if token == '(':
+        expression, position = _parse_or(tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ('paren', ')'):
+            raise TagQueryError("Missing ')' in tag query")
+        return expression, position + 1
+    if kind != 'predicate':
+        raise TagQueryError(f"Unexpected '{token}' in tag query")
+
+    key, op, value = token
+    if op is None and key == 'untagged':
+        return ~AWSResource.id.in_(select(ResourceTag.resource_id)), position + 1
+    if op is None or value == '*':
+        predicate = _has_tag(key)
+    else:
+        predicate = _has_tag(key, value)
+    return (~predicate if op == '!=' else predicate), position + 1
+
+
+def _has_tag(key: str, value: Optional[str] = None):
+    tagged = select(ResourceTag.resource_id).where(ResourceTag.key == key)
+    if value is not None:
+        tagged = tagged.where(ResourceTag.value == value)
+    return AWSResource.id.in_(tagged)
+
+
+def _unquote(text: str) -> str:
+    return text[1:-1] if len(text) >= 2 and text[0] == text[-1] == '"' else text
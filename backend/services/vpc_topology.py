@@ -0,0 +1,327 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import os
+
+from sqlalchemy.orm import Session
+
+from database import VpcTopology
+from services.aws_service import get_aws_service
+from services.snapshot_cache import SnapshotCache
+
+# (operation, result key) crawled once per region; each is paginated
+COLLECTIONS = (
+    ('describe_vpcs', 'Vpcs'),
+    ('describe_subnets', 'Subnets'),
+    ('describe_network_interfaces', 'NetworkInterfaces'),
+    ('describe_route_tables', 'RouteTables'),
+    ('describe_internet_gateways', 'InternetGateways'),
+    ('describe_security_groups', 'SecurityGroups'),
+    ('describe_instances', 'Reservations'),
+)
+
+
+def collect_region(client, region: str) -> Dict:
+    """
+    Topology of every VPC in ``region``. Each collection is read with one paginated
+    describe call, however many VPCs there are, and grouped by VPC in memory.
+    """
+    raw = {key: list(_pages(client, operation, key)) for operation, key in COLLECTIONS}
+    return group_by_vpc(region, raw)
+
+
+def group_by_vpc(region: str, raw: Dict[str, List[Dict]]) -> Dict:
+    """
+    Group raw describe results (keyed like ``COLLECTIONS``) by VPC and derive the
+    relationships between them. Returns ``{'vpcs': [...], 'edges': [[source, relation, target], ...]}``.
+    """
+    vpcs = {}
+    edges = []
+    for vpc in raw['Vpcs']:
+        vpcs[vpc['VpcId']] = {
+            'id': vpc['VpcId'],
+            'arn': f"arn:aws:ec2:{region}:{vpc.get('OwnerId', '')}:vpc/{vpc['VpcId']}",
+            'region': region,
+            'name': _name(vpc),
+            'cidr': vpc.get('CidrBlock'),
+            'state': vpc.get('State'),
+            'is_default': vpc.get('IsDefault', False),
+            'subnets': [],
+            'instances': [],
+            'network_interfaces': [],
+            'route_tables': [],
+            'internet_gateways': [],
+            'security_groups': [],
+        }
+
+    def add(vpc_id: Optional[str], collection: str, item: Dict) -> bool:
+        if vpc_id not in vpcs:
+            return False
+        vpcs[vpc_id][collection].append(item)
+        return True
+
+    # Route tables first: a subnet's table is its explicit association, else the VPC's main table
+    subnet_tables, main_tables, public_tables = {}, {}, set()
+    for table in raw['RouteTables']:
+        routes = [
+            {'destination': route.get('DestinationCidrBlock') or route.get('DestinationIpv6CidrBlock')
+                or route.get('DestinationPrefixListId'),
+             'target': _route_target(route)}
+            for route in table.get('Routes', [])
+        ]
+        associations = table.get('Associations', [])
+        main = any(association.get('Main') for association in associations)
+        subnets = [association['SubnetId'] for association in associations if association.get('SubnetId')]
+        if not add(table.get('VpcId'), 'route_tables', {
+            'id': table['RouteTableId'], 'main': main, 'subnets': subnets, 'routes': routes
+        }):
+            continue
+        for subnet_id in subnets:
+            subnet_tables[subnet_id] = table['RouteTableId']
+        if main:
+            main_tables[table['VpcId']] = table['RouteTableId']
+        for route in routes:
+            if route['target'] and route['target'] != 'local':
+                edges.append([table['RouteTableId'], 'routes_to', route['target']])
+            if route['destination'] in ('0.0.0.0/0', '::/0') and (route['target'] or '').startswith('igw-'):
+                public_tables.add(table['RouteTableId'])
+
+    for gateway in raw['InternetGateways']:
+        for attachment in gateway.get('Attachments', []):
+            if add(attachment.get('VpcId'), 'internet_gateways', {'id': gateway['InternetGatewayId'],
+                                                                  'name': _name(gateway)}):
+                edges.append([gateway['InternetGatewayId'], 'attached_to', attachment['VpcId']])
+
+    for subnet in raw['Subnets']:
+        table = subnet_tables.get(subnet['SubnetId']) or main_tables.get(subnet.get('VpcId'))
+        if add(subnet.get('VpcId'), 'subnets', {
+            'id': subnet['SubnetId'],
+            'name': _name(subnet),
+            'cidr': subnet.get('CidrBlock'),
+            'availability_zone': subnet.get('AvailabilityZone'),
+            'available_ips': subnet.get('AvailableIpAddressCount'),
+            'route_table': table,
+            'public': table in public_tables,
+        }):
+            edges.append([subnet['VpcId'], 'contains', subnet['SubnetId']])
+            if table:
+                edges.append([subnet['SubnetId'], 'routes_via', table])
+
+    for group in raw['SecurityGroups']:
+        add(group.get('VpcId'), 'security_groups', {
+            'id': group['GroupId'],
+            'name': group.get('GroupName'),
+            'ingress_rules': len(group.get('IpPermissions', [])),
+            'egress_rules': len(group.get('IpPermissionsEgress', [])),
+            'open_to_world': any(
+                ip_range.get('CidrIp') == '0.0.0.0/0'
+                for permission in group.get('IpPermissions', []) for ip_range in permission.get('IpRanges', [])
+            ),
+        })
+
+    for reservation in raw['Reservations']:
+        owner_id = reservation.get('OwnerId', '')
+        for instance in reservation.get('Instances', []):
+            groups = [group['GroupId'] for group in instance.get('SecurityGroups', [])]
+            if not add(instance.get('VpcId'), 'instances', {
+                'id': instance['InstanceId'],
+                'arn': f"arn:aws:ec2:{region}:{owner_id}:instance/{instance['InstanceId']}",
+                'name': _name(instance),
+                'state': instance.get('State', {}).get('Name'),
+                'instance_type': instance.get('InstanceType'),
+                'subnet': instance.get('SubnetId'),
+                'private_ip': instance.get('PrivateIpAddress'),
+                'public_ip': instance.get('PublicIpAddress'),
+                'security_groups': groups,
+            }):
+                continue
+            edges.append([instance.get('SubnetId') or instance['VpcId'], 'contains', instance['InstanceId']])
+            edges.extend([instance['InstanceId'], 'member_of', group_id] for group_id in groups)
+
+    for interface in raw['NetworkInterfaces']:
+        attachment = interface.get('Attachment') or {}
+        if add(interface.get('VpcId'), 'network_interfaces', {
+            'id': interface['NetworkInterfaceId'],
+            'type': interface.get('InterfaceType'),
+            'status': interface.get('Status'),
+            'subnet': interface.get('SubnetId'),
+            'private_ip': interface.get('PrivateIpAddress'),
+            'instance': attachment.get('InstanceId'),
+            'description': interface.get('Description'),
+        }):
+            edges.append([interface.get('SubnetId') or interface['VpcId'], 'contains', interface['NetworkInterfaceId']])
+            if attachment.get('InstanceId'):
+                edges.append([interface['NetworkInterfaceId'], 'attached_to', attachment['InstanceId']])
+
+    return {'vpcs': list(vpcs.values()), 'edges': edges}
+
+
+def crawl_regions(all_regions: Optional[bool] = None) -> List[str]:
+    """
+    Regions the topology covers, following the inventory crawl: the configured region,
+    or every enabled region with ``AWS_CRAWL_ALL_REGIONS=true``.
+    """
+    aws_service = get_aws_service()
+    if all_regions is None:
+        all_regions = os.getenv('AWS_CRAWL_ALL_REGIONS', 'false').lower() == 'true'
+    return aws_service.get_enabled_regions() if all_regions else [aws_service.region_name]
+
+
+def collect(regions: Optional[List[str]] = None, all_regions: Optional[bool] = None,
+            max_workers: Optional[int] = None) -> Dict[str, Dict]:
+    """Topology by region, crawled in parallel (``crawl_regions`` by default). Regions that fail are left out."""
+    aws_service = get_aws_service()
+    if max_workers is None:
+        max_workers = int(os.getenv('AWS_CRAWL_MAX_WORKERS', '16'))
+    if not regions:
+        regions = crawl_regions(all_regions)
+
+    def run(region):
+        try:
+            return region, collect_region(aws_service.client('ec2', region_name=region), region)
+        except Exception as e:
+            print(f"Error collecting VPC topology in {region}: {str(e)}")
+            return region, None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(regions))) as executor:
+        return {region: topology for region, topology in executor.map(run, regions) if topology is not None}
+
+
+def read_topology(db: Session) -> Optional[Tuple[Dict, datetime]]:
+    """
+    The stored topology and when it was last refreshed. A region whose crawl failed
+    keeps its previous topology; ``regions_collected_at`` tells when each was collected.
+    """
+    rows = db.query(VpcTopology).order_by(VpcTopology.region).all()
+    if not rows:
+        return None
+    collected_at = max(row.collected_at for row in rows)
+    return {
+        'regions': [row.region for row in rows],
+        'regions_collected_at': {row.region: row.collected_at.isoformat() for row in rows},
+        'vpcs': [vpc for row in rows for vpc in row.data['vpcs']],
+        'edges': [edge for row in rows for edge in row.data['edges']],
+        'collected_at': collected_at.isoformat(),
+    }, collected_at
+
+
+def refresh_topology(db: Session) -> Dict:
+    now = datetime.utcnow()
+    regions = crawl_regions()
+    collected = collect(regions)
+
+    # Regions no longer crawled (disabled, or AWS_CRAWL_ALL_REGIONS turned off) go away;
+    # re-collected regions are replaced whole
+    db.query(VpcTopology).filter(
+        ~VpcTopology.region.in_(regions) | VpcTopology.region.in_(list(collected))
+    ).delete(synchronize_session=False)
+    for region, topology in collected.items():
+        db.add(VpcTopology(region=region, data=topology, vpc_count=len(topology['vpcs']), collected_at=now))
+    db.commit()
+    snapshot = read_topology(db)
+    return snapshot[0] if snapshot else {'regions': [], 'vpcs': [], 'edges': [], 'collected_at': now.isoformat()}
+
+
+# Served to /api/resources/vpcs, the diagram generator and the agent
+topology_cache = SnapshotCache(
+    "topology",
+    read=read_topology,
+    refresh=refresh_topology,
+    soft_ttl=timedelta(hours=6),
+    hard_ttl=timedelta(days=7)
+)
+
+
+def stored_topology(db: Session) -> Optional[Dict]:
+    """The stored topology without crawling; schedules a refresh when it is missing or stale."""
+    snapshot = read_topology(db)
+    if snapshot is None or datetime.utcnow() - snapshot[1] >= topology_cache.soft_ttl:
+        topology_cache.refresh_in_background()
+    return snapshot[0] if snapshot else None
+
+
+def vpc_summary(vpc: Dict) -> Dict:
+    """A VPC with counts instead of its member lists."""
+    interface_types = {}
+    for interface in vpc['network_interfaces']:
+        interface_types[interface['type'] or 'interface'] = interface_types.get(interface['type'] or 'interface', 0) + 1
+    instance_states = {}
+    for instance in vpc['instances']:
+        instance_states[instance['state']] = instance_states.get(instance['state'], 0) + 1
+    return {
+        'id': vpc['id'],
+        'region': vpc['region'],
+        'name': vpc['name'],
+        'cidr': vpc['cidr'],
+        'is_default': vpc['is_default'],
+        'subnets': len(vpc['subnets']),
+        'public_subnets': sum(1 for subnet in vpc['subnets'] if subnet['public']),
+        'instances': len(vpc['instances']),
+        'instance_states': instance_states,
+        'network_interfaces': len(vpc['network_interfaces']),
+        'network_interface_types': interface_types,
+        'route_tables': len(vpc['route_tables']),
+        'internet_gateways': [gateway['id'] for gateway in vpc['internet_gateways']],
+        'security_groups': len(vpc['security_groups']),
+        'open_security_groups': sum(1 for group in vpc['security_groups'] if group['open_to_world']),
+    }
+
+
+def find_vpc(topology: Dict, vpc_id: str) -> Optional[Dict]:
+    """One VPC with its members and the relationships among them."""
+    for vpc in topology['vpcs']:
+        if vpc['id'] == vpc_id:
+            members = {vpc_id}
+            for collection in ('subnets', 'instances', 'network_interfaces', 'route_tables',
+                               'internet_gateways', 'security_groups'):
+                members.update(item['id'] for item in vpc[collection])
+            return dict(vpc, edges=[edge for edge in topology['edges'] if edge[0] in members])
+    return None
+
+
+def topology_context(topology: Dict) -> str:
+    """Prompt context: one line per VPC."""
+    lines = []
+    for vpc in map(vpc_summary, topology['vpcs']):
+        line = (f"- {vpc['id']}" + (f" ({vpc['name']})" if vpc['name'] else "")
+                + f" in {vpc['region']}, {vpc['cidr']}{', default' if vpc['is_default'] else ''}: "
+                + f"{vpc['subnets']} subnets ({vpc['public_subnets']} public), {vpc['instances']} instances, "
+                + f"{vpc['network_interfaces']} network interfaces, {vpc['security_groups']} security groups")
+        if vpc['open_security_groups']:
+            line += f" ({vpc['open_security_groups']} open to 0.0.0.0/0)"
+        lines.append(line)
+    return "VPCs:\n" + "\n".join(lines) if lines else "VPCs: none found"
+
+
+def diagram_input(topology: Dict) -> Tuple[List[Tuple[str, Optional[str], List[Dict]]], Dict[str, str]]:
+    """
+    VPCs and their instances as ``(arn, name, tags)`` resources for the diagram layout,
+    and each instance's VPC by ARN.
+    """
+    resources, parents = [], {}
+    for vpc in topology['vpcs']:
+        resources.append((vpc['arn'], vpc['name'] or vpc['id'], []))
+        for instance in vpc['instances']:
+            resources.append((instance['arn'], instance['name'] or instance['id'], []))
+            parents[instance['arn']] = vpc['arn']
+    return resources, parents
+
+
+def _pages(client, operation: str, key: str) -> Iterator[Dict]:
+    for page in client.get_paginator(operation).paginate():
+        yield from page.get(key, [])
+
+
+def _route_target(route: Dict) -> Optional[str]:
+    for field in ('GatewayId', 'NatGatewayId', 'TransitGatewayId', 'VpcPeeringConnectionId',
+                  'NetworkInterfaceId', 'InstanceId', 'EgressOnlyInternetGatewayId'):
+        if route.get(field):
+            return route[field]
+    return None
+
+
+def _name(item: Dict) -> Optional[str]:
+    for tag in item.get('Tags', []):
+        if tag.get('Key') == 'Name':
+            return tag.get('Value')
+    return None
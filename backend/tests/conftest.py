@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# database.py connects on import; point it at a throwaway SQLite file first
+_db_dir = tempfile.mkdtemp(prefix="tcat-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("OPENAI_API_KEY", "testing")
+
+import pytest
+
+from database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,42 @@
+from routers import advisor
+from services import advisor_history
+
+
+def check(status, flagged):
+    return {
+        'id': 'c1',
+        'name': 'Idle instances',
+        'description': 'Idle EC2 instances',
+        'category': 'cost_optimizing',
+        'status': status,
+        'timestamp': f'2025-03-0{len(flagged) + 1}T00:00:00Z',
+        'resourcesSummary': {'resourcesFlagged': len(flagged)},
+        'estimatedMonthlySavings': 10.0 * len(flagged),
+        'flaggedResources': [
+            {'resourceId': resource_id, 'region': 'us-east-1', 'status': status, 'metadata': [resource_id]}
+            for resource_id in flagged
+        ],
+    }
+
+
+def test_check_that_turns_ok_is_recorded(db, monkeypatch):
+    crawls = iter([
+        {'cost_optimizing': [check('warning', ['i-1', 'i-2'])]},
+        {'cost_optimizing': [check('ok', [])]},
+    ])
+    calls = []
+
+    def crawl(previous=None, statuses=None):
+        calls.append(statuses)
+        return next(crawls)
+
+    monkeypatch.setattr(advisor.aws_service, 'get_trusted_advisor_details', crawl)
+
+    assert advisor._refresh_snapshot(db) == {'cost_optimizing': [advisor_history.compact(check('warning', ['i-1', 'i-2']))]}
+    assert [row.status for row in advisor_history.latest_rows(db)] == ['warning']
+    assert len(advisor_history.flagged_resources(db, 'c1')) == 2
+
+    assert advisor._refresh_snapshot(db) == {}
+    assert calls == [None, None]
+    assert [row.status for row in advisor_history.latest_rows(db)] == ['ok']
+    assert advisor_history.flagged_resources(db, 'c1') == []
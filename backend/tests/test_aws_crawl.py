@@ -0,0 +1,61 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_ec2, mock_rds, mock_resourcegroupstaggingapi, mock_s3
+
+from services import aws_clients
+from services.aws_service import AWSService
+
+REGIONS = ['us-east-1', 'eu-west-1']
+# describe_instances pages hold 100 reservations
+INSTANCES_PER_REGION = 120
+AMI = 'ami-12c6146b'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.delenv('AWS_SESSION_TOKEN', raising=False)
+    monkeypatch.setattr(aws_clients.registry, 'endpoint_url', None)
+    aws_clients.registry.clear()
+    with mock_ec2(), mock_rds(), mock_s3(), mock_resourcegroupstaggingapi():
+        for region in REGIONS:
+            ec2 = boto3.client('ec2', region_name=region)
+            for i in range(INSTANCES_PER_REGION):
+                # One reservation each; every tenth is tagged, so the tagging API reports it too
+                tags = [{'ResourceType': 'instance', 'Tags': [{'Key': 'app', 'Value': 'shop'}]}] if i % 10 == 0 else []
+                ec2.run_instances(ImageId=AMI, MinCount=1, MaxCount=1, TagSpecifications=tags)
+            boto3.client('rds', region_name=region).create_db_instance(
+                DBInstanceIdentifier=f'db-{region}', DBInstanceClass='db.t3.micro', Engine='postgres',
+                MasterUsername='admin', MasterUserPassword='password', AllocatedStorage=20,
+            )
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='crawl-bucket')
+        yield AWSService(region_name='us-east-1')
+    aws_clients.registry.clear()
+
+
+def test_crawl_merges_regions_and_pages(aws):
+    resources = aws.get_resources_by_tag(regions=REGIONS)
+
+    assert len(resources['ec2']) == INSTANCES_PER_REGION * len(REGIONS)
+    assert len(resources['rds']) == len(REGIONS)
+    assert [bucket['name'] for bucket in resources['s3']] == ['crawl-bucket']
+    arns = [item['arn'] for items in resources.values() for item in items]
+    assert len(arns) == len(set(arns))
+    assert {arn.split(':')[3] for arn in arns if arn.startswith('arn:aws:ec2')} == set(REGIONS)
+
+
+def test_unreadable_region_is_skipped(aws, monkeypatch):
+    crawl_rds = AWSService._crawl_rds_instances
+
+    def denied_in_eu(self, client, region):
+        if region == 'eu-west-1':
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'denied'}}, 'DescribeDBInstances')
+        return crawl_rds(self, client, region)
+
+    monkeypatch.setattr(AWSService, '_crawl_rds_instances', denied_in_eu)
+    resources = aws.get_resources_by_tag(regions=REGIONS)
+
+    assert [item['name'] for item in resources['rds']] == ['db-us-east-1']
+    assert len(resources['ec2']) == INSTANCES_PER_REGION * len(REGIONS)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from database import CostQueryCacheEntry
+from services.cost_cache import CostQueryCache
+
+
+class FakeCostExplorer:
+    """Answers every query with one $1 group and counts the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_cost_and_usage(self, start_date, end_date, granularity='MONTHLY', group_by=None, metrics=None):
+        self.calls.append((start_date, end_date, granularity, tuple(group_by)))
+        return {
+            'ResultsByTime': [{
+                'TimePeriod': {'Start': start_date, 'End': end_date},
+                'Groups': [{'Keys': ['AmazonEC2'], 'Metrics': {'UnblendedCost': {'Amount': '1', 'Unit': 'USD'}}}],
+            }],
+            'ResponseMetadata': {'RequestId': 'fake'},
+        }
+
+
+def days_ago(days):
+    return (datetime.utcnow().date() - timedelta(days=days)).isoformat()
+
+
+def test_repeat_query_is_served_from_memory(db):
+    cache, aws = CostQueryCache(), FakeCostExplorer()
+
+    first = cache.get_cost_and_usage('2025-01-01', '2025-02-01', group_by=['service'], aws_service=aws)
+    second = cache.get_cost_and_usage('2025-01-01', '2025-02-01', granularity='monthly', aws_service=aws)
+
+    assert second == first
+    assert 'ResponseMetadata' not in first
+    assert len(aws.calls) == 1
+    assert cache.stats() == {'memory_hits': 1, 'db_hits': 0, 'misses': 1, 'hit_ratio': 0.5, 'entries': 1}
+
+
+def test_database_tier_survives_a_cleared_memory_tier(db):
+    aws = FakeCostExplorer()
+    CostQueryCache().get_cost_and_usage('2025-01-01', '2025-02-01', aws_service=aws)
+
+    cache = CostQueryCache()
+    response = cache.get_cost_and_usage('2025-01-01', '2025-02-01', aws_service=aws)
+    cache.get_cost_and_usage('2025-01-01', '2025-02-01', aws_service=aws)
+
+    assert response['ResultsByTime'][0]['Groups'][0]['Keys'] == ['AmazonEC2']
+    assert len(aws.calls) == 1
+    stats = cache.stats()
+    assert (stats['db_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
+
+
+def test_windows_aws_may_restate_expire_sooner(db, monkeypatch):
+    monkeypatch.setenv('COST_RESTATEMENT_DAYS', '3')
+    monkeypatch.setenv('COST_CACHE_OPEN_TTL_MINUTES', '60')
+    monkeypatch.setenv('COST_CACHE_CLOSED_TTL_DAYS', '30')
+    cache, aws = CostQueryCache(), FakeCostExplorer()
+
+    assert CostQueryCache.ttl_for(days_ago(2)) == timedelta(minutes=60)
+    assert CostQueryCache.ttl_for(days_ago(10)) == timedelta(days=30)
+
+    cache.get_cost_and_usage(days_ago(30), days_ago(2), aws_service=aws)
+    cache.get_cost_and_usage(days_ago(40), days_ago(10), aws_service=aws)
+    expiries = sorted(entry.expires_at - entry.created_at for entry in db.query(CostQueryCacheEntry))
+    assert timedelta(minutes=59) < expiries[0] <= timedelta(minutes=60)
+    assert timedelta(days=29) < expiries[1] <= timedelta(days=30)
+
+
+def test_least_recently_used_entry_is_evicted(db):
+    cache, aws = CostQueryCache(max_entries=2), FakeCostExplorer()
+    for start in ('2025-01-01', '2025-02-01', '2025-01-01', '2025-03-01'):
+        cache.get_cost_and_usage(start, '2025-04-01', aws_service=aws)
+    assert cache.stats()['entries'] == 2
+
+    # February was evicted from memory but is still in the database; January stayed
+    cache.get_cost_and_usage('2025-02-01', '2025-04-01', aws_service=aws)
+    assert cache.stats()['db_hits'] == 1
+    cache.get_cost_and_usage('2025-03-01', '2025-04-01', aws_service=aws)
+    assert cache.stats()['memory_hits'] == 2
+    assert len(aws.calls) == 3
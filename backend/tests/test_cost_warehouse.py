@@ -0,0 +1,143 @@
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from database import CostEntry
+from services import cost_warehouse
+
+TODAY = date(2025, 3, 6)
+
+
+class FakeCostExplorer:
+    """Two services a day in us-east-1, $1 and $2; the last two days are estimated."""
+
+    def __init__(self, skip_days=()):
+        self.calls = []
+        self.skip_days = set(skip_days)
+
+    def get_cost_and_usage(self, start_date, end_date, granularity='DAILY', group_by=None):
+        self.calls.append((start_date, end_date, tuple(group_by)))
+        day = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        results = []
+        while day < end:
+            if day not in self.skip_days:
+                results.append({
+                    'TimePeriod': {'Start': day.isoformat(), 'End': (day + timedelta(days=1)).isoformat()},
+                    'Estimated': day >= TODAY - timedelta(days=1),
+                    'Groups': [
+                        {'Keys': [service, 'us-east-1'][:len(group_by)],
+                         'Metrics': {'UnblendedCost': {'Amount': str(amount), 'Unit': 'USD'}}}
+                        for service, amount in (('AmazonEC2', 1), ('AmazonS3', 2))
+                    ],
+                })
+            day += timedelta(days=1)
+        return {'ResultsByTime': results}
+
+
+def rows_per_day(db, view='service_region'):
+    return dict(db.query(CostEntry.date, func.count(CostEntry.id)).filter(CostEntry.view == view).group_by(CostEntry.date))
+
+
+def test_backfill_then_incremental_ingest(db, monkeypatch):
+    monkeypatch.setenv('COST_BACKFILL_DAYS', '30')
+    monkeypatch.setenv('COST_RESTATEMENT_DAYS', '3')
+    aws = FakeCostExplorer()
+
+    written = cost_warehouse.ingest_costs(db, aws_service=aws, today=TODAY)
+    assert written['service_region'] == 31 * 2
+    assert aws.calls[0][0] == (TODAY - timedelta(days=30)).isoformat()
+
+    aws.calls.clear()
+    cost_warehouse.ingest_costs(db, aws_service=aws, today=TODAY, force=True)
+    # Only the restatement window (and the estimated days inside it) is fetched again
+    assert aws.calls[0][0] == (TODAY - timedelta(days=3)).isoformat()
+    assert set(rows_per_day(db).values()) == {2}
+    assert len(rows_per_day(db)) == 31
+
+
+def test_ingest_skips_fresh_views(db, monkeypatch):
+    monkeypatch.setenv('COST_BACKFILL_DAYS', '5')
+    aws = FakeCostExplorer()
+    cost_warehouse.ingest_costs(db, aws_service=aws, today=TODAY)
+    aws.calls.clear()
+
+    assert cost_warehouse.ingest_costs(db, aws_service=aws, today=TODAY) == {}
+    assert aws.calls == []
+    assert not cost_warehouse.ingest_due(db)
+
+
+def test_query_rolls_days_up(db, monkeypatch):
+    monkeypatch.setenv('COST_BACKFILL_DAYS', '30')
+    cost_warehouse.ingest_costs(db, aws_service=FakeCostExplorer(), today=TODAY)
+
+    rows = cost_warehouse.query_costs(db, '2025-02-01', '2025-03-01', group_by=['SERVICE'], granularity='MONTHLY')
+    assert rows == [
+        {'start': '2025-02-01', 'end': '2025-03-01', 'SERVICE': 'AmazonEC2', 'amount': 25.0, 'unit': 'USD'},
+        {'start': '2025-02-01', 'end': '2025-03-01', 'SERVICE': 'AmazonS3', 'amount': 50.0, 'unit': 'USD'},
+    ]
+    total = cost_warehouse.query_costs(db, '2025-03-01', '2025-03-03', granularity='TOTAL',
+                                       filters={'region': ['us-east-1']})
+    assert total == [{'start': '2025-03-01', 'end': '2025-03-03', 'amount': 6.0, 'unit': 'USD'}]
+
+
+def test_manual_ingest_joins_the_running_one(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def slow_ingest(db, force=False):
+        runs.append(force)
+        started.set()
+        release.wait(5)
+        return {'service_region': 1}
+
+    monkeypatch.setattr(cost_warehouse, 'ingest_costs', slow_ingest)
+    cost_warehouse.ingest_costs_in_background()
+    assert started.wait(5)
+    assert cost_warehouse.ingest_in_flight()
+
+    manual = cost_warehouse.start_ingest()
+    release.set()
+    assert manual.result(5) == {'service_region': 1}
+    assert runs == [False]
+
+
+def test_forced_ingest_runs_after_a_normal_one(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def slow_ingest(db, force=False):
+        runs.append(force)
+        started.set()
+        release.wait(5)
+        return {'service_region': len(runs)}
+
+    monkeypatch.setattr(cost_warehouse, 'ingest_costs', slow_ingest)
+    cost_warehouse.ingest_costs_in_background()
+    assert started.wait(5)
+
+    forced = [cost_warehouse.start_ingest(force=True) for _ in range(2)]
+    assert forced[0] is forced[1]
+    release.set()
+    assert forced[0].result(5) == {'service_region': 2}
+    assert runs == [False, True]
+
+
+def test_coverage_follows_the_ingested_range(db, monkeypatch):
+    monkeypatch.setenv('COST_BACKFILL_DAYS', '30')
+    # A day without spend has no rows but is still covered
+    cost_warehouse.ingest_costs(db, aws_service=FakeCostExplorer(skip_days={date(2025, 2, 20)}), today=TODAY)
+
+    assert cost_warehouse.is_covered(db, 'service_region', '2025-02-10', '2025-03-07')
+    assert not cost_warehouse.is_covered(db, 'service_region', '2025-02-01', '2025-03-07')
+
+
+def test_gap_between_ingests_is_not_covered(db, monkeypatch):
+    monkeypatch.setenv('COST_BACKFILL_DAYS', '5')
+    cost_warehouse.ingest_costs(db, aws_service=FakeCostExplorer(), today=date(2025, 1, 10))
+    # Weeks later the backfill window no longer reaches the first ingest
+    cost_warehouse.ingest_costs(db, aws_service=FakeCostExplorer(), today=TODAY, force=True)
+
+    assert not cost_warehouse.is_covered(db, 'service_region', '2025-01-06', '2025-03-07')
+    assert cost_warehouse.is_covered(db, 'service_region', '2025-03-01', '2025-03-07')
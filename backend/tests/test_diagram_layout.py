@@ -0,0 +1,29 @@
+from services.diagram_layout import EDGES_PER_LINK, build_graph
+
+
+def tagged(arn, app='main'):
+    return arn, None, [{'Key': 'Project', 'Value': app}]
+
+
+def test_edges_per_link_are_capped_within_a_group():
+    resources = (
+        [tagged(f'arn:aws:ec2:us-east-1:123456789012:instance/i-{i:017x}') for i in range(3000)]
+        + [tagged(f'arn:aws:s3:::bucket-{i}') for i in range(3000)]
+    )
+    nodes, edges = build_graph(resources, 'resource', [('EC2', 'S3')])
+
+    assert len(nodes) == 6000
+    assert len(edges) == EDGES_PER_LINK
+    kinds = {node['id']: node['serviceType'] for node in nodes}
+    assert all((kinds[source], kinds[target]) == ('EC2', 'S3') for source, target in edges)
+
+
+def test_each_group_gets_its_own_edges():
+    resources = [
+        tagged('arn:aws:ec2:us-east-1:123456789012:instance/i-1', 'a'),
+        tagged('arn:aws:s3:::bucket-a', 'a'),
+        tagged('arn:aws:ec2:us-east-1:123456789012:instance/i-2', 'b'),
+        tagged('arn:aws:s3:::bucket-b', 'b'),
+    ]
+    _, edges = build_graph(resources, 'resource', [('EC2', 'S3'), ('EC2', 'S3')])
+    assert len(edges) == 2
@@ -0,0 +1,94 @@
+import jsonpatch
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from database import ArchitectureDiagram, SessionLocal
+from services import diagram_store
+
+BASE = {'nodes': [{'id': 'ec2', 'label': 'EC2'}], 'edges': []}
+
+
+def create(db, data=BASE):
+    diagram = ArchitectureDiagram(name='arch', user_id='u', diagram_data=data)
+    db.add(diagram)
+    db.commit()
+    return diagram
+
+
+def add_node(node_id):
+    return [{'op': 'add', 'path': '/nodes/-', 'value': {'id': node_id, 'label': node_id.upper()}}]
+
+
+def test_patches_are_versioned(db):
+    diagram = create(db)
+
+    data = diagram_store.apply_patch(db, diagram, add_node('rds'), base_version=0)
+    db.commit()
+
+    assert diagram.version == 1
+    assert diagram.node_count == 2
+    assert diagram_store.head(db, diagram) == data
+    assert diagram_store.data_at(db, diagram, 0) == BASE
+    assert diagram_store.etag(diagram) == f'"diagram-{diagram.id}-v1"'
+
+
+def test_save_without_changes_keeps_version(db):
+    diagram = create(db)
+
+    assert diagram_store.save(db, diagram, BASE) is False
+    assert diagram.version == 0
+
+
+def test_stale_base_version_conflicts(db):
+    diagram = create(db)
+    diagram_store.apply_patch(db, diagram, add_node('rds'), base_version=0)
+    db.commit()
+
+    with pytest.raises(diagram_store.VersionConflict) as conflict:
+        diagram_store.apply_patch(db, diagram, add_node('s3'), base_version=0)
+    assert conflict.value.current_version == 1
+
+
+def test_invalid_patch_is_rejected(db):
+    diagram = create(db)
+
+    with pytest.raises(jsonpatch.JsonPatchException):
+        diagram_store.apply_patch(db, diagram, [{'op': 'remove', 'path': '/nodes/5'}], base_version=0)
+
+
+def test_losing_concurrent_writer_does_not_poison_the_head_cache(db, monkeypatch):
+    # No compaction, so the loser writes nothing before its commit
+    monkeypatch.setattr(diagram_store, 'COMPACT_RATIO', 100)
+    diagram_id = create(db).id
+    winner, loser = SessionLocal(), SessionLocal()
+    try:
+        winner_diagram = winner.query(ArchitectureDiagram).get(diagram_id)
+        loser_diagram = loser.query(ArchitectureDiagram).get(diagram_id)
+
+        won = diagram_store.apply_patch(winner, winner_diagram, add_node('rds'), base_version=0)
+        winner.commit()
+        # Still sees version 0, so it writes version 1 as well
+        diagram_store.apply_patch(loser, loser_diagram, add_node('s3'), base_version=0)
+        with pytest.raises(IntegrityError):
+            loser.commit()
+        loser.rollback()
+    finally:
+        winner.close()
+        loser.close()
+
+    diagram = db.query(ArchitectureDiagram).get(diagram_id)
+    assert diagram.version == 1
+    assert diagram_store.head(db, diagram) == won
+
+
+def test_compaction_keeps_history(db, monkeypatch):
+    monkeypatch.setattr(diagram_store, 'COMPACT_EVERY', 3)
+    diagram = create(db)
+    expected = [BASE]
+    for i in range(7):
+        expected.append(diagram_store.apply_patch(db, diagram, add_node(f'n{i}'), base_version=i))
+        db.commit()
+
+    assert diagram.base_version == 6
+    assert diagram.diagram_data == expected[6]
+    assert [diagram_store.data_at(db, diagram, version) for version in range(8)] == expected
@@ -0,0 +1,30 @@
+from services.inventory_index import InventoryIndex, parse_arn
+
+FULL = "arn:aws:ec2:us-east-1:123456789012:instance/i-0abc"
+NO_ACCOUNT = "arn:aws:ec2:us-east-1::instance/i-0abc"
+
+
+def test_parse_arn():
+    parts = parse_arn("arn:aws:rds:eu-west-1:123456789012:db:orders")
+    assert (parts.service, parts.region, parts.account, parts.resource_id) == ('rds', 'eu-west-1', '123456789012', 'orders')
+
+
+def test_add_merges_sources():
+    index = InventoryIndex()
+    assert index.add('ec2_instances', {'arn': FULL, 'tags': [{'Key': 'env', 'Value': 'prod'}]})
+    assert not index.add('ec2_instances', {'arn': FULL, 'state': 'running'})
+
+    assert len(index) == 1
+    assert index.get(FULL) == {'arn': FULL, 'tags': [{'Key': 'env', 'Value': 'prod'}], 'state': 'running'}
+    assert index.find('ec2', 'i-0abc') == [index.get(FULL)]
+
+
+def test_lookups_match_without_account_like_add():
+    index = InventoryIndex()
+    index.add('ec2_instances', {'arn': NO_ACCOUNT, 'state': 'running'})
+
+    assert index.get(FULL) is index.get(NO_ACCOUNT)
+    assert FULL in index
+    assert "arn:aws:ec2:us-west-2:123456789012:instance/i-0abc" not in index
+    assert "not-an-arn" not in index
+    assert not index.add('ec2_instances', {'arn': FULL})
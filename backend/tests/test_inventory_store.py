@@ -0,0 +1,73 @@
+from database import AWSResource, ResourceTag
+from services.inventory_store import write_snapshot_stream
+
+INSTANCE = "arn:aws:ec2:us-east-1:123456789012:instance/i-{:04d}"
+
+
+def crawl(count=10, state="running"):
+    """Tagging API pages first, describe_instances pages after, as the crawler yields them."""
+    for i in range(count):
+        yield "ec2_instances", {"arn": INSTANCE.format(i), "tags": [{"Key": "env", "Value": "prod"}]}
+    for i in range(count):
+        yield "ec2_instances", {"arn": INSTANCE.format(i), "id": f"i-{i:04d}", "state": state,
+                                "instance_type": "t3.micro"}
+
+
+def last_updated(db):
+    return dict(db.query(AWSResource.id, AWSResource.last_updated))
+
+
+def test_sources_in_different_batches_are_merged(db):
+    stats = write_snapshot_stream(db, crawl(), batch_size=5)
+
+    assert stats == {"inserted": 10, "updated": 0, "deleted": 0, "unchanged": 0}
+    resource = db.query(AWSResource).get(INSTANCE.format(3))
+    assert resource.data["state"] == "running"
+    assert resource.tags == [{"Key": "env", "Value": "prod"}]
+    assert db.query(ResourceTag).count() == 10
+
+
+def test_second_identical_refresh_writes_nothing(db):
+    write_snapshot_stream(db, crawl(), batch_size=5)
+    before = last_updated(db)
+
+    stats = write_snapshot_stream(db, crawl(), batch_size=5)
+
+    assert stats == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 10}
+    db.expire_all()
+    assert last_updated(db) == before
+
+
+def test_changed_and_removed_resources(db):
+    write_snapshot_stream(db, crawl(), batch_size=5)
+    before = last_updated(db)
+
+    stats = write_snapshot_stream(db, crawl(count=8, state="stopped"), batch_size=5)
+
+    assert stats == {"inserted": 0, "updated": 8, "deleted": 2, "unchanged": 0}
+    db.expire_all()
+    after = last_updated(db)
+    assert len(after) == 8
+    assert all(after[arn] > before[arn] for arn in after)
+    assert db.query(ResourceTag).count() == 8
+
+
+def test_account_less_arn_merges_with_full_arn(db):
+    resources = [
+        ("ec2_instances", {"arn": INSTANCE.format(1), "tags": [{"Key": "team", "Value": "a"}]}),
+        ("ec2_instances", {"arn": "arn:aws:ec2:us-east-1::instance/i-0001", "state": "running"}),
+    ]
+    write_snapshot_stream(db, iter(resources), batch_size=1)
+
+    assert [row.id for row in db.query(AWSResource)] == [INSTANCE.format(1)]
+    assert db.query(AWSResource).get(INSTANCE.format(1)).data["state"] == "running"
+
+
+def test_portable_upsert_without_on_conflict(db, monkeypatch):
+    monkeypatch.setattr(db.get_bind().dialect, 'name', 'mssql')
+    write_snapshot_stream(db, crawl(count=4), batch_size=3)
+
+    stats = write_snapshot_stream(db, crawl(count=4, state="stopped"), batch_size=3)
+
+    assert stats == {"inserted": 0, "updated": 4, "deleted": 0, "unchanged": 0}
+    assert {row.data["state"] for row in db.query(AWSResource)} == {"stopped"}
@@ -0,0 +1,40 @@
+from database import FlaggedResource, TrustedAdvisorCheck
+from services import retrieval_index
+from services.inventory_store import write_snapshot
+from services.retrieval_index import RetrievalIndex, tokenize
+
+INSTANCE = "arn:aws:ec2:us-east-1:123456789012:instance/{}"
+
+
+def test_tokenize():
+    assert tokenize("Which EC2 instances are tagged env=prod?") == ['ec2', 'instance', 'tagged', 'env', 'prod']
+    assert tokenize("access class") == ['access', 'class']
+
+
+def test_bm25_prefers_rare_terms_and_shorter_records():
+    index = RetrievalIndex()
+    for record in ["bucket logs", "bucket logs archive", "bucket web", "instance web prod"]:
+        index.add(record, tokenize(record))
+
+    results = [record for _, record in index.search("prod web bucket", limit=3)]
+    assert results[0] == "instance web prod"
+    assert results[1] == "bucket web"
+    assert [record for _, record in index.search("logs")] == ["bucket logs", "bucket logs archive"]
+    assert index.search("nothing matches") == []
+
+
+def test_flagged_resources_link_to_the_inventory(db):
+    write_snapshot(db, {'ec2_instances': [
+        {'arn': INSTANCE.format('i-0abc'), 'tags': [{'Key': 'env', 'Value': 'prod'}]},
+        {'arn': INSTANCE.format('i-0def'), 'tags': [{'Key': 'env', 'Value': 'dev'}]},
+    ]})
+    db.add(TrustedAdvisorCheck(check_id='c1', name='Low Utilization Amazon EC2 Instances',
+                               category='cost_optimizing', status='warning', result={}, flagged_count=1))
+    db.add(FlaggedResource(check_id='c1', resource_id='r1', region='us-east-1', status='warning',
+                           resource_metadata=['us-east-1a', 'i-0abc', 'web']))
+    db.commit()
+
+    context = retrieval_index.retrieval_context(db, "underutilized prod instances flagged")
+    first = context.split("\n")[0]
+    assert first.startswith("- flagged by 'Low Utilization Amazon EC2 Instances'")
+    assert INSTANCE.format('i-0abc') in first and "env=prod" in first
@@ -0,0 +1,44 @@
+import threading
+
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def crawl():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'crawled'
+
+    first = flights.run('inventory', crawl)
+    assert started.wait(5)
+    second = flights.run('inventory', crawl)
+    assert second is first
+    assert flights.in_flight('inventory')
+
+    release.set()
+    assert first.result(5) == second.result(5) == 'crawled'
+    assert calls == [1]
+
+
+def test_key_is_released_after_the_call():
+    flights = SingleFlight()
+
+    assert flights.run('advisor', lambda: 1).result(5) == 1
+    assert flights.run('advisor', lambda: 2).result(5) == 2
+    assert not flights.in_flight('advisor')
+
+
+def test_failures_reach_every_caller_and_release_the_key():
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError('throttled')
+
+    future = flights.run('checks', fail)
+    assert isinstance(future.exception(5), RuntimeError)
+    assert flights.run('checks', lambda: 'retried').result(5) == 'retried'
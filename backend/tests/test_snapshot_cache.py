@@ -0,0 +1,61 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from services.single_flight import single_flight
+from services.snapshot_cache import SnapshotCache
+
+
+class Dataset:
+    """A stored snapshot that counts how often it is read whole."""
+
+    def __init__(self, age=None):
+        self.updated = datetime.utcnow() - age if age is not None else None
+        self.reads = 0
+        self.refreshes = 0
+
+    def read(self, db):
+        self.reads += 1
+        return ({'items': [1, 2, 3]}, self.updated) if self.updated else None
+
+    def refresh(self, db):
+        self.refreshes += 1
+        self.updated = datetime.utcnow()
+
+    def updated_at(self, db):
+        return self.updated
+
+
+def cache(dataset, name):
+    return SnapshotCache(name, read=dataset.read, refresh=dataset.refresh, soft_ttl=timedelta(hours=1),
+                         hard_ttl=timedelta(days=1), updated_at=dataset.updated_at)
+
+
+def test_ensure_fresh_never_reads_the_data(db):
+    dataset = Dataset()
+
+    assert asyncio.run(cache(dataset, 'missing').ensure_fresh(db)) == ("aws", False)
+    assert asyncio.run(cache(dataset, 'missing').ensure_fresh(db)) == ("database", False)
+    assert dataset.refreshes == 1
+    assert dataset.reads == 0
+
+
+def test_stale_snapshot_refreshes_in_background_without_reading(db):
+    dataset = Dataset(age=timedelta(hours=2))
+    snapshots = cache(dataset, 'stale')
+
+    assert asyncio.run(snapshots.ensure_fresh(db)) == ("database", True)
+    deadline = time.monotonic() + 5
+    while single_flight.in_flight('stale') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert dataset.refreshes == 1
+    assert asyncio.run(snapshots.ensure_fresh(db)) == ("database", False)
+    assert dataset.reads == 0
+
+
+def test_get_reads_back_data_the_refresh_did_not_return(db):
+    dataset = Dataset()
+
+    data, source, stale = asyncio.run(cache(dataset, 'inline').get(db))
+    assert (data, source, stale) == ({'items': [1, 2, 3]}, "aws", False)
+    assert dataset.reads == 2
@@ -0,0 +1,49 @@
+import pytest
+
+from database import AWSResource
+from services import tag_query
+from services.inventory_store import write_snapshot
+
+BUCKET = "arn:aws:s3:::{}"
+
+
+@pytest.fixture
+def inventory(db):
+    write_snapshot(db, {'s3_buckets': [
+        {'arn': BUCKET.format('web'), 'tags': [{'Key': 'env', 'Value': 'prod'}, {'Key': 'owner', 'Value': 'ana'}]},
+        {'arn': BUCKET.format('batch'), 'tags': [{'Key': 'env', 'Value': 'prod'}]},
+        {'arn': BUCKET.format('sandbox'), 'tags': [{'Key': 'env', 'Value': 'dev'},
+                                                   {'Key': 'cost center', 'Value': 'r&d'}]},
+        {'arn': BUCKET.format('stack'), 'tags': [{'Key': 'aws:cloudformation:stack-name', 'Value': 'core'}]},
+        {'arn': BUCKET.format('orphan'), 'tags': []},
+    ]})
+    return db
+
+
+def matching(db, query):
+    return sorted(arn.rsplit(':', 1)[-1] for arn, in db.query(AWSResource.id).filter(tag_query.parse(query)))
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('env=prod', ['batch', 'web']),
+    ('env!=prod', ['orphan', 'sandbox', 'stack']),
+    ('owner', ['web']),
+    ('owner=*', ['web']),
+    ('NOT owner', ['batch', 'orphan', 'sandbox', 'stack']),
+    ('owner!=*', ['batch', 'orphan', 'sandbox', 'stack']),
+    ('untagged', ['orphan']),
+    ('env=prod AND NOT owner', ['batch']),
+    ('env=dev OR owner=ana AND env=prod', ['sandbox', 'web']),
+    ('(env=dev OR owner=ana) AND env=prod', ['web']),
+    ('"cost center"="r&d"', ['sandbox']),
+    ('aws:cloudformation:stack-name=core', ['stack']),
+    ('env=prod and not owner', ['batch']),
+])
+def test_expressions(inventory, query, expected):
+    assert matching(inventory, query) == expected
+
+
+@pytest.mark.parametrize('query', ['', '   ', 'env=prod AND', '(env=prod', 'env=prod)', 'AND env=prod', 'env="prod'])
+def test_invalid_expressions(query):
+    with pytest.raises(tag_query.TagQueryError):
+        tag_query.parse(query)
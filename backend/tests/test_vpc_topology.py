@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from database import VpcTopology
+from services import vpc_topology
+
+
+def region_topology(region, vpc_ids):
+    return {'vpcs': [{'id': vpc_id, 'arn': f'arn:aws:ec2:{region}::vpc/{vpc_id}', 'region': region, 'name': None,
+                      'instances': []} for vpc_id in vpc_ids],
+            'edges': []}
+
+
+def crawl(monkeypatch, regions, results):
+    monkeypatch.setattr(vpc_topology, 'crawl_regions', lambda all_regions=None: regions)
+    monkeypatch.setattr(vpc_topology, 'collect', lambda regions=None: {
+        region: results[region] for region in regions if region in results
+    })
+
+
+def test_regions_no_longer_crawled_are_dropped(db, monkeypatch):
+    crawl(monkeypatch, ['us-east-1', 'eu-west-1'], {
+        'us-east-1': region_topology('us-east-1', ['vpc-1']),
+        'eu-west-1': region_topology('eu-west-1', ['vpc-2']),
+    })
+    vpc_topology.refresh_topology(db)
+
+    crawl(monkeypatch, ['us-east-1'], {'us-east-1': region_topology('us-east-1', ['vpc-3'])})
+    topology = vpc_topology.refresh_topology(db)
+
+    assert topology['regions'] == ['us-east-1']
+    assert [vpc['id'] for vpc in topology['vpcs']] == ['vpc-3']
+    assert db.query(VpcTopology).count() == 1
+
+
+def test_failed_region_keeps_its_topology_and_time(db, monkeypatch):
+    old = datetime.utcnow() - timedelta(days=2)
+    db.add(VpcTopology(region='eu-west-1', data=region_topology('eu-west-1', ['vpc-2']), vpc_count=1, collected_at=old))
+    db.commit()
+
+    crawl(monkeypatch, ['us-east-1', 'eu-west-1'], {'us-east-1': region_topology('us-east-1', ['vpc-1'])})
+    vpc_topology.refresh_topology(db)
+    topology, collected_at = vpc_topology.read_topology(db)
+
+    assert sorted(vpc['id'] for vpc in topology['vpcs']) == ['vpc-1', 'vpc-2']
+    assert collected_at > old
+    assert topology['regions_collected_at']['eu-west-1'] == old.isoformat()
@@ -20,7 +20,7 @@ import DeleteIcon from '@mui/icons-material/Delete';
 import AutoFixHighIcon from '@mui/icons-material/AutoFixHigh'; // Add this import for the magic wand icon
 import ServicePalette from './ServicePalette';
 import AwsServiceNode from './AwsServiceNode';
-import { saveDiagramToServer, getDiagramsFromServer, getDiagramById, deleteDiagram, DiagramResponse, generateDiagram } from '../../services/diagram-service';
+import { saveDiagramToServer, getDiagramsFromServer, getDiagramById, deleteDiagram, DiagramSummary, generateDiagram } from '../../services/diagram-service';
 
 const nodeTypes: NodeTypes = {
   awsService: AwsServiceNode,
@@ -40,7 +40,7 @@ const ArchitectureDiagram: React.FC = () => {
   
   // New state variables for server integration
   const [loading, setLoading] = useState(false);
-  const [serverDiagrams, setServerDiagrams] = useState<DiagramResponse[]>([]);
+  const [serverDiagrams, setServerDiagrams] = useState<DiagramSummary[]>([]);
   const [selectedServerDiagram, setSelectedServerDiagram] = useState<number | null>(null);
   const [snackbar, setSnackbar] = useState<{open: boolean, message: string, severity: 'success' | 'error'}>({
     open: false,
@@ -113,19 +113,26 @@ function Analyzer() {
     console.log("Starting analysis...");
     try {
       // Step 1: Analyze Errors
-      const errorItems = checks
+      const flaggedChecks = checks
         .filter(check => {
           console.log("Check status:", check.status, typeof check.status);
           const status = String(check.status).toLowerCase();
           return status.includes('error') || status.includes('warning');
-        })
-        .map(check => ({
+        });
+
+      // Flagged resources are paginated per check; the first page is enough for the analysis
+      const errorItems = await Promise.all(flaggedChecks.map(async check => {
+        const flagged = await axios.get(`http://localhost:8000/api/checks/${check.id}/flagged`, {
+          params: { limit: 50 }
+        });
+        return {
           checkName: check.name,
           category: check.category,
           resources: check.result.resourcesSummary || {},
-          details: check.result.flaggedResources || [],
+          details: flagged.data.data || [],
           timestamp: check.lastUpdated
-        }));
+        };
+      }));
 
       console.log("Filtered error items:", errorItems);
       setErrorAnalysis(errorItems);
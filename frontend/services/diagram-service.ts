@@ -11,10 +11,26 @@ export interface DiagramResponse {
   name: string;
   user_id: string;
   diagram_data: DiagramData;
+  version: number;
   created_at: string;
   updated_at: string;
 }
 
+export interface DiagramSummary {
+  id: number;
+  name: string;
+  node_count: number | null;
+  edge_count: number | null;
+  size_bytes: number | null;
+  created_at: string;
+  updated_at: string;
+}
+
+interface DiagramListResponse {
+  items: DiagramSummary[];
+  next_cursor: string | null;
+}
+
 export const saveDiagramToServer = async (name: string, diagramData: DiagramData): Promise<DiagramResponse> => {
   const response = await api.post('/diagrams/save', {
     name,
@@ -24,9 +40,18 @@ export const saveDiagramToServer = async (name: string, diagramData: DiagramData
   return response.data;
 };
 
-export const getDiagramsFromServer = async (): Promise<DiagramResponse[]> => {
-  const response = await api.get('/diagrams/list/anonymous');
-  return response.data;
+// The listing carries no diagram_data; open a diagram with getDiagramById
+export const getDiagramsFromServer = async (): Promise<DiagramSummary[]> => {
+  const diagrams: DiagramSummary[] = [];
+  let cursor: string | null = null;
+  do {
+    const response = await api.get<DiagramListResponse>('/diagrams/list/anonymous', {
+      params: cursor ? { cursor } : {}
+    });
+    diagrams.push(...response.data.items);
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return diagrams;
 };
 
 export const getDiagramById = async (id: number): Promise<DiagramResponse> => {